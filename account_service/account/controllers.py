@@ -1,26 +1,38 @@
-from copy import deepcopy
+from collections import defaultdict
+from datetime import date
 from decimal import Decimal
 from logging import getLogger
-from typing import Dict
+from typing import Dict, Iterable, List, Tuple
+from uuid import UUID
 
+from common_lib.codec import parse_event_day
+from common_lib.company import CompanyIdentityCache, load_company_identity
 from common_lib.cud_event_manager import CUDEvent, EventManager, FailedEventManager, ServiceName
-from common_lib.rabbit import RabbitMQPublisher
+from common_lib.outbox.outbox import Outbox
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 
 from account import models
-from account.models import Account, AccountUser, Task, TransactionType
+from account.models import Account, AccountUser, DailyAccountRollup, Task, TransactionType
 
 
 logger = getLogger(__name__)
 
+# keeps bulk queries under sqlite's query variables limit
+BULK_BATCH_SIZE = 500
+
 failed_event_manager = FailedEventManager.build(
     mongo_dsn=settings.MONGO_DSN,
     db_name=settings.MONGO_DB_NAME,
     error_collection_name=settings.MONGO_ERROR_COLLECTION,
 )
 event_manager = EventManager(
-    mq_publisher=RabbitMQPublisher(exchange_name=settings.BILLING_EXCHANGE_NAME, dsn=settings.RABBITMQ_DSN),
+    mq_publisher=None,
+    # task events produce 2 billing events per task: they're bulk inserted to outbox in handler's transaction
+    # and published in batches by `relay_outbox_events` command
+    outbox=Outbox(exchange_name=settings.BILLING_EXCHANGE_NAME, batch_size=BULK_BATCH_SIZE),
     schema_basedir=settings.EVENT_SCHEMA_DIR,
     service_name=ServiceName.ACCOUNT_SERVICE,
     failed_event_manager=failed_event_manager,
@@ -28,176 +40,302 @@ event_manager = EventManager(
 )
 
 
-def send_account_change_event(event_manager, public_id, amount):
-    event_manager.send_event(
-        event=CUDEvent(
-            data={"public_id": public_id, "amount": float(amount)},
-            producer="account_service",
-            event_name="billing_account_changed",
-        )
+def send_account_change_events(event_manager, account_changes: List[Tuple[UUID, Decimal]]):
+    event_manager.send_events(
+        [
+            CUDEvent(
+                data={"public_id": public_id, "amount": float(amount)},
+                producer="account_service",
+                event_name="billing_account_changed",
+            )
+            for public_id, amount in account_changes
+        ]
     )
 
 
+def to_amount(value) -> Decimal:
+    """Rounds money value the same way `Account.amount` field does on save"""
+    return Decimal(value).quantize(Decimal("0.01"))
+
+
+def get_accounts_by_user_public_ids(public_ids: Iterable[str]) -> Dict[str, Account]:
+    """Reads accounts of given users with single query, raises the same errors as `Account.objects.get` does"""
+    public_ids = set(public_ids)
+    accounts = {}
+    for account in Account.objects.filter(user__public_id__in=public_ids).select_related("user"):
+        if account.user.public_id in accounts:
+            raise Account.MultipleObjectsReturned(f"more than one account for {account.user.public_id=}")
+        accounts[account.user.public_id] = account
+
+    missing_public_ids = public_ids - set(accounts)
+    if missing_public_ids:
+        raise Account.DoesNotExist(f"no accounts for {missing_public_ids=}")
+    return accounts
+
+
+def get_users_by_public_ids(public_ids: Iterable[str]) -> Dict[str, AccountUser]:
+    """Reads users with single query, raises the same errors as `AccountUser.objects.get` does"""
+    public_ids = set(public_ids)
+    users = {}
+    for user in AccountUser.objects.filter(public_id__in=public_ids):
+        if user.public_id in users:
+            raise AccountUser.MultipleObjectsReturned(f"more than one user for {user.public_id=}")
+        users[user.public_id] = user
+
+    missing_public_ids = public_ids - set(users)
+    if missing_public_ids:
+        raise AccountUser.DoesNotExist(f"no users for {missing_public_ids=}")
+    return users
+
+
+def apply_balance_deltas(balance_deltas: Dict[Tuple[int, date], Decimal]):
+    """Applies balance changes aggregated per (account, event day)
+
+    Balance is updated once per account, rollups are updated for the day the events happened at,
+    so delayed or replayed events are counted for their own day rather than for the processing day.
+    """
+    now = timezone.now()
+    balance_deltas = {key: to_amount(delta) for key, delta in balance_deltas.items()}
+    balance_deltas = {key: delta for key, delta in balance_deltas.items() if delta}
+    account_deltas = defaultdict(Decimal)
+    for (account_id, _), delta in balance_deltas.items():
+        account_deltas[account_id] += delta
+    # the same update order in all transactions prevents deadlocks between concurrent consumers
+    for account_id, delta in sorted(account_deltas.items()):
+        if delta:
+            Account.objects.filter(id=account_id).update(amount=F("amount") + delta, updated_at=now)
+    update_daily_rollups(dict(sorted(balance_deltas.items())))
+
+
+def update_daily_rollups(balance_deltas: Dict[Tuple[int, date], Decimal]):
+    """Adds balance changes to (account, day) rollups, creates missing rollups first"""
+    if not balance_deltas:
+        return
+
+    days = {day for _, day in balance_deltas}
+    account_ids = {account_id for account_id, _ in balance_deltas}
+    existing_keys = set(
+        DailyAccountRollup.objects.filter(day__in=days, account_id__in=account_ids).values_list("account_id", "day")
+    )
+    DailyAccountRollup.objects.bulk_create(
+        [
+            DailyAccountRollup(account_id=account_id, day=day)
+            for account_id, day in balance_deltas.keys() - existing_keys
+        ],
+        ignore_conflicts=True,
+    )
+    for (account_id, day), delta in balance_deltas.items():
+        changes = {"income": F("income") + delta} if delta > 0 else {"outcome": F("outcome") - delta}
+        DailyAccountRollup.objects.filter(account_id=account_id, day=day).update(**changes, updated_at=timezone.now())
+
+
 def handle_task_created(event: Dict):
-    """Handles task creation event
+    """Handles task creation event"""
+    handle_task_created_batch([event])
 
-    steps:
+
+def handle_task_created_batch(events: List[Dict]):
+    """Handles task creation events in single transaction
+
+    steps(for each event):
         - creates in transaction for company
         - creates out transaction for task's assignee
         - creates task record in db
+
+    Balance changes are aggregated per account and applied once per account.
     """
+    account_changes = []
     with transaction.atomic():
-        company_user = get_company_user()
-        company_account = company_user.account_set.first()
-        assignee_account = Account.objects.get(user__public_id=event["data"]["assignee"])
-
-        company_income = abs(event["data"]["fee_on_assign"])
-        company_account.amount += Decimal(company_income)
-        company_account.save()
-
-        assignee_account.amount -= Decimal(company_income)
-        assignee_account.save()
-
-        task_title = event["data"]["title"]
-        trx_outcome = {
-            "public_id": event["data"]["id"],
-            "amount": event["data"]["fee_on_assign"],
-            "type": TransactionType.OUTCOME.value,
-            "description": f"task `{task_title}` assign fee",
-            "source_account_id": assignee_account,
-            "target_account_id": company_account,
-        }
-
-        trx_income = deepcopy(trx_outcome)
-        trx_income["type"] = TransactionType.INCOME.value
-        trx_income["source_account_id"] = company_account
-        trx_income["target_account_id"] = assignee_account
-
-        task_info = {
-            "public_id": event["data"]["id"],
-            "title": event["data"]["title"],
-            "status": event["data"]["status"],
-            "description": event["data"]["description"],
-            "assignee": assignee_account.user,
-            "fee_on_assign": event["data"]["fee_on_assign"],
-            "fee_on_complete": event["data"]["fee_on_complete"],
-        }
-        trx_out = models.AccountTransaction(**trx_outcome)
-        trx_out.save()
-
-        trx_in = models.AccountTransaction(**trx_income)
-        trx_in.save()
-
-        task = Task.objects.create(**task_info)
-        task.save()
-
-    send_account_change_event(event_manager, company_account.public_id, company_income)
-    send_account_change_event(event_manager, assignee_account.public_id, -company_income)
+        company = company_identity.get()
+        assignee_accounts = get_accounts_by_user_public_ids(event["data"]["assignee"] for event in events)
+
+        balance_deltas = defaultdict(Decimal)
+        transactions_to_insert = []
+        tasks_to_insert = []
+        for event in events:
+            assignee_account = assignee_accounts[event["data"]["assignee"]]
+            company_income = abs(event["data"]["fee_on_assign"])
+            day = parse_event_day(event["event_time"])
+            balance_deltas[company.account_id, day] += to_amount(company_income)
+            balance_deltas[assignee_account.id, day] -= to_amount(company_income)
+
+            task_title = event["data"]["title"]
+            trx_outcome = {
+                "public_id": event["data"]["id"],
+                "amount": event["data"]["fee_on_assign"],
+                "type": TransactionType.OUTCOME.value,
+                "description": f"task `{task_title}` assign fee",
+                "source_account_id_id": assignee_account.id,
+                "target_account_id_id": company.account_id,
+            }
+
+            trx_income = dict(trx_outcome)
+            trx_income["type"] = TransactionType.INCOME.value
+            trx_income["source_account_id_id"] = company.account_id
+            trx_income["target_account_id_id"] = assignee_account.id
+
+            task_info = {
+                "public_id": event["data"]["id"],
+                "title": event["data"]["title"],
+                "status": event["data"]["status"],
+                "description": event["data"]["description"],
+                "assignee": assignee_account.user,
+                "fee_on_assign": event["data"]["fee_on_assign"],
+                "fee_on_complete": event["data"]["fee_on_complete"],
+            }
+            transactions_to_insert.append(models.AccountTransaction(**trx_outcome))
+            transactions_to_insert.append(models.AccountTransaction(**trx_income))
+            tasks_to_insert.append(Task(**task_info))
+
+            account_changes.append((company.account_public_id, company_income))
+            account_changes.append((assignee_account.public_id, -company_income))
+
+        models.AccountTransaction.objects.bulk_create(transactions_to_insert)
+        Task.objects.bulk_create(tasks_to_insert)
+        apply_balance_deltas(balance_deltas)
+        send_account_change_events(event_manager, account_changes)
 
 
 def handle_task_completed(event: Dict):
-    """Handles task completion event
+    """Handles task completion event"""
+    handle_task_completed_batch([event])
 
-    steps:
+
+def handle_task_completed_batch(events: List[Dict]):
+    """Handles task completion events in single transaction
+
+    steps(for each event):
         - creates in transaction for task's assignee
         - creates out transaction for company
         - updates task record in db
+
+    Balance changes are aggregated per account and applied once per account.
     """
+    account_changes = []
     with transaction.atomic():
-        company_user = get_company_user()
-        company_account = company_user.account_set.first()
-        task = Task.objects.get(public_id=event["data"]["id"])
+        company = company_identity.get()
 
-        company_income = abs(task.fee_on_complete)
-        assignee_account = task.assignee.account_set.first()
-        company_account.amount -= Decimal(company_income)
-        company_account.save()
+        task_public_ids = {event["data"]["id"] for event in events}
+        tasks = {task.public_id: task for task in Task.objects.filter(public_id__in=task_public_ids)}
+        missing_task_ids = task_public_ids - set(tasks)
+        if missing_task_ids:
+            raise Task.DoesNotExist(f"no tasks for {missing_task_ids=}")
 
-        assignee_account.amount += Decimal(company_income)
-        assignee_account.save()
+        # the same as `task.assignee.account_set.first()` for each task
+        assignee_accounts = {}
+        assignee_ids = {task.assignee_id for task in tasks.values()}
+        for account in Account.objects.filter(user_id__in=assignee_ids).order_by("id"):
+            assignee_accounts.setdefault(account.user_id, account)
 
-        trx_outcome = {
-            "amount": task.fee_on_complete,
-            "type": TransactionType.OUTCOME.value,
-            "description": f"task `{task.title}` completion fee",
-            "source_account_id": company_account,
-            "target_account_id": assignee_account,
-        }
+        balance_deltas = defaultdict(Decimal)
+        transactions_to_insert = []
+        for event in events:
+            task = tasks[event["data"]["id"]]
+            assignee_account = assignee_accounts[task.assignee_id]
+            company_income = abs(task.fee_on_complete)
+            day = parse_event_day(event["event_time"])
+            balance_deltas[company.account_id, day] -= to_amount(company_income)
+            balance_deltas[assignee_account.id, day] += to_amount(company_income)
 
-        trx_income = deepcopy(trx_outcome)
-        trx_income["type"] = TransactionType.INCOME.value
-        trx_income["source_account_id"] = assignee_account
-        trx_income["target_account_id"] = company_account
+            trx_outcome = {
+                "amount": task.fee_on_complete,
+                "type": TransactionType.OUTCOME.value,
+                "description": f"task `{task.title}` completion fee",
+                "source_account_id_id": company.account_id,
+                "target_account_id_id": assignee_account.id,
+            }
 
-        trx_out = models.AccountTransaction(**trx_outcome)
-        trx_out.save()
+            trx_income = dict(trx_outcome)
+            trx_income["type"] = TransactionType.INCOME.value
+            trx_income["source_account_id_id"] = assignee_account.id
+            trx_income["target_account_id_id"] = company.account_id
 
-        trx_in = models.AccountTransaction(**trx_income)
-        trx_in.save()
+            transactions_to_insert.append(models.AccountTransaction(**trx_outcome))
+            transactions_to_insert.append(models.AccountTransaction(**trx_income))
 
-        task.status = "completed"
-        task.save()
+            account_changes.append((company.account_public_id, -company_income))
+            account_changes.append((assignee_account.public_id, company_income))
 
-    send_account_change_event(event_manager, company_account.public_id, -company_income)
-    send_account_change_event(event_manager, assignee_account.public_id, company_income)
+        models.AccountTransaction.objects.bulk_create(transactions_to_insert)
+        Task.objects.filter(public_id__in=task_public_ids).update(status="completed", updated_at=timezone.now())
+        apply_balance_deltas(balance_deltas)
+        send_account_change_events(event_manager, account_changes)
 
 
 def handle_tasks_assigned(event: Dict):
-    """Handles task completion event
+    """Handles tasks reshuffle event
 
     steps(for each task):
         - creates in transaction for company
-        - creates out transaction for task's assignee
+        - creates out transaction for task's new assignee
         - updates task record in db
+
+    Tasks, users and accounts are read with few IN queries, balance changes are aggregated per account.
     """
-    # TODO: send event once transaction accepted
+    account_changes = []
     with transaction.atomic():
         shuffled_tasks = event["data"]["tasks"]
-        transactions_to_insert = []
-        company_user = get_company_user()
-        company_account = company_user.account_set.first()
+        company = company_identity.get()
+
+        task_public_ids = {shuffled_task["id"] for shuffled_task in shuffled_tasks}
+        tasks = {task.public_id: task for task in Task.objects.filter(public_id__in=task_public_ids)}
+        missing_task_ids = task_public_ids - set(tasks)
+        if missing_task_ids:
+            raise Task.DoesNotExist(f"no tasks for {missing_task_ids=}")
+
+        assignees = get_users_by_public_ids(shuffled_task["new_assignee"] for shuffled_task in shuffled_tasks)
 
+        # the same as `new_assignee.account_set.first()` for each assignee
+        assignee_accounts = {}
+        assignee_ids = {user.id for user in assignees.values()}
+        for account in Account.objects.filter(user_id__in=assignee_ids).order_by("id"):
+            assignee_accounts.setdefault(account.user_id, account)
+
+        balance_deltas = defaultdict(Decimal)
+        transactions_to_insert = []
+        assignee_task_ids = defaultdict(list)
+        now = timezone.now()
+        day = parse_event_day(event["event_time"])
         for shuffled_task in shuffled_tasks:
-            task = Task.objects.get(public_id=shuffled_task["id"])
-            new_assignee = AccountUser.objects.get(public_id=shuffled_task["new_assignee"])
-            assignee_account = new_assignee.account_set.first()
+            task = tasks[shuffled_task["id"]]
+            new_assignee = assignees[shuffled_task["new_assignee"]]
+            assignee_account = assignee_accounts[new_assignee.id]
             company_income = abs(shuffled_task["fee_on_assign"])
 
-            task.assignee = new_assignee
-            task.save()
+            assignee_task_ids[new_assignee.id].append(task.id)
 
             trx_outcome = {
                 "amount": task.fee_on_assign,
                 "type": TransactionType.OUTCOME.value,
                 "description": f"task `{task.title}` assign fee(due to reshuffle)",
-                "source_account_id": assignee_account,
-                "target_account_id": company_account,
+                "source_account_id_id": assignee_account.id,
+                "target_account_id_id": company.account_id,
             }
 
-            trx_income = deepcopy(trx_outcome)
+            trx_income = dict(trx_outcome)
             trx_income["type"] = TransactionType.INCOME.value
-            trx_income["source_account_id"] = company_account
-            trx_income["target_account_id"] = assignee_account
-
-            trx_out = models.AccountTransaction(**trx_outcome)
-            transactions_to_insert.append(trx_out)
-
-            trx_in = models.AccountTransaction(**trx_income)
-            transactions_to_insert.append(trx_in)
+            trx_income["source_account_id_id"] = company.account_id
+            trx_income["target_account_id_id"] = assignee_account.id
 
-            company_account.amount += Decimal(company_income)
-            assignee_account.amount -= Decimal(company_income)
+            transactions_to_insert.append(models.AccountTransaction(**trx_outcome))
+            transactions_to_insert.append(models.AccountTransaction(**trx_income))
 
-            send_account_change_event(event_manager, company_account.public_id, company_income)
-            send_account_change_event(event_manager, assignee_account.public_id, -company_income)
+            balance_deltas[company.account_id, day] += to_amount(company_income)
+            balance_deltas[assignee_account.id, day] -= to_amount(company_income)
 
-        assignee_account.save()
-        company_account.save()
+            account_changes.append((company.account_public_id, company_income))
+            account_changes.append((assignee_account.public_id, -company_income))
 
-        models.AccountTransaction.objects.bulk_create(transactions_to_insert)
+        # single update per new assignee is much cheaper than CASE WHEN built by `bulk_update`
+        for assignee_id, task_ids in assignee_task_ids.items():
+            Task.objects.filter(id__in=task_ids).update(assignee_id=assignee_id, updated_at=now)
+        models.AccountTransaction.objects.bulk_create(transactions_to_insert, batch_size=BULK_BATCH_SIZE)
+        apply_balance_deltas(balance_deltas)
 
         logger.debug(f"updated tasks {len(shuffled_tasks)}")
         logger.debug(f"added transactions {len(transactions_to_insert)}")
+        logger.debug(f"updated accounts {len(balance_deltas)}")
+        send_account_change_events(event_manager, account_changes)
 
 
 def handle_auth_account_created(event: Dict):
@@ -241,3 +379,37 @@ def handle_auth_account_created(event: Dict):
 
 def get_company_user() -> AccountUser:
     return AccountUser.objects.get(username=settings.COMPANY_SLUG)
+
+
+# the same as `get_company_user().account_set.first()`, but without queries once loaded
+company_identity = CompanyIdentityCache(
+    loader=lambda: load_company_identity(Account, user__username=settings.COMPANY_SLUG)
+)
+
+
+def ensure_company_account() -> Tuple[Account, bool]:
+    """Creates company user and account if they don't exist, returns company account and whether it was created
+
+    Company account creation is published as `billing_account_created` event in the same transaction.
+    """
+    with transaction.atomic():
+        company_user, _ = AccountUser.objects.get_or_create(
+            username=settings.COMPANY_SLUG, role="admin", public_id="1"
+        )
+        # TODO: add uniq const
+        company_account, is_new = Account.objects.get_or_create(user=company_user)
+        if is_new:
+            logger.info(f"created company {company_account=}, {company_user=}")
+            event_manager.send_event(
+                CUDEvent(
+                    data={
+                        "account_public_id": company_account.public_id,
+                        "user_public_id": company_user.public_id,
+                        "role": company_user.role,
+                    },
+                    producer="account_service",
+                    event_name="billing_account_created",
+                )
+            )
+    company_identity.invalidate()
+    return company_account, is_new
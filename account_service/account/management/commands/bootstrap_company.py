@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from account import controllers
+
+
+class Command(BaseCommand):
+    help = "Creates company user and account, does nothing if they already exist"
+
+    def handle(self, *args, **options):
+        company_account, is_new = controllers.ensure_company_account()
+        if is_new:
+            self.stdout.write(self.style.SUCCESS(f"Created company account {company_account.public_id}"))
+        else:
+            self.stdout.write(f"Company account {company_account.public_id} already exists")
@@ -1,9 +1,8 @@
-import json
-import logging
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import close_old_connections
 from common_lib.offset_manager import OffsetLogManager
-from common_lib.rabbit import RabbitMQMultiConsumer, ConsumerConfig
+from common_lib.rabbit import RabbitMQMultiConsumer, ConsumerConfig, single_partition_key
 from common_lib.cud_event_manager import EventManager, FailedEventManager, ServiceName
 from account import controllers
 
@@ -11,6 +10,15 @@ from account import controllers
 class Command(BaseCommand):
     help = "Consumes cud events from common message broker"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Amount of worker threads handling events, events of the same entity are handled in order. "
+            "0 handles events in the message broker connection thread",
+        )
+
     def handle(self, *args, **options):
         task_exchange = settings.TASKS_EXCHANGE_NAME
         task_queue = settings.TASKS_TO_ACCOUNT_QUEUE
@@ -18,29 +26,22 @@ class Command(BaseCommand):
         auth_account_exchange = settings.AUTH_ACCOUNT_EXCHANGE_NAME
         auth_account_queue = settings.AUTH_ACCOUNT_ACCOUNT_QUEUE
 
-        # define rabbit queues to consume from
-        consumers = [
-            ConsumerConfig(queue=task_queue, exchange=task_exchange, callback=self.handle_rabbitmq_message),
-            ConsumerConfig(
-                queue=auth_account_queue, exchange=auth_account_exchange, callback=self.handle_rabbitmq_message
-            ),
-        ]
         event_router = {
             "task_created": controllers.handle_task_created,
             "task_completed": controllers.handle_task_completed,
             "tasks_assigned": controllers.handle_tasks_assigned,
             "account_created": controllers.handle_auth_account_created,
         }
+        batch_event_router = {
+            "task_created": controllers.handle_task_created_batch,
+            "task_completed": controllers.handle_task_completed_batch,
+        }
         self.failed_events_manager = FailedEventManager.build(
             mongo_dsn=settings.MONGO_DSN,
             db_name=settings.MONGO_DB_NAME,
             error_collection_name=settings.MONGO_ERROR_COLLECTION,
         )
         self.service_name = ServiceName.ACCOUNT_SERVICE
-        self.failed_events_manager.process_failed_events_by_consumer(
-            service_name=self.service_name,
-            event_router=event_router,
-        )
         offset_manager = OffsetLogManager.build(
             mongo_dsn=settings.MONGO_DSN,
             db_name=settings.MONGO_DB_NAME,
@@ -49,18 +50,38 @@ class Command(BaseCommand):
         self.event_manager = EventManager(
             mq_publisher=None,
             event_router=event_router,
+            batch_event_router=batch_event_router,
             schema_basedir=settings.EVENT_SCHEMA_DIR,
             service_name=self.service_name,
             failed_event_manager=self.failed_events_manager,
             offset_manager=offset_manager,
+            # long running process doesn't get request signals which recycle db connections
+            before_consume=close_old_connections,
         )
-        self.rmq_client = RabbitMQMultiConsumer(consumers=consumers, dsn=settings.RABBITMQ_DSN)
-        self.rmq_client.listen()
 
-    def handle_rabbitmq_message(self, ch, method, properties, body):
+        # define rabbit queues to consume from
+        consumers = [
+            ConsumerConfig(
+                queue=task_queue,
+                exchange=task_exchange,
+                callback=self.event_manager.handle_message,
+                batch_callback=self.event_manager.handle_messages,
+                # task events must keep their order across tasks, see `single_partition_key`
+                partition_key=single_partition_key,
+            ),
+            ConsumerConfig(
+                queue=auth_account_queue, exchange=auth_account_exchange, callback=self.event_manager.handle_message
+            ),
+        ]
+        self.rmq_client = RabbitMQMultiConsumer(consumers=consumers, dsn=settings.RABBITMQ_DSN, workers=options["workers"])
+        # failed events backlog is replayed alongside live consumption instead of delaying the start
+        self.failed_events_manager.start_background_reprocessing(
+            service_name=self.service_name,
+            event_router=event_router,
+        )
         try:
-            event = json.loads(body)
-            self.event_manager.consume_event(event)
-        except Exception:
-            logging.exception("trace")
-            self.stderr.write(self.style.ERROR(f"Un ack message: {body}"))
+            self.rmq_client.listen()
+        finally:
+            self.failed_events_manager.stop_background_reprocessing()
+            # store offset which wasn't checkpointed yet
+            offset_manager.close()
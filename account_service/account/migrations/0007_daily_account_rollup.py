@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:58
+
+import account.models
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_alter_account_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAccountRollup',
+            fields=[
+                ('id', models.BigIntegerField(default=account.models.get_id, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('public_id', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('day', models.DateField()),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('outcome', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='account.account')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyaccountrollup',
+            constraint=models.UniqueConstraint(fields=('account', 'day'), name='uniq_account_day_rollup'),
+        ),
+    ]
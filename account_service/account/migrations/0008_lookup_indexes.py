@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:14
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_daily_account_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='public_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='accountuser',
+            name='public_id',
+            field=models.CharField(db_index=True, max_length=250),
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['created_at'], name='trx_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['source_account_id', 'created_at'], name='trx_source_created_at_idx'),
+        ),
+    ]
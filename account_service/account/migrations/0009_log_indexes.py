@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0008_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='accounttransaction',
+            name='trx_source_created_at_idx',
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['source_account_id', 'id'], name='trx_source_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['target_account_id', 'id'], name='trx_target_id_idx'),
+        ),
+    ]
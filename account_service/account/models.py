@@ -2,7 +2,7 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
-from typing import Optional
+from typing import Optional, Tuple
 import uuid
 from django.db import models
 from snowflake import SnowflakeGenerator
@@ -19,7 +19,7 @@ class BaseEntity:
 
 
 class AccountUser(User):
-    public_id = models.CharField(max_length=250)
+    public_id = models.CharField(max_length=250, db_index=True)
     role = models.CharField(max_length=250)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -44,6 +44,11 @@ def get_id(id_generator=SnowflakeGenerator(42)) -> int:
     return next(id_generator)
 
 
+def get_id_range(since: datetime, until: datetime) -> Tuple[int, int]:
+    """Bounds of snowflake ids generated in [since, until): id starts with its generation time in ms"""
+    return int(since.timestamp() * 1000) << 22, int(until.timestamp() * 1000) << 22
+
+
 class BaseModel(models.Model):
     id = models.BigIntegerField(primary_key=True, editable=False, default=get_id)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,6 +60,7 @@ class BaseModel(models.Model):
 
 
 class Account(BaseModel):
+    public_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     user = models.ForeignKey(AccountUser, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
 
@@ -67,6 +73,15 @@ class AccountTransaction(BaseModel):
     source_account_id = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="source_account")
     target_account_id = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="target_account")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="trx_created_at_idx"),
+            # transactions logs: today's transactions of the account read in id order, worker log filters
+            # on source account, admin log on target(company) account
+            models.Index(fields=["source_account_id", "id"], name="trx_source_id_idx"),
+            models.Index(fields=["target_account_id", "id"], name="trx_target_id_idx"),
+        ]
+
 
 class Task(BaseModel):
     title = models.CharField(max_length=250)
@@ -76,3 +91,15 @@ class Task(BaseModel):
     fee_on_assign = models.DecimalField(max_digits=15, decimal_places=10)
     fee_on_complete = models.DecimalField(max_digits=15, decimal_places=10)
     public_id = models.BigIntegerField(editable=False, unique=True)
+
+
+class DailyAccountRollup(BaseModel):
+    """Account balance changes aggregated per day, maintained by billing event handlers"""
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    day = models.DateField()
+    income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    outcome = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["account", "day"], name="uniq_account_day_rollup")]
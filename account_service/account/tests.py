@@ -1,3 +1,257 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account import controllers
+from account.models import Account, AccountTransaction, AccountUser, DailyAccountRollup, Task, get_id_range
+from common_lib.outbox.models import OutboxEvent
+from account.views import filter_today_log_records, get_log_records_page
+from common_lib.pagination import InvalidPageParams
+
+
+def create_account(username: str) -> Account:
+    user = AccountUser.objects.create(username=username, public_id=username, role="worker")
+    return Account.objects.create(user=user)
+
+
+class LogRecordsPageTest(TestCase):
+    def setUp(self):
+        self.account = create_account("worker")
+        other_account = create_account("other")
+        for number in range(3):
+            AccountTransaction.objects.create(
+                amount=number,
+                type="income",
+                description=f"trx {number}",
+                source_account_id=self.account,
+                target_account_id=other_account,
+            )
+        # yesterday's transaction isn't in today's log
+        yesterday = timezone.now() - timedelta(days=1)
+        AccountTransaction.objects.create(
+            id=get_id_range(yesterday, yesterday)[0],
+            amount=1,
+            type="income",
+            description="yesterday trx",
+            source_account_id=self.account,
+            target_account_id=other_account,
+        )
+
+    def get_page(self, **params):
+        request = RequestFactory().get("/", params)
+        return get_log_records_page(request, self.account.source_account.all())
+
+    def read_all_pages(self, limit: str):
+        descriptions, cursor = [], None
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            log_records, cursor = self.get_page(**params)
+            descriptions.extend(record["description"] for record in log_records)
+            if cursor is None:
+                return descriptions
+
+    def test_pages_dont_skip_records(self):
+        for limit in ("0", "-1", "1", "2", "1000"):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.read_all_pages(limit), ["trx 0", "trx 1", "trx 2"])
+
+    def test_invalid_params(self):
+        for params in ({"limit": "x"}, {"cursor": "x"}, {"cursor": "-1"}):
+            with self.subTest(params=params), self.assertRaises(InvalidPageParams):
+                self.get_page(**params)
+
+
+@skipUnless(connection.vendor == "sqlite", "query plans are checked on sqlite")
+class LogRecordsQueryPlanTest(TestCase):
+    def setUp(self):
+        self.account = create_account("worker")
+
+    def test_logs_are_read_in_account_id_index_order(self):
+        querysets = {
+            "trx_source_id_idx": self.account.source_account.all(),
+            "trx_target_id_idx": AccountTransaction.objects.filter(target_account_id=self.account.id),
+        }
+        for index_name, queryset in querysets.items():
+            for cursor in (None, 1):
+                with self.subTest(index_name=index_name, cursor=cursor):
+                    plan = filter_today_log_records(queryset, cursor)[:11].explain()
+                    self.assertIn(f"USING INDEX {index_name}", plan)
+                    # page is read in index order, not sorted after reading the whole day
+                    self.assertNotIn("TEMP B-TREE", plan)
+
+
+class DailyRollupsTest(TestCase):
+    def setUp(self):
+        controllers.ensure_company_account()
+        self.worker_account = create_account("worker")
+
+    def test_rollups_are_bucketed_by_event_time(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        event = {
+            "event_id": "1",
+            "event_name": "task_created",
+            "event_time": str(yesterday.replace(tzinfo=None)),
+            "data": {
+                "id": 1,
+                "title": "task",
+                "status": "new",
+                "description": "description",
+                "assignee": "worker",
+                "fee_on_assign": -10.5,
+                "fee_on_complete": 25.0,
+            },
+        }
+
+        controllers.handle_task_created(event)
+
+        rollups = DailyAccountRollup.objects.filter(account=self.worker_account)
+        self.assertEqual([(rollup.day, rollup.outcome) for rollup in rollups], [(yesterday.date(), Decimal("10.50"))])
+        self.worker_account.refresh_from_db()
+        self.assertEqual(self.worker_account.amount, Decimal("-10.50"))
+
+
+class BatchHandlersTest(TestCase):
+    def setUp(self):
+        controllers.ensure_company_account()
+        for username in ("worker 1", "worker 2"):
+            create_account(username)
+
+        yesterday, today = timezone.now() - timedelta(days=1), timezone.now()
+        self.created_events, self.completed_events = [], []
+        for task_id, (assignee, event_time, fee_on_assign, fee_on_complete) in enumerate(
+            [
+                ("worker 1", yesterday, -10.555, 20.125),
+                ("worker 2", yesterday, -12.3, 33.335),
+                ("worker 1", today, -19.999, 21.0),
+                ("worker 1", today, -14.005, 39.994),
+            ],
+            start=1,
+        ):
+            event_time = str(event_time.replace(tzinfo=None))
+            self.created_events.append(
+                {
+                    "event_id": f"created-{task_id}",
+                    "event_name": "task_created",
+                    "event_time": event_time,
+                    "data": {
+                        "id": task_id,
+                        "title": f"task {task_id}",
+                        "status": "new",
+                        "description": "description",
+                        "assignee": assignee,
+                        "fee_on_assign": fee_on_assign,
+                        "fee_on_complete": fee_on_complete,
+                    },
+                }
+            )
+            self.completed_events.append(
+                {"event_id": f"completed-{task_id}", "event_name": "task_completed", "event_time": event_time, "data": {"id": task_id}}
+            )
+
+    def get_state(self) -> dict:
+        """Billing state which doesn't depend on generated ids and timestamps"""
+        return {
+            "balances": sorted(Account.objects.values_list("user__username", "amount")),
+            "transactions": sorted(
+                AccountTransaction.objects.values_list(
+                    "amount", "type", "description", "source_account_id__user__username", "target_account_id__user__username"
+                )
+            ),
+            "rollups": sorted(DailyAccountRollup.objects.values_list("account__user__username", "day", "income", "outcome")),
+            "tasks": sorted(Task.objects.values_list("public_id", "status", "assignee__username")),
+            "account_changes": [
+                (event.body["data"]["public_id"], event.body["data"]["amount"])
+                for event in OutboxEvent.objects.filter(body__event_name="billing_account_changed").order_by("id")
+            ],
+        }
+
+    def apply_and_get_state(self, apply) -> dict:
+        """Applies events and returns resulting state, database is rolled back afterwards"""
+        savepoint_id = transaction.savepoint()
+        apply()
+        state = self.get_state()
+        transaction.savepoint_rollback(savepoint_id)
+        return state
+
+    def test_batches_match_events_applied_one_by_one(self):
+        def apply_one_by_one():
+            for event in self.created_events:
+                controllers.handle_task_created(event)
+            for event in self.completed_events:
+                controllers.handle_task_completed(event)
+
+        def apply_batches():
+            controllers.handle_task_created_batch(self.created_events)
+            controllers.handle_task_completed_batch(self.completed_events)
+
+        expected_state = self.apply_and_get_state(apply_one_by_one)
+        state = self.apply_and_get_state(apply_batches)
+
+        self.assertEqual((len(expected_state["transactions"]), len(expected_state["account_changes"])), (16, 16))
+        self.assertEqual(state, expected_state)
+
+
+class TasksAssignedTest(TestCase):
+    def setUp(self):
+        controllers.ensure_company_account()
+        self.company_account = Account.objects.get(user__username=settings.COMPANY_SLUG)
+        self.workers = [create_account(f"worker {number}") for number in range(2)]
+        self.tasks = [
+            Task.objects.create(
+                public_id=task_id,
+                title=f"task {task_id}",
+                status="new",
+                description="description",
+                assignee=self.workers[0].user,
+                fee_on_assign=-10.555,
+                fee_on_complete=20,
+            )
+            for task_id in range(1, 10)
+        ]
+
+    def build_event(self, tasks) -> dict:
+        return {
+            "event_id": "1",
+            "event_name": "tasks_assigned",
+            "event_time": str(timezone.now().replace(tzinfo=None)),
+            "data": {
+                "tasks": [
+                    {
+                        "id": task.public_id,
+                        "new_assignee": self.workers[number % 2].user.public_id,
+                        "previous_assignee": task.assignee.public_id,
+                        "fee_on_assign": -10.555,
+                        "fee_on_complete": 20,
+                    }
+                    for number, task in enumerate(tasks)
+                ]
+            },
+        }
+
+    def test_query_count_doesnt_depend_on_tasks_count(self):
+        # loads company identity and creates today's rollups
+        controllers.handle_tasks_assigned(self.build_event(self.tasks[:2]))
+
+        with CaptureQueriesContext(connection) as queries:
+            controllers.handle_tasks_assigned(self.build_event(self.tasks[:3]))
+
+        with self.assertNumQueries(len(queries)):
+            controllers.handle_tasks_assigned(self.build_event(self.tasks))
+
+    def test_fees_are_rounded_per_task(self):
+        controllers.handle_tasks_assigned(self.build_event(self.tasks[:4]))
+
+        # each fee is rounded to 10.55 as task_created handler does, float sum would be rounded to 42.22
+        self.company_account.refresh_from_db()
+        self.assertEqual(self.company_account.amount, Decimal("42.20"))
+        self.assertEqual(
+            sorted(Task.objects.filter(public_id__lte=4).values_list("public_id", "assignee__username")),
+            [(1, "worker 0"), (2, "worker 1"), (3, "worker 0"), (4, "worker 1")],
+        )
@@ -1,69 +1,100 @@
 import logging
-from typing import Dict
-from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import QuerySet
 from django.utils import timezone
 from django.http import HttpRequest, JsonResponse
 
 from django.views.decorators.http import require_http_methods
-from account.models import Task
-from account.controllers import get_company_user
+from account.controllers import company_identity
 
-from common_lib.access_control import requires_scope, get_default_session, get_user_info
-from account.models import Account
-from django.db.models import Sum
+from common_lib.access_control import requires_scope, get_user_info_by_token
+from common_lib.pagination import InvalidPageParams, parse_page_params
+from account.models import Account, AccountTransaction, DailyAccountRollup, get_id_range
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_today_rollup(account_id: int) -> Dict:
+    """Provides today's income/outcome of the account from precomputed rollup"""
+    rollup = DailyAccountRollup.objects.filter(account_id=account_id, day=timezone.now().date()).first()
+    income = rollup.income if rollup else Decimal(0)
+    outcome = rollup.outcome if rollup else Decimal(0)
+    return {"income": income, "outcome": outcome, "revenue": income - outcome}
+
+
+def filter_today_log_records(queryset: QuerySet, cursor: Optional[int]) -> QuerySet:
+    """Today's transactions after the cursor ordered by id
+
+    Snowflake ids start with creation time, so today is selected as ids range: page is a range of
+    `trx_*_id_idx` index, the scan stops once the page is read.
+    """
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    min_id, max_id = get_id_range(today, today + timedelta(days=1))
+    queryset = queryset.filter(id__gte=min_id, id__lt=max_id)
+    if cursor:
+        queryset = queryset.filter(id__gt=cursor)
+    return queryset.order_by("id").values("id", "description", "amount", "created_at")
+
+
+def get_log_records_page(request: HttpRequest, queryset: QuerySet, amount_sign: int = 1) -> Tuple[List[Dict], Optional[str]]:
+    """Provides page of today's transactions log using `cursor` and `limit` query params.
+
+    Transactions are ordered by snowflake id, so cursor is id of the last record from previous page.
+    Raises `InvalidPageParams` if query params aren't valid.
+    """
+    cursor, limit = parse_page_params(
+        request.GET, default_limit=settings.LOG_RECORDS_PAGE_SIZE, max_limit=settings.LOG_RECORDS_MAX_PAGE_SIZE
+    )
+
+    page = list(filter_today_log_records(queryset, cursor)[: limit + 1])
+    next_cursor = str(page[limit - 1]["id"]) if len(page) > limit else None
+
+    log_records = []
+    for trx in page[:limit]:
+        log_records.append(
+            {"description": trx["description"], "amount": amount_sign * trx["amount"], "created_at": trx["created_at"]}
+        )
+    return log_records, next_cursor
+
+
 def get_worker_dashboard(request, user: Dict) -> Dict:
     """Provides current account and audit log messages"""
     logger.debug(f"getting worker dashboard, {user=}")
     account = Account.objects.get(user__public_id=user["public_id"])
+    log_records, next_cursor = get_log_records_page(request, account.source_account.all())
 
-    today_min = datetime.combine(timezone.now().date(), datetime.today().time().min)
-    today_max = datetime.combine(timezone.now().date(), datetime.today().time().max)
-    queryset = account.source_account.filter(created_at__range=(today_min, today_max)).order_by("created_at")
-
-    log_records = []
-    for trx in queryset:
-        log_records.append({"description": trx.description, "amount": trx.amount, "created_at": trx.created_at})
-
-    dashboard = {"today_revenue": account.amount, "log_records": log_records}
+    dashboard = {
+        "balance": account.amount,
+        "today_revenue": get_today_rollup(account.id)["revenue"],
+        "log_records": log_records,
+        "next_cursor": next_cursor,
+    }
     return dashboard
 
 
 def get_admin_dashboard(request, user: Dict) -> Dict:
     """Provides daily stats and audit log messages"""
     logger.debug(f"getting admin dashboard, {user=}")
-    today_min = datetime.combine(timezone.now().date(), datetime.today().time().min)
-    today_max = datetime.combine(timezone.now().date(), datetime.today().time().max)
+    company = company_identity.get()
 
     # get today's company account stats
-    # TODO: aggregate per each day
-    stats = (
-        Task.objects.filter(created_at__range=(today_min, today_max))
-        .order_by("created_at")
-        .aggregate(assigned_sum=Sum("fee_on_assign"), completed_sum=Sum("fee_on_complete"))
-    )
-
-    assigned_sum = stats["assigned_sum"] or 0
-    completed_sum = stats["completed_sum"] or 0
-
-    today_revenue = (assigned_sum + completed_sum) * -1
+    today_stats = get_today_rollup(company.account_id)
 
     # get log records for today
-    company_user = get_company_user()
-    account = Account.objects.get(user=company_user)
-    queryset = account.target_account.filter(created_at__range=(today_min, today_max)).order_by("created_at")
-
-    log_records = []
-    for trx in queryset:
-        log_records.append({"description": trx.description, "amount": -trx.amount, "created_at": trx.created_at})
+    log_records, next_cursor = get_log_records_page(
+        request, AccountTransaction.objects.filter(target_account_id=company.account_id), amount_sign=-1
+    )
 
     dashboard = {
-        "today_revenue": today_revenue,
+        "today_revenue": today_stats["revenue"],
+        "today_income": today_stats["income"],
+        "today_outcome": today_stats["outcome"],
         "log_records": log_records,
+        "next_cursor": next_cursor,
     }
     return dashboard
 
@@ -71,14 +102,16 @@ def get_admin_dashboard(request, user: Dict) -> Dict:
 @requires_scope("admin manager worker")
 @require_http_methods(["GET"])
 def get_dashboard(request: HttpRequest):
-    session = get_default_session(token_info={"access_token": request.session["access_token"], "token_type": "Bearer"})
-    user = get_user_info(session)
-    match user["role"]:
-        case "worker":
-            info = get_worker_dashboard(request, user)
-        case "admin" | "manager":
-            info = get_admin_dashboard(request, user)
-        case _:
-            raise ValueError("Unknown role")
+    user = get_user_info_by_token(request.session["access_token"])
+    try:
+        match user["role"]:
+            case "worker":
+                info = get_worker_dashboard(request, user)
+            case "admin" | "manager":
+                info = get_admin_dashboard(request, user)
+            case _:
+                raise ValueError("Unknown role")
+    except InvalidPageParams as e:
+        return JsonResponse({"message": str(e)}, status=400)
 
     return JsonResponse(data=info)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 from pathlib import Path
 import os
 
+from common_lib.db import get_databases, get_sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "account",
+    "common_lib.outbox",
 ]
 
 MIDDLEWARE = [
@@ -74,14 +77,11 @@ WSGI_APPLICATION = "account_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-# TODO: add psql
-SQLITE_DB_PATH = os.environ["SQLITE_DB_PATH"]
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": SQLITE_DB_PATH,
-    }
-}
+# postgres is used once POSTGRES_DB is set, sqlite otherwise, see common_lib/db.py
+DATABASES = get_databases()
+
+# opt-in sqlite profile applied to each new connection, see common_lib/sqlite
+SQLITE_PRAGMAS = get_sqlite_pragmas()
 
 
 # Password validation
@@ -174,6 +174,10 @@ AUTH_ACCOUNT_TASK_QUEUE = "accounts-stream-to-task-service"
 AUTH_ACCOUNT_ACCOUNT_QUEUE = "accounts-stream-to-account-service"
 BILLING_EXCHANGE_NAME = "billing-account-stream"
 TASKS_TO_ACCOUNT_QUEUE = "tasks-stream-to-account-service"
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", 500))
+OUTBOX_RELAY_POLL_INTERVAL = float(os.getenv("OUTBOX_RELAY_POLL_INTERVAL", 0.5))
+LOG_RECORDS_PAGE_SIZE = 100
+LOG_RECORDS_MAX_PAGE_SIZE = 1000
 MONGO_DSN = os.environ["MONGO_DSN"]
 MONGO_DB_NAME = os.environ["MONGO_DB_NAME"]
 MONGO_ERROR_COLLECTION = os.environ["MONGO_ERROR_COLLECTION"]
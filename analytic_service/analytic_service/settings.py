@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 from pathlib import Path
 import os
 
+from common_lib.db import get_databases, get_sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -74,14 +76,11 @@ WSGI_APPLICATION = "analytic_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-# TODO: add psql
-SQLITE_DB_PATH = os.environ["SQLITE_DB_PATH"]
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": SQLITE_DB_PATH,
-    }
-}
+# postgres is used once POSTGRES_DB is set, sqlite otherwise, see common_lib/db.py
+DATABASES = get_databases()
+
+# opt-in sqlite profile applied to each new connection, see common_lib/sqlite
+SQLITE_PRAGMAS = get_sqlite_pragmas()
 
 
 # Password validation
@@ -167,6 +166,8 @@ LOGGING = {
 }
 # main account for money charged from workers during task creation time
 COMPANY_SLUG = "UberPopug Inc."
+# public id of the company user created by account service
+COMPANY_USER_PUBLIC_ID = "1"
 EVENT_SCHEMA_DIR = os.environ.get("EVENT_SCHEMA_DIR", BASE_DIR.parent / "common_lib")
 TASKS_EXCHANGE_NAME = "tasks-stream"
 AUTH_ACCOUNT_EXCHANGE_NAME = "accounts-stream"
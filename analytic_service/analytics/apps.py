@@ -1,6 +1,8 @@
 from logging import getLogger
 from django.apps import AppConfig
 
+from common_lib.sqlite import install_sqlite_profile
+
 
 logger = getLogger(__name__)
 
@@ -8,3 +10,6 @@ logger = getLogger(__name__)
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics'
+
+    def ready(self):
+        install_sqlite_profile()
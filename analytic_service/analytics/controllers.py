@@ -1,8 +1,15 @@
+from collections import defaultdict
+from datetime import date
 from decimal import Decimal
 from logging import getLogger
-from typing import Dict
-from analytics.models import Account, AccountUser
+from typing import Dict, Iterable, List
+from analytics.models import Account, AccountUser, DailyStats
+from common_lib.codec import parse_event_day
+from common_lib.company import CompanyIdentityCache, load_company_identity
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from analytics.models import Task
 
@@ -10,6 +17,11 @@ from analytics.models import Task
 logger = getLogger(__name__)
 
 
+company_identity = CompanyIdentityCache(
+    loader=lambda: load_company_identity(Account, user__public_id=settings.COMPANY_USER_PUBLIC_ID)
+)
+
+
 def handle_task_created(event: Dict = 1):
     """Handles task creation event"""
     with transaction.atomic():
@@ -24,13 +36,26 @@ def handle_task_created(event: Dict = 1):
         task.save()
 
 
+def ensure_daily_stats(days: Iterable[date]):
+    """Creates missing per day stats rows, rows created by concurrent consumers are left as is"""
+    days = set(days)
+    existing_days = set(DailyStats.objects.filter(day__in=days).values_list("day", flat=True))
+    DailyStats.objects.bulk_create([DailyStats(day=day) for day in days - existing_days], ignore_conflicts=True)
+
+
 def handle_task_completed(event: Dict):
-    """Handles task completion event"""
+    """Handles task completion event, updates top task of the day the task was completed at"""
     with transaction.atomic():
         task = Task.objects.get(public_id=event["data"]["id"])
         task.status = "completed"
         task.save()
-        
+
+        day = parse_event_day(event["event_time"])
+        ensure_daily_stats([day])
+        DailyStats.objects.filter(
+            Q(top_task_fee__isnull=True) | Q(top_task_fee__lt=task.fee_on_complete), day=day
+        ).update(top_task_fee=task.fee_on_complete, top_task_public_id=task.public_id, updated_at=timezone.now())
+
 
 def handle_auth_account_created(event: Dict):
     """Handles system(global user) account creation event"""
@@ -46,11 +71,49 @@ def handle_auth_account_created(event: Dict):
             logger.info(f"added new {user=}")
 
 
+def to_amount(value) -> Decimal:
+    """Rounds money value the same way `Account.amount` field does on save"""
+    return Decimal(value).quantize(Decimal("0.01"))
+
+
 def handle_billing_account_changed(event: Dict):
-    """Handles user's account(financial) change event"""
-    account = Account.objects.get(public_id=event['data']['public_id'])
-    account.amount += Decimal(event['data']['amount'])
-    account.save()
+    """Handles user's account(financial) change event, updates today's company revenue"""
+    handle_billing_account_changed_batch([event])
+
+
+def handle_billing_account_changed_batch(events: List[Dict]):
+    """Handles user's account(financial) change events
+
+    Changes are coalesced per account and applied with single atomic `F()` update per account,
+    so several consumers can apply changes of the same account concurrently.
+    """
+    balance_deltas = defaultdict(Decimal)
+    for event in events:
+        balance_deltas[event['data']['public_id']] += to_amount(event['data']['amount'])
+
+    with transaction.atomic():
+        accounts = {
+            str(account["public_id"]): account
+            for account in Account.objects.filter(public_id__in=balance_deltas).values("id", "public_id", "user__public_id")
+        }
+        missing_public_ids = set(balance_deltas) - set(accounts)
+        if missing_public_ids:
+            raise Account.DoesNotExist(f"no accounts for {missing_public_ids=}")
+
+        now = timezone.now()
+        # the same update order in all transactions prevents deadlocks between concurrent consumers
+        for public_id, delta in sorted(balance_deltas.items(), key=lambda item: accounts[item[0]]["id"]):
+            Account.objects.filter(id=accounts[public_id]["id"]).update(amount=F("amount") + delta, updated_at=now)
+
+        # company revenue is counted for the day the change happened at, not for the day it's consumed at
+        company_revenue = defaultdict(Decimal)
+        for event in events:
+            if accounts[event['data']['public_id']]["user__public_id"] == settings.COMPANY_USER_PUBLIC_ID:
+                company_revenue[parse_event_day(event["event_time"])] += to_amount(event['data']['amount'])
+        company_revenue = {day: revenue for day, revenue in sorted(company_revenue.items()) if revenue}
+        ensure_daily_stats(company_revenue)
+        for day, revenue in company_revenue.items():
+            DailyStats.objects.filter(day=day).update(company_revenue=F("company_revenue") + revenue, updated_at=now)
 
 
 def handle_billing_account_created(event: Dict):
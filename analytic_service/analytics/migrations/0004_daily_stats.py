@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:59
+
+import analytics.models
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_alter_account_public_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigIntegerField(default=analytics.models.get_id, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('public_id', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('day', models.DateField(unique=True)),
+                ('top_task_public_id', models.BigIntegerField(null=True)),
+                ('top_task_fee', models.DecimalField(decimal_places=10, max_digits=15, null=True)),
+                ('company_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:14
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='public_id',
+            field=models.UUIDField(db_index=True, default=uuid.uuid4, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='accountuser',
+            name='public_id',
+            field=models.CharField(db_index=True, max_length=250),
+        ),
+    ]
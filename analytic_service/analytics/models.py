@@ -18,7 +18,7 @@ class BaseEntity:
 
 
 class AccountUser(User):
-    public_id = models.CharField(max_length=250)
+    public_id = models.CharField(max_length=250, db_index=True)
     role = models.CharField(max_length=250)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -54,6 +54,7 @@ class BaseModel(models.Model):
 
 
 class Account(BaseModel):
+    public_id = models.UUIDField(default=uuid.uuid4, editable=False, db_index=True)
     user = models.ForeignKey(AccountUser, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
 
@@ -63,4 +64,13 @@ class Task(BaseModel):
     status = models.CharField(max_length=250)
     fee_on_assign = models.DecimalField(max_digits=15, decimal_places=10)
     fee_on_complete = models.DecimalField(max_digits=15, decimal_places=10)
-    public_id = models.BigIntegerField(editable=False, unique=True)
\ No newline at end of file
+    public_id = models.BigIntegerField(editable=False, unique=True)
+
+
+class DailyStats(BaseModel):
+    """Per day aggregates maintained incrementally by event handlers"""
+
+    day = models.DateField(unique=True)
+    top_task_public_id = models.BigIntegerField(null=True)
+    top_task_fee = models.DecimalField(max_digits=15, decimal_places=10, null=True)
+    company_revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
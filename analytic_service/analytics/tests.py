@@ -1,3 +1,108 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from uuid import UUID
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from analytics import controllers
+from analytics.models import Account, AccountUser, DailyStats, Task
+
+
+class DailyStatsTest(TestCase):
+    def setUp(self):
+        company_user = AccountUser.objects.create(username="company", public_id=settings.COMPANY_USER_PUBLIC_ID)
+        self.company_account = Account.objects.create(user=company_user)
+        self.yesterday = timezone.now() - timedelta(days=1)
+
+    def build_event(self, data):
+        return {"event_id": "1", "event_time": str(self.yesterday.replace(tzinfo=None)), "data": data}
+
+    def test_stats_are_bucketed_by_event_time(self):
+        Task.objects.create(public_id=1, title="task", status="new", fee_on_assign=-10, fee_on_complete=25)
+
+        controllers.handle_task_completed(self.build_event({"id": 1}))
+        controllers.handle_billing_account_changed(
+            self.build_event({"public_id": str(self.company_account.public_id), "amount": 12.5})
+        )
+
+        stats = DailyStats.objects.get()
+        self.assertEqual(stats.day, self.yesterday.date())
+        self.assertEqual((stats.top_task_public_id, stats.company_revenue), (1, Decimal("12.50")))
+
+    def test_ensure_daily_stats_keeps_existing_rows(self):
+        today = timezone.now().date()
+        DailyStats.objects.create(day=today, company_revenue=5)
+
+        controllers.ensure_daily_stats([today, self.yesterday.date()])
+        controllers.ensure_daily_stats([today])
+
+        self.assertEqual(
+            list(DailyStats.objects.order_by("day").values_list("day", "company_revenue")),
+            [(self.yesterday.date(), Decimal(0)), (today, Decimal(5))],
+        )
+
+
+class CompanyIdentityTest(TestCase):
+    def tearDown(self):
+        controllers.company_identity.invalidate()
+
+    def test_identity_is_loaded_from_company_account(self):
+        controllers.company_identity.invalidate()
+        with self.assertRaises(Account.DoesNotExist):
+            controllers.company_identity.get()
+
+        company_user = AccountUser.objects.create(username="company", public_id=settings.COMPANY_USER_PUBLIC_ID)
+        company_account = Account.objects.create(user=company_user)
+        company = controllers.company_identity.get()
+
+        self.assertEqual((company.user_id, company.account_id), (company_user.id, company_account.id))
+        self.assertIsInstance(company.account_public_id, UUID)
+        self.assertEqual(company.account_public_id, company_account.public_id)
+
+
+class ConcurrentBalanceChangesTest(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == "sqlite":
+            # concurrent consumers need immediate transactions of sqlite performance profile(see common_lib/db.py),
+            # connections of consumer threads are built from the same settings dict
+            patcher = mock.patch.dict(connection.settings_dict["OPTIONS"], transaction_mode="IMMEDIATE")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        company_user = AccountUser.objects.create(username="company", public_id=settings.COMPANY_USER_PUBLIC_ID)
+        self.company_account = Account.objects.create(user=company_user)
+
+    def test_concurrent_batches_of_same_account_dont_lose_updates(self):
+        batches_count, events_per_batch = 20, 5
+        barrier, errors = threading.Barrier(2), []
+        event = {
+            "event_id": "1",
+            "event_time": str(timezone.now().replace(tzinfo=None)),
+            "data": {"public_id": str(self.company_account.public_id), "amount": 1.25},
+        }
+
+        def consume():
+            try:
+                barrier.wait()
+                for _ in range(batches_count):
+                    controllers.handle_billing_account_changed_batch([event] * events_per_batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=consume) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected_amount = Decimal("1.25") * events_per_batch * batches_count * len(threads)
+        self.company_account.refresh_from_db()
+        self.assertEqual(self.company_account.amount, expected_amount)
+        self.assertEqual(DailyStats.objects.get().company_revenue, expected_amount)
@@ -1,40 +1,47 @@
 import logging
-from datetime import datetime
+from datetime import date, timedelta
+from typing import Dict, List
 from django.utils import timezone
 from django.http import HttpRequest, JsonResponse
 
 from django.views.decorators.http import require_http_methods
 from analytics.models import Account
-from analytics.models import Task
+from analytics.models import DailyStats
+from analytics.controllers import company_identity
 
 from common_lib.access_control import requires_scope
-from django.db.models import Max
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_top_tasks(since: date) -> List[Dict]:
+    """Provides per day top tasks since given day, most expensive first"""
+    daily_stats = (
+        DailyStats.objects.filter(day__gte=since, top_task_fee__isnull=False)
+        .order_by("-top_task_fee")
+        .values("day", "top_task_public_id", "top_task_fee")
+    )
+    return [
+        {"day": stats["day"], "task_id": stats["top_task_public_id"], "fee": stats["top_task_fee"]}
+        for stats in daily_stats
+    ]
+
 
 @requires_scope("admin manager")
 @require_http_methods(["GET"])
 def get_dashboard(request: HttpRequest):
-    company_account = Account.objects.get(user__public_id='1')
-    papug_accounts_count = Account.objects.filter(amount__lt=0).exclude(public_id=company_account.public_id).count()
-    
-    today_min = datetime.combine(timezone.now().date(), datetime.today().time().min)
-    today_max = datetime.combine(timezone.now().date(), datetime.today().time().max)
-
-    today_stats = (
-        Task.objects.filter(created_at__range=(today_min, today_max), status="completed")
-        .aggregate(completed_max_task=Max("fee_on_complete"))
-    )
-    today_top_task = today_stats['completed_max_task'] or 0
+    company = company_identity.get()
+    papug_accounts_count = Account.objects.filter(amount__lt=0).exclude(id=company.account_id).count()
+
+    today = timezone.now().date()
+    today_stats = DailyStats.objects.filter(day=today).first()
     top_tasks = {
-        'today_top_task': today_top_task,
-        'week_top_tasks': "TODO",
-        'month_top_tasks': "TODO",
+        'today_top_task': (today_stats and today_stats.top_task_fee) or 0,
+        'week_top_tasks': get_top_tasks(since=today - timedelta(days=6)),
+        'month_top_tasks': get_top_tasks(since=today - timedelta(days=29)),
     }
-    today_revenue = company_account.amount  # TODO: read transaction log and filter by today date
+    today_revenue = today_stats.company_revenue if today_stats else 0
     debt_papug_amount = papug_accounts_count
     dashboard = {
         'today_revenue': today_revenue,
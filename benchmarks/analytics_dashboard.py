@@ -0,0 +1,102 @@
+"""
+Analytics dashboard latency while a year of synthetic events is consumed
+
+Runs against the database configured by analytic service settings, so it needs the same environment as the
+service(see `.env.template`), e.g. with throwaway sqlite database:
+
+    cd analytic_service && SQLITE_DB_PATH=/tmp/analytics-bench.db python ../benchmarks/analytics_dashboard.py
+
+Every simulated day creates and completes `--tasks-per-day` tasks and changes company balance once per task,
+events are passed to the same handlers `consume_cud_events` uses. Dashboard latency is measured once a month of
+events is consumed: it should stay flat, as the dashboard reads per day aggregates only.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "analytic_service"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "analytic_service.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from analytics import controllers, views  # noqa: E402
+from analytics.models import Account, AccountUser  # noqa: E402
+
+
+def build_event(event_name: str, event_time: datetime, data: dict) -> dict:
+    return {"event_id": str(uuid4()), "event_name": event_name, "event_time": str(event_time), "data": data}
+
+
+def consume_day(day: datetime, first_task_id: int, tasks_per_day: int, company_account_public_id: str):
+    for task_id in range(first_task_id, first_task_id + tasks_per_day):
+        event_time = day + timedelta(seconds=task_id % 86400)
+        fee_on_complete = 20 + task_id % 20
+        controllers.handle_task_created(
+            build_event(
+                "task_created",
+                event_time,
+                {"id": task_id, "title": "task", "status": "new", "fee_on_assign": -10, "fee_on_complete": fee_on_complete},
+            )
+        )
+        controllers.handle_task_completed(build_event("task_completed", event_time, {"id": task_id}))
+        controllers.handle_billing_account_changed_batch(
+            [build_event("billing_account_changed", event_time, {"public_id": company_account_public_id, "amount": 10})]
+        )
+
+
+def measure_dashboard(repeat: int) -> float:
+    """Median dashboard latency in milliseconds"""
+    request = RequestFactory().get("/")
+    get_dashboard = getattr(views.get_dashboard, "__wrapped__", views.get_dashboard)
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        get_dashboard(request)
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--tasks-per-day", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50, help="dashboard requests per measurement")
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    company_user, _ = AccountUser.objects.get_or_create(
+        username="company", public_id=settings.COMPANY_USER_PUBLIC_ID, role="admin"
+    )
+    company_account = Account.objects.filter(user=company_user).first() or Account.objects.create(user=company_user)
+    controllers.company_identity.invalidate()
+
+    first_day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days - 1)
+    first_task_id = (int(time.time()) % 1000) * 10**9
+    print(f"{'days consumed':>14} {'events':>10} {'dashboard p50, ms':>18}")
+    for day_number in range(args.days):
+        consume_day(
+            first_day + timedelta(days=day_number),
+            first_task_id=first_task_id + day_number * args.tasks_per_day,
+            tasks_per_day=args.tasks_per_day,
+            company_account_public_id=str(company_account.public_id),
+        )
+        if (day_number + 1) % 30 == 0 or day_number + 1 == args.days:
+            events_count = (day_number + 1) * args.tasks_per_day * 3
+            print(f"{day_number + 1:>14} {events_count:>10} {measure_dashboard(args.repeat):>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Startup time and broker/db clients of service processes
+
+Each service is started in a fresh interpreter the way its processes start: web worker imports event handling
+module, consumer builds failed events and offset managers(`consume_cud_events` with consuming itself stubbed
+out) and outbox relay gets the publisher of service's exchange twice, as it does after a failed batch.
+Needs the same environment as the services(see `.env.template`):
+
+    python benchmarks/clients.py
+
+Managers are built several times per process, but they share one `MongoClient` and relay reuses one publisher
+connection per exchange, see `common_lib/clients.py`. Open sockets of the process are counted once it started.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# service dir: (settings module, app with consume command, module building event manager, outbox exchange setting)
+SERVICES = {
+    "account_service": ("account_service.settings", "account", "account.controllers", "BILLING_EXCHANGE_NAME"),
+    "task_service": ("task_service.settings", "task", "task.views", "TASKS_EXCHANGE_NAME"),
+    "analytic_service": ("analytic_service.settings", "analytics", "analytics.controllers", None),
+}
+
+
+def count_sockets() -> int:
+    fd_dir = Path("/proc/self/fd")
+    if not fd_dir.exists():
+        return -1
+    sockets_count = 0
+    for fd in list(fd_dir.iterdir()):
+        try:
+            sockets_count += os.readlink(fd).startswith("socket:")
+        except FileNotFoundError:  # fd of the directory listing itself
+            pass
+    return sockets_count
+
+
+def start_service(service: str) -> dict:
+    settings_module, app_name, event_module, exchange_setting = SERVICES[service]
+    sys.path.insert(0, str(ROOT_DIR))
+    sys.path.insert(0, str(ROOT_DIR / service))
+    os.environ["DJANGO_SETTINGS_MODULE"] = settings_module
+
+    started_at = time.perf_counter()
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.core.management import load_command_class
+    from pymongo.mongo_client import MongoClient
+
+    from common_lib.cud_event_manager import FailedEventManager
+    from common_lib.offset_manager import OffsetLogManager
+    from common_lib.rabbit import BatchRabbitMQPublisher, RabbitMQMultiConsumer
+
+    builds = []
+
+    def count_builds(build):
+        def counted_build(cls, *args, **kwargs):
+            builds.append(cls)
+            return build(cls, *args, **kwargs)
+
+        return classmethod(counted_build)
+
+    for manager_class in (FailedEventManager, OffsetLogManager):
+        manager_class.build = count_builds(manager_class.build.__func__)
+
+    import_module(event_module)
+    with mock.patch.object(RabbitMQMultiConsumer, "listen"), mock.patch.object(
+        FailedEventManager, "start_background_reprocessing"
+    ), mock.patch.object(OffsetLogManager, "close"):
+        load_command_class(app_name, "consume_cud_events").handle(workers=0)
+    if exchange_setting:
+        from common_lib.outbox.outbox import OutboxRelay
+
+        exchange_name = getattr(settings, exchange_setting)
+        relay = OutboxRelay(dsn=settings.RABBITMQ_DSN)
+        relay._get_publisher(exchange_name)
+        OutboxRelay(dsn=settings.RABBITMQ_DSN)._get_publisher(exchange_name)
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "startup_s": elapsed,
+        "manager_builds": len(builds),
+        "mongo_clients": sum(isinstance(obj, MongoClient) for obj in gc.get_objects()),
+        "publishers": sum(isinstance(obj, BatchRabbitMQPublisher) for obj in gc.get_objects()),
+        "sockets": count_sockets(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", choices=SERVICES, help="starts single service and prints its stats as json")
+    args = parser.parse_args()
+
+    if args.service:
+        print(json.dumps(start_service(args.service)))
+        os._exit(0)  # doesn't wait for publisher io threads
+
+    print(f"{'service':<18} {'startup, s':>10} {'manager builds':>15} {'MongoClient':>12} {'publishers':>11} {'sockets':>8}")
+    for service in SERVICES:
+        output = subprocess.run(
+            [sys.executable, __file__, "--service", service], check=True, capture_output=True, text=True
+        ).stdout
+        stats = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{service:<18} {stats['startup_s']:>10.3f} {stats['manager_builds']:>15} {stats['mongo_clients']:>12} "
+            f"{stats['publishers']:>11} {stats['sockets']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmarks of event encoding, decoding and event time parsing
+
+    python benchmarks/codec.py --number 20000
+
+Compares stdlib json with orjson(when installed) on a typical `CUDEvent` body, `parse_datetime` fast path with
+`dateutil.parser.parse` it replaced, and consumer's per event work before and after event time is parsed once.
+"""
+import argparse
+import json
+import sys
+import timeit
+from dataclasses import asdict
+from pathlib import Path
+
+from dateutil import parser as dateutil_parser
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common_lib import codec  # noqa: E402
+from common_lib.cud_event_manager import CUDEvent  # noqa: E402
+
+
+def build_body() -> dict:
+    event = CUDEvent(
+        data={
+            "id": 7185894346052628480,
+            "created_at": "2022-05-15 09:58:00.000000",
+            "updated_at": "2022-05-15 09:58:00.000000",
+            "title": "task",
+            "description": "description",
+            "status": "new",
+            "assignee": "3f1c5d0e-1c7b-4a55-9b3c-7f6a9d1e2b4c",
+            "fee_on_assign": -10.5,
+            "fee_on_complete": 25.0,
+        },
+        producer="task_service",
+        event_name="task_created",
+    )
+    return asdict(event)
+
+
+def build_cases(body: dict) -> dict:
+    encoded = codec.JSONCodec().dumps(body)
+    event_time = str(body["event_time"])
+    cases = {
+        "encode: json": lambda: codec.JSONCodec().dumps(body),
+        "decode: json": lambda: json.loads(encoded),
+        "event time: dateutil": lambda: dateutil_parser.parse(event_time),
+        "event time: parse_datetime": lambda: codec.parse_datetime(event_time),
+        # consumer used to parse event time for the new offset and again for the offset check
+        "consume: parse event time twice": lambda: (codec.parse_datetime(event_time), codec.parse_datetime(event_time)),
+        "consume: parse event time once": lambda: codec.parse_datetime(event_time),
+    }
+    if codec.orjson:
+        orjson_codec = codec.OrjsonCodec()
+        cases["encode: orjson"] = lambda: orjson_codec.dumps(body)
+        cases["decode: orjson"] = lambda: orjson_codec.loads(encoded)
+    return dict(sorted(cases.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements per case, the best one is reported")
+    args = parser.parse_args()
+
+    if not codec.orjson:
+        print("orjson isn't installed, only stdlib json is measured")
+    for name, case in build_cases(build_body()).items():
+        best = min(timeit.repeat(case, number=args.number, repeat=args.repeat))
+        print(f"{name:<35} {best / args.number * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Consumer throughput with handlers in the ioloop thread vs worker threads
+
+RabbitMQ is replaced with in-process stand-in: messages are passed to `RabbitMQMultiConsumer` the way pika
+delivers them and acks are counted, so only dispatching, handling and acking are measured:
+
+    python benchmarks/consumer_workers.py --events 2000 --handler-ms 2
+
+Handler sleeps `--handler-ms` to simulate db round trip of event handler, events are spread across `--entities`
+partition keys, with single partition key(task stream) all events are handled by one worker.
+"""
+import argparse
+import json
+import queue
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common_lib.rabbit import (  # noqa: E402
+    ConsumerConfig,
+    ConsumerStats,
+    RabbitMQMultiConsumer,
+    get_event_partition_key,
+    single_partition_key,
+)
+
+
+class StandInIOLoop:
+    def __init__(self) -> None:
+        self.callbacks = queue.Queue()
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+
+class StandInChannel:
+    is_open = True
+
+    def __init__(self) -> None:
+        self.acks_count = 0
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        self.acks_count += 1
+
+
+def build_bodies(events: int, entities: int) -> list:
+    public_ids = [str(uuid4()) for _ in range(entities)]
+    return [
+        json.dumps(
+            {"event_name": "billing_account_changed", "data": {"public_id": public_ids[number % entities], "amount": 1}}
+        ).encode()
+        for number in range(events)
+    ]
+
+
+def bench(bodies: list, workers: int, handler_delay: float, partition_key) -> float:
+    def handle(channel, method, properties, body):
+        time.sleep(handler_delay)
+
+    consumer = ConsumerConfig(exchange="bench", queue="bench", callback=handle, partition_key=partition_key)
+    rmq_client = RabbitMQMultiConsumer(dsn="amqp://localhost", consumers=[consumer], workers=workers)
+    ioloop, channel = StandInIOLoop(), StandInChannel()
+    rmq_client._connection = SimpleNamespace(ioloop=ioloop)
+    rmq_client._connections[consumer] = channel
+    rmq_client._stats[consumer] = ConsumerStats()
+    rmq_client._start_workers()
+
+    started_at = time.perf_counter()
+    for delivery_tag, body in enumerate(bodies, start=1):
+        rmq_client._custom_ack(channel, SimpleNamespace(delivery_tag=delivery_tag), None, body, consumer=consumer)
+    stats = rmq_client._stats[consumer]
+    while workers and stats.processed_count < len(bodies):
+        ioloop.callbacks.get()()
+    rmq_client._ack_pending(consumer)
+    elapsed = time.perf_counter() - started_at
+
+    rmq_client._stop_workers()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--entities", type=int, default=100)
+    parser.add_argument("--handler-ms", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    bodies = build_bodies(args.events, args.entities)
+    handler_delay = args.handler_ms / 1000
+    for name, partition_key in (("per entity key", get_event_partition_key), ("single key", single_partition_key)):
+        for workers in args.workers:
+            elapsed = bench(bodies, workers, handler_delay, partition_key)
+            print(f"{name:<15} workers={workers:<3} {elapsed:8.3f}s {len(bodies) / elapsed:10.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Account service write throughput under concurrent consumer and web load
+
+Consumer processes handle `tasks_assigned` and `task_completed` event batches of random tasks(balance updates of
+the same company account in every batch), while web processes read worker and admin dashboards. Runs against the
+database configured by account service settings, so it needs the same environment as the service(see
+`.env.template`). Local postgres(database has to exist) and sqlite for comparison:
+
+    POSTGRES_DB=account_bench POSTGRES_USER=postgres python benchmarks/db_throughput.py --consumers 4 --web 4
+    SQLITE_DB_PATH=/tmp/account-bench.db SQLITE_PERFORMANCE_PROFILE=1 python benchmarks/db_throughput.py
+
+Every process keeps its persistent connection(see `common_lib/db.py`). Failed batches and requests are the ones
+that raised a database error, e.g. "database is locked" of sqlite or a deadlock of postgres.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "account_service"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "account_service.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import DatabaseError, connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from account import controllers, views  # noqa: E402
+from account.models import Account, AccountUser, Task  # noqa: E402
+
+
+def seed(workers_count: int, tasks_count: int):
+    call_command("migrate", verbosity=0)
+    controllers.ensure_company_account()
+    for number in range(AccountUser.objects.filter(username__startswith="throughput-").count(), workers_count):
+        user = AccountUser.objects.create(
+            username=f"throughput-{number}", public_id=f"throughput-{number}", role="worker"
+        )
+        Account.objects.create(user=user)
+    workers = list(AccountUser.objects.filter(username__startswith="throughput-").order_by("id")[:workers_count])
+
+    first_public_id = Task.objects.count() + 1
+    Task.objects.bulk_create(
+        [
+            Task(
+                public_id=public_id,
+                title=f"task {public_id}",
+                status="new",
+                description="description",
+                assignee=workers[public_id % workers_count],
+                fee_on_assign=-10,
+                fee_on_complete=20,
+            )
+            for public_id in range(first_public_id, tasks_count + 1)
+        ],
+        batch_size=2000,
+    )
+
+
+def build_events(task_public_ids, worker_public_ids, batch_size: int):
+    """Yields `tasks_assigned` event and `task_completed` events batch by turns"""
+    event_time = str(timezone.now().replace(tzinfo=None))
+    while True:
+        tasks = Task.objects.filter(public_id__in=random.sample(task_public_ids, batch_size)).select_related("assignee")
+        yield controllers.handle_tasks_assigned, {
+            "event_id": "1",
+            "event_name": "tasks_assigned",
+            "event_time": event_time,
+            "data": {
+                "tasks": [
+                    {
+                        "id": task.public_id,
+                        "new_assignee": random.choice(worker_public_ids),
+                        "previous_assignee": task.assignee.public_id,
+                        "fee_on_assign": -10.5,
+                        "fee_on_complete": 20.5,
+                    }
+                    for task in tasks
+                ]
+            },
+        }
+        yield controllers.handle_task_completed_batch, [
+            {"event_id": "1", "event_name": "task_completed", "event_time": event_time, "data": {"id": public_id}}
+            for public_id in random.sample(task_public_ids, batch_size)
+        ]
+
+
+def consume(seconds: float, batch_size: int, results):
+    task_public_ids = list(Task.objects.values_list("public_id", flat=True))
+    worker_public_ids = list(
+        AccountUser.objects.filter(username__startswith="throughput-").values_list("public_id", flat=True)
+    )
+    events = build_events(task_public_ids, worker_public_ids, batch_size)
+
+    handled = failed = 0
+    finish_at = time.monotonic() + seconds
+    while time.monotonic() < finish_at:
+        handler, event = next(events)
+        try:
+            handler(event)
+            handled += batch_size
+        except DatabaseError:
+            failed += 1
+    results.put(("consumer", handled, failed))
+
+
+def serve(seconds: float, results):
+    request_factory = RequestFactory()
+    worker_public_ids = list(
+        AccountUser.objects.filter(username__startswith="throughput-").values_list("public_id", flat=True)
+    )
+
+    served = failed = 0
+    finish_at = time.monotonic() + seconds
+    while time.monotonic() < finish_at:
+        request = request_factory.get("/", {"limit": 50})
+        try:
+            if served % 2:
+                views.get_admin_dashboard(request, {"role": "admin"})
+            else:
+                views.get_worker_dashboard(request, {"public_id": random.choice(worker_public_ids)})
+            served += 1
+        except DatabaseError:
+            failed += 1
+    results.put(("web", served, failed))
+
+
+def bench(consumers: int, web: int, seconds: float, batch_size: int) -> dict:
+    """Returns (succeeded, failed) operations by role"""
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=consume, args=(seconds, batch_size, results)) for _ in range(consumers)]
+    processes += [multiprocessing.Process(target=serve, args=(seconds, results)) for _ in range(web)]
+    for process in processes:
+        process.start()
+    totals = {"consumer": [0, 0], "web": [0, 0]}
+    for _ in processes:
+        role, succeeded, failed = results.get()
+        totals[role][0] += succeeded
+        totals[role][1] += failed
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumers", type=int, default=4, help="max consumer processes, runs with 1 and this many")
+    parser.add_argument("--web", type=int, default=4, help="web processes")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--batch", type=int, default=10, help="events per handled batch")
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=10000)
+    args = parser.parse_args()
+
+    seed(args.workers, args.tasks)
+    connection.close()  # spawned processes open their own connections
+
+    multiprocessing.set_start_method("spawn")
+    print(f"database: {connection.vendor}")
+    print(f"{'consumers':>9} {'web':>4} {'events/s':>9} {'failed batches':>15} {'requests/s':>11} {'failed requests':>16}")
+    for consumers_count in sorted({1, args.consumers}):
+        totals = bench(consumers_count, args.web, args.seconds, args.batch)
+        (events, failed_batches), (requests, failed_requests) = totals["consumer"], totals["web"]
+        print(
+            f"{consumers_count:>9} {args.web:>4} {events / args.seconds:>9.0f} {failed_batches:>15} "
+            f"{requests / args.seconds:>11.0f} {failed_requests:>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
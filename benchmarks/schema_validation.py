@@ -0,0 +1,72 @@
+"""
+Event validation latency, compiled validators vs jsonschema
+
+Every schema of `common_lib/schema` gets a valid event built from the schema(arrays get `--items` items, e.g.
+tasks of `tasks_assigned`), which is validated by `Validator` with and without compiled function:
+
+    python benchmarks/schema_validation.py --items 20
+
+Invalid events are validated by jsonschema after compiled function rejected them, so they are a bit slower with
+compiled validator and are measured as well(first required key of the event dropped).
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from jsonschema import ValidationError  # noqa: E402
+
+from common_lib.schema.validator import Validator, get_schema  # noqa: E402
+from common_lib.tests.test_schema_conformance import SCHEMA_ROOT, build_sample  # noqa: E402
+
+
+def resize_arrays(value, items_count: int):
+    if isinstance(value, dict):
+        return {key: resize_arrays(item, items_count) for key, item in value.items()}
+    if isinstance(value, list) and value:
+        return [resize_arrays(value[0], items_count) for _ in range(items_count)]
+    return value
+
+
+def measure(validator: Validator, event: dict, repeat: int) -> float:
+    """Median latency in microseconds"""
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        try:
+            validator.validate(event)
+        except ValidationError:
+            pass
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20, help="items of every array in the event")
+    parser.add_argument("--repeat", type=int, default=2000, help="validations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'schema':<40} {'jsonschema, us':>15} {'compiled, us':>13} {'invalid: jsonschema, us':>24} {'compiled, us':>13}")
+    for schema_path in sorted(SCHEMA_ROOT.glob("*/*/*.json")):
+        compiled_validator = Validator(str(schema_path))
+        reference_validator = Validator(str(schema_path), use_compiled=False)
+        schema = get_schema(str(schema_path))
+        event = resize_arrays(build_sample(schema, schema), args.items)
+        invalid_event = {key: value for key, value in event.items() if key != schema.get("required", [None])[0]}
+
+        print(
+            f"{str(schema_path.relative_to(SCHEMA_ROOT)):<40} "
+            f"{measure(reference_validator, event, args.repeat):>15.1f} "
+            f"{measure(compiled_validator, event, args.repeat):>13.1f} "
+            f"{measure(reference_validator, invalid_event, args.repeat):>24.1f} "
+            f"{measure(compiled_validator, invalid_event, args.repeat):>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+sqlite contention of concurrent writers and readers without and with the performance profile
+
+Several writer processes run the same read-then-write transaction as account balance handlers against one
+sqlite file, while reader processes read the account and its latest transactions as the logs endpoint does.
+Every configuration gets a fresh database in a temporary directory:
+
+    python benchmarks/sqlite_contention.py --writers 4 --readers 4 --seconds 5
+
+Configurations are the default one("before": rollback journal, deferred transactions), the performance profile
+with deferred transactions and the performance profile as it's enabled by SQLITE_PERFORMANCE_PROFILE=1(WAL,
+busy_timeout, immediate transactions). Deferred transaction that has read before another process committed
+can't upgrade to write lock and fails with "database is locked" regardless of busy_timeout, immediate
+transaction waits for the lock on BEGIN. Without WAL readers wait for writers and the other way around.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+# name: (SQLITE_PERFORMANCE_PROFILE, SQLITE_TRANSACTION_MODE)
+CONFIGURATIONS = {
+    "default(before)": ("0", "DEFERRED"),
+    "profile, deferred": ("1", "DEFERRED"),
+    "profile": ("1", "IMMEDIATE"),
+}
+
+
+def setup_django(db_path: str, configuration: str):
+    performance_profile, transaction_mode = CONFIGURATIONS[configuration]
+    sys.path.insert(0, str(ROOT_DIR))
+    sys.path.insert(0, str(ROOT_DIR / "account_service"))
+    os.environ.update(
+        DJANGO_SETTINGS_MODULE="account_service.settings",
+        SQLITE_DB_PATH=db_path,
+        SQLITE_PERFORMANCE_PROFILE=performance_profile,
+        SQLITE_TRANSACTION_MODE=transaction_mode,
+    )
+    os.environ.pop("POSTGRES_DB", None)
+
+    import django
+
+    django.setup()
+
+
+def create_account(db_path: str, configuration: str) -> int:
+    setup_django(db_path, configuration)
+    from django.core.management import call_command
+
+    from account.models import Account, AccountUser
+
+    call_command("migrate", verbosity=0)
+    user = AccountUser.objects.create(username="bench", public_id="bench", role="worker")
+    return Account.objects.create(user=user).id
+
+
+def write(db_path: str, configuration: str, account_id: int, seconds: float, results):
+    setup_django(db_path, configuration)
+    from django.db import OperationalError, transaction
+    from django.db.models import F
+
+    from account.models import Account, AccountTransaction
+
+    committed = failed = 0
+    finish_at = time.monotonic() + seconds
+    while time.monotonic() < finish_at:
+        try:
+            with transaction.atomic():
+                account = Account.objects.get(id=account_id)
+                Account.objects.filter(id=account.id).update(amount=F("amount") + 1)
+                AccountTransaction.objects.create(
+                    amount=1,
+                    type="income",
+                    description="bench",
+                    source_account_id=account,
+                    target_account_id=account,
+                )
+            committed += 1
+        except OperationalError:
+            failed += 1
+    results.put(("writer", committed, failed))
+
+
+def read(db_path: str, configuration: str, account_id: int, seconds: float, results):
+    setup_django(db_path, configuration)
+    from django.db import OperationalError
+
+    from account.models import Account, AccountTransaction
+
+    succeeded = failed = 0
+    finish_at = time.monotonic() + seconds
+    while time.monotonic() < finish_at:
+        try:
+            Account.objects.get(id=account_id)
+            list(AccountTransaction.objects.filter(source_account_id=account_id).order_by("-id")[:50])
+            succeeded += 1
+        except OperationalError:
+            failed += 1
+    results.put(("reader", succeeded, failed))
+
+
+def bench(db_path: str, configuration: str, account_id: int, writers: int, readers: int, seconds: float) -> dict:
+    """Returns (succeeded, failed) operations by role"""
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=target, args=(db_path, configuration, account_id, seconds, results))
+        for target, count in ((write, writers), (read, readers))
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    totals = {"writer": [0, 0], "reader": [0, 0]}
+    for _ in processes:
+        role, succeeded, failed = results.get()
+        totals[role][0] += succeeded
+        totals[role][1] += failed
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method("spawn")
+    print(f"{'configuration':<18} {'commits/s':>10} {'write locked':>13} {'reads/s':>10} {'read locked':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for number, configuration in enumerate(CONFIGURATIONS):
+            # journal mode is persistent, so every configuration starts with a new database
+            db_path = str(Path(tmp_dir) / f"contention-{number}.db")
+            with multiprocessing.Pool(1) as pool:
+                account_id = pool.apply(create_account, (db_path, configuration))
+            totals = bench(db_path, configuration, account_id, args.writers, args.readers, args.seconds)
+            (commits, write_failures), (reads, read_failures) = totals["writer"], totals["reader"]
+            print(
+                f"{configuration:<18} {commits / args.seconds:>10.0f} {write_failures:>13} "
+                f"{reads / args.seconds:>10.0f} {read_failures:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cold start time of service processes: WSGI workers and manage.py commands
+
+Every process is started in a fresh interpreter `--repeat` times and median wall time is printed, so it includes
+interpreter start, `django.setup()` and import of the modules the process needs. Commands are started with
+`--help`: the command module is imported, but nothing is consumed or relayed. WSGI worker imports the application
+and resolves url patterns as its first request does, which imports views and builds event managers. Needs the same
+environment as the services(see `.env.template`):
+
+    python benchmarks/startup.py --repeat 5
+
+With `--importtime` the slowest imports of WSGI worker of every service are printed as well(`python -X importtime`).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# service dir: (wsgi module, manage.py commands)
+SERVICES = {
+    "account_service": (
+        "account_service.wsgi",
+        ["check", "consume_cud_events --help", "relay_outbox_events --help"],
+    ),
+    "task_service": (
+        "task_service.wsgi",
+        ["check", "consume_cud_events --help", "relay_outbox_events --help"],
+    ),
+    "analytic_service": ("analytic_service.wsgi", ["check", "consume_cud_events --help"]),
+}
+
+
+def get_worker_code(wsgi_module: str) -> str:
+    return f"import {wsgi_module}; from django.urls import get_resolver; get_resolver().url_patterns"
+
+
+def get_env(service: str) -> dict:
+    python_path = [str(ROOT_DIR), str(ROOT_DIR / service), os.environ.get("PYTHONPATH", "")]
+    return {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, python_path))}
+
+
+def measure(command: list, service: str, repeat: int) -> float:
+    """Median wall time in seconds"""
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        subprocess.run(command, cwd=ROOT_DIR / service, env=get_env(service), check=True, capture_output=True)
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings)
+
+
+def get_slowest_imports(service: str, wsgi_module: str, limit: int) -> list:
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", get_worker_code(wsgi_module)],
+        cwd=ROOT_DIR / service,
+        env=get_env(service),
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module = line.removeprefix("import time:").split("|")
+        imports.append((int(cumulative_us), module.strip()))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="process starts per measurement")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="prints N slowest imports of workers")
+    args = parser.parse_args()
+
+    print(f"{'service':<18} {'process':<40} {'cold start, s':>14}")
+    for service, (wsgi_module, commands) in SERVICES.items():
+        processes = {f"wsgi worker({wsgi_module})": [sys.executable, "-c", get_worker_code(wsgi_module)]}
+        for command in commands:
+            processes[f"manage.py {command}"] = [sys.executable, "manage.py", *command.split()]
+        for name, command in processes.items():
+            print(f"{service:<18} {name:<40} {measure(command, service, args.repeat):>14.3f}")
+
+    for service, (wsgi_module, _) in SERVICES.items() if args.importtime else ():
+        print(f"\n{'cumulative, ms':>14}  {service} worker imports")
+        for cumulative_us, module in get_slowest_imports(service, wsgi_module, args.importtime):
+            print(f"{cumulative_us / 1000:>14.1f}  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Tasks list page latency by page depth, keyset cursor vs offset
+
+Runs against the database configured by task service settings, so it needs the same environment as the
+service(see `.env.template`), e.g. with throwaway sqlite database:
+
+    cd task_service && SQLITE_DB_PATH=/tmp/tasks-bench.db python ../benchmarks/task_list.py --tasks 100000
+
+`--tasks` tasks are created once, then a page is requested at several depths of the list through `list_tasks`
+with cursor of the previous page, and read with OFFSET of the same depth for comparison. Keyset page latency
+should stay flat with depth, offset page latency grows with it.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "task_service"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "task_service.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.http import JsonResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from task import views  # noqa: E402
+from task.models import Task, TaskTrackerUser  # noqa: E402
+
+
+def seed_tasks(tasks_count: int):
+    missing_count = tasks_count - Task.objects.count()
+    if missing_count <= 0:
+        return
+    workers = [
+        TaskTrackerUser.objects.get_or_create(username=f"bench-{number}", public_id=f"bench-{number}", role="worker")[0]
+        for number in range(10)
+    ]
+    Task.objects.bulk_create(
+        [
+            Task(
+                title=f"task {number}",
+                description="description",
+                status="new" if number % 3 else "completed",
+                assignee=workers[number % len(workers)],
+                fee_on_assign=-10,
+                fee_on_complete=20,
+            )
+            for number in range(missing_count)
+        ],
+        batch_size=2000,
+    )
+
+
+def measure(callback, repeat: int) -> float:
+    """Median latency in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        callback()
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20, help="requests per measurement")
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    seed_tasks(args.tasks)
+    task_ids = list(Task.objects.order_by("id").values_list("id", flat=True))
+    list_tasks = getattr(views.list_tasks, "__wrapped__", views.list_tasks)
+    request_factory = RequestFactory()
+
+    def get_offset_page(depth: int):
+        page = views.get_tasks_queryset().order_by("id")[depth:depth + args.limit]
+        return JsonResponse(data={"tasks": [views.serialize_task(task) for task in page]})
+
+    print(f"{'depth':>10} {'keyset page, ms':>16} {'offset page, ms':>16}")
+    for depth in (0, len(task_ids) // 4, len(task_ids) // 2, len(task_ids) - args.limit):
+        params = {"limit": args.limit, **({"cursor": task_ids[depth - 1]} if depth else {})}
+        keyset_ms = measure(lambda: list_tasks(request_factory.get("/", params)), args.repeat)
+        offset_ms = measure(lambda: get_offset_page(depth), args.repeat)
+        print(f"{depth:>10} {keyset_ms:>16.2f} {offset_ms:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Queries and latency of account service `tasks_assigned` handler by shuffled tasks amount
+
+Runs against the database configured by account service settings, so it needs the same environment as the
+service(see `.env.template`), e.g. with throwaway sqlite database:
+
+    cd account_service && SQLITE_DB_PATH=/tmp/account-bench.db python ../benchmarks/tasks_assigned.py
+
+`--workers` workers and `--tasks` tasks are created once, then shuffles of growing amount of tasks are handled.
+Queries amount depends on touched accounts(one balance, rollup and tasks update per account) and insert batches
+of transactions and `billing_account_changed` outbox events only: once every worker gets a task, more tasks add
+insert batches only(batch size is limited by sqlite query params).
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "account_service"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "account_service.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from account import controllers  # noqa: E402
+from account.models import Account, AccountUser, Task  # noqa: E402
+
+
+def seed(workers_count: int, tasks_count: int):
+    controllers.ensure_company_account()
+    for number in range(AccountUser.objects.filter(username__startswith="bench-").count(), workers_count):
+        user = AccountUser.objects.create(username=f"bench-{number}", public_id=f"bench-{number}", role="worker")
+        Account.objects.create(user=user)
+    workers = list(AccountUser.objects.filter(username__startswith="bench-").order_by("id")[:workers_count])
+
+    first_public_id = Task.objects.count() + 1
+    Task.objects.bulk_create(
+        [
+            Task(
+                public_id=public_id,
+                title=f"task {public_id}",
+                status="new",
+                description="description",
+                assignee=workers[public_id % workers_count],
+                fee_on_assign=-10,
+                fee_on_complete=20,
+            )
+            for public_id in range(first_public_id, tasks_count + 1)
+        ],
+        batch_size=2000,
+    )
+    return workers
+
+
+def build_event(tasks, workers) -> dict:
+    return {
+        "event_id": "1",
+        "event_name": "tasks_assigned",
+        "event_time": str(timezone.now().replace(tzinfo=None)),
+        "data": {
+            "tasks": [
+                {
+                    "id": task.public_id,
+                    "new_assignee": workers[number % len(workers)].public_id,
+                    "previous_assignee": task.assignee.public_id,
+                    "fee_on_assign": -10.5,
+                    "fee_on_complete": 20.5,
+                }
+                for number, task in enumerate(tasks)
+            ]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=10000)
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    workers = seed(args.workers, args.tasks)
+    tasks = list(Task.objects.select_related("assignee").order_by("public_id")[: args.tasks])
+
+    print(f"{'tasks':>8} {'accounts':>9} {'queries':>8} {'elapsed, s':>11}")
+    for tasks_count in (10, 100, 1000, args.tasks):
+        event = build_event(tasks[:tasks_count], workers)
+        started_at = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            controllers.handle_tasks_assigned(event)
+        elapsed = time.perf_counter() - started_at
+        accounts_count = min(tasks_count, len(workers)) + 1  # with company account
+        print(f"{tasks_count:>8} {accounts_count:>9} {len(queries):>8} {elapsed:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from functools import wraps
-from typing import Dict
+from typing import Dict, Optional, Tuple
 
+import requests
+from requests.adapters import HTTPAdapter
 from django.http import JsonResponse
 from django.conf import settings
 from django.shortcuts import redirect
@@ -11,6 +17,82 @@ from requests_oauthlib import OAuth2Session
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class UserInfoCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+
+class UserInfoCache:
+    """
+    Token -> user info cache with TTL and LRU eviction
+
+    Cache lives in process memory and isn't invalidated by events: user changes(e.g. role change) are handled by
+    consumer processes, while cached user info is served by web processes. So user info served by a web process
+    is at most `ttl` seconds stale, keep TTL short.
+    """
+
+    def __init__(self, ttl: float = 30, max_size: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = UserInfoCacheStats()
+        self._items: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()  # token -> (expires_at, user_info)
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            item = self._items.get(token)
+            if item and item[0] > time.monotonic():
+                self._items.move_to_end(token)
+                self.stats.hits += 1
+                return item[1]
+
+            if item:
+                del self._items[token]
+            self.stats.misses += 1
+
+    def set(self, token: str, user_info: Dict):
+        with self._lock:
+            self._items[token] = (time.monotonic() + self.ttl, user_info)
+            self._items.move_to_end(token)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, token: str):
+        with self._lock:
+            if self._items.pop(token, None):
+                self.stats.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# staleness bound of user info(e.g. role) served by web process is `USER_INFO_CACHE_TTL` seconds
+user_info_cache = UserInfoCache(
+    ttl=getattr(settings, "USER_INFO_CACHE_TTL", 30),
+    max_size=getattr(settings, "USER_INFO_CACHE_MAX_SIZE", 10000),
+)
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Shared session keeps connections to oauth server alive between requests"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            adapter = HTTPAdapter(pool_maxsize=getattr(settings, "OAUTH_HTTP_POOL_SIZE", 10))
+            _http_session = requests.Session()
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+    return _http_session
+
+
 def get_default_session(token_info: Dict) -> OAuth2Session:
     return OAuth2Session(settings.OAUTH_CLIENT_ID, token=token_info)
 
@@ -23,6 +105,25 @@ def get_user_info(oauth_session: OAuth2Session) -> Dict:
     return user_info
 
 
+def get_user_info_by_token(token: str) -> Dict:
+    """Gets user info from cache or from oauth server using shared http session"""
+    user_info = user_info_cache.get(token)
+    if user_info:
+        return user_info
+
+    response = get_http_session().get(
+        settings.OAUTH_ACCONT_INFO_URL,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=getattr(settings, "OAUTH_HTTP_TIMEOUT", 5),
+    )
+    response.raise_for_status()
+    user_info = response.json()
+    assert user_info
+    user_info_cache.set(token, user_info)
+    logger.debug(f"user info cache stats: {user_info_cache.stats=}")
+    return user_info
+
+
 def is_authorized(required_scopes: str, current_scope: str) -> bool:
     required_scopes_set = set(required_scopes.split())
     current_scope_set = set(current_scope.split())
@@ -73,8 +174,7 @@ def requires_scope(required_scope=None):
                 return redirect(f'/login?prev_path={args[0].build_absolute_uri()}&required_scope={required_scopes}')
 
             if required_scope and token:
-                session = get_default_session(token_info={'access_token': token, 'token_type': 'Bearer'})
-                user = get_user_info(session)
+                user = get_user_info_by_token(token)
                 request.session['access_token'] = token
                 logger.debug(f'checking that role: {user=}')
 
@@ -0,0 +1,64 @@
+"""
+Process wide registry of message broker and db clients
+
+Clients are created on first request and shared by all modules of the process: one pooled `MongoClient` per
+mongo dsn and one publisher connection per (rabbitmq dsn, exchange) pair, e.g. `OutboxRelay` publishes through it.
+"""
+import atexit
+import threading
+from logging import getLogger
+from typing import Dict, Tuple
+
+from pymongo.mongo_client import MongoClient
+
+from common_lib.rabbit import BatchRabbitMQPublisher
+
+
+logger = getLogger(__name__)
+
+_mongo_clients: Dict[str, MongoClient] = {}
+_publishers: Dict[Tuple[str, str], BatchRabbitMQPublisher] = {}
+_lock = threading.Lock()
+
+
+def get_mongo_client(dsn: str) -> MongoClient:
+    """Returns shared client, connection pool size is set by dsn options e.g. `maxPoolSize`"""
+    client = _mongo_clients.get(dsn)
+    if client:
+        return client
+    with _lock:
+        if dsn not in _mongo_clients:
+            _mongo_clients[dsn] = MongoClient(dsn, connect=False)
+        return _mongo_clients[dsn]
+
+
+def get_publisher(exchange_name: str, dsn: str, batch_size: int = 100) -> BatchRabbitMQPublisher:
+    """Returns shared publisher, its io thread connects on first call. `batch_size` is used on creation only"""
+    key = (dsn, exchange_name)
+    publisher = _publishers.get(key)
+    if publisher:
+        return publisher
+    with _lock:
+        if key not in _publishers:
+            _publishers[key] = BatchRabbitMQPublisher(exchange_name=exchange_name, dsn=dsn, batch_size=batch_size)
+        return _publishers[key]
+
+
+def reset_publisher(exchange_name: str, dsn: str):
+    """Drops shared publisher(e.g. after connection failure), next `get_publisher` call connects again"""
+    with _lock:
+        publisher = _publishers.pop((dsn, exchange_name), None)
+    if publisher:
+        publisher.close()
+
+
+@atexit.register
+def close_clients():
+    with _lock:
+        publishers, mongo_clients = list(_publishers.values()), list(_mongo_clients.values())
+        _publishers.clear()
+        _mongo_clients.clear()
+    for publisher in publishers:
+        publisher.close()
+    for client in mongo_clients:
+        client.close()
@@ -0,0 +1,88 @@
+"""
+JSON codec of events sent over message broker
+
+orjson is used when installed, stdlib json otherwise. Both encode values unknown to json(UUID, datetime, Decimal)
+with `str`, so events look the same whatever codec produced them.
+"""
+import json
+from datetime import date, datetime, timezone
+from typing import Any, Union
+
+from dateutil import parser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# orjson.JSONDecodeError is subclass of json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+
+
+class JSONCodec:
+    """stdlib json codec"""
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, default=str).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson codec, falls back to stdlib json for values orjson can't encode(e.g. ints wider than 64 bit)"""
+
+    name = "orjson"
+    # datetimes are passed to `default` to keep the stdlib `str(datetime)` format
+    options = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, default=str, option=self.options)
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+_codec: JSONCodec = OrjsonCodec() if orjson else JSONCodec()
+
+
+def get_codec() -> JSONCodec:
+    return _codec
+
+
+def set_codec(codec: JSONCodec):
+    """Replaces process wide codec, e.g. to force stdlib json"""
+    global _codec
+    _codec = codec
+
+
+def dumps(obj: Any) -> bytes:
+    return _codec.dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return _codec.loads(data)
+
+
+def parse_datetime(value: Union[str, datetime]) -> datetime:
+    """Parses event time: ISO-8601 strings take `datetime.fromisoformat` fast path, other formats go to dateutil"""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def parse_event_day(value: Union[str, datetime]) -> date:
+    """UTC day of event time, naive times are UTC as `CUDEvent.event_time` is"""
+    event_time = parse_datetime(value)
+    if event_time.tzinfo:
+        event_time = event_time.astimezone(timezone.utc)
+    return event_time.date()
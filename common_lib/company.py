@@ -0,0 +1,73 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+from uuid import UUID
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CompanyIdentity:
+    """Ids of company user and account, they never change at runtime"""
+
+    user_id: int
+    user_public_id: str
+    account_id: int
+    account_public_id: UUID
+
+
+class CompanyIdentityCache:
+    """
+    Process local cache of company identity
+
+    Identity is resolved by `loader` on first access and kept until `refresh()` is called. Loader errors
+    (e.g. company account isn't created yet) are raised to the caller and nothing gets cached.
+    """
+
+    def __init__(self, loader: Callable[[], CompanyIdentity]) -> None:
+        self._loader = loader
+        self._identity: Optional[CompanyIdentity] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> CompanyIdentity:
+        identity = self._identity
+        if identity:
+            return identity
+        with self._lock:
+            if not self._identity:
+                self._identity = self._loader()
+                logger.info(f"loaded company identity: {self._identity}")
+            return self._identity
+
+    def refresh(self) -> CompanyIdentity:
+        """Drops cached identity and loads it again"""
+        self.invalidate()
+        return self.get()
+
+    def invalidate(self):
+        with self._lock:
+            self._identity = None
+
+
+def load_company_identity(account_model, **user_filter) -> CompanyIdentity:
+    """Reads company user and account ids of service's `Account` model with single query
+
+    `user_filter` selects company user, e.g. `user__username=...`, raises `account_model.DoesNotExist`
+    if there is no company account.
+    """
+    account = (
+        account_model.objects.filter(**user_filter)
+        .order_by("id")
+        .values("id", "public_id", "user_id", "user__public_id")
+        .first()
+    )
+    if not account:
+        raise account_model.DoesNotExist(f"no company account for {user_filter=}")
+    return CompanyIdentity(
+        user_id=account["user_id"],
+        user_public_id=account["user__public_id"],
+        account_id=account["id"],
+        account_public_id=account["public_id"],
+    )
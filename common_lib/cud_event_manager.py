@@ -1,18 +1,21 @@
 import logging
-import os
+import threading
+import traceback
 from dataclasses import asdict, dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Callable, Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Set
 from uuid import UUID, uuid4
 
+from pymongo import ASCENDING, IndexModel, UpdateOne
 from pymongo.collection import Collection
-from pymongo.mongo_client import MongoClient
-from dateutil import parser
 
+from common_lib.clients import get_mongo_client
+from common_lib import codec
+from common_lib.codec import parse_datetime
 from common_lib.offset_manager import OffsetLogManager, Offset
 from common_lib.rabbit import RabbitMQPublisher
-from common_lib.schema.validator import Validator, get_schema
+from common_lib.schema.validator import get_validator_registry
 
 logger = logging.getLogger(__name__)
 
@@ -36,11 +39,74 @@ class ServiceName(Enum):
     AUTH_SERVICE = "auth_service"
 
 
+@dataclass
+class ReprocessStats:
+    processed: int = 0
+    retried: int = 0  # failed again, scheduled for next retry
+    failed: int = 0  # out of retries, left in FAILED status
+    postponed: int = 0  # waits for earlier failed event of the same entity
+
+
+class EventParkedError(Exception):
+    """Event is stored as failed without being applied, as earlier failed event of its entity waits for replay"""
+
+
+def build_exception_info(exception: Exception) -> Dict:
+    return {
+        "type": exception.__class__.__name__,
+        "message": str(exception),
+        "stack_trace": "".join(traceback.format_exception(exception)),
+    }
+
+
+def get_event_entity_keys(event: Dict) -> Set[str]:
+    """Ids of entities the event changes: events sharing an entity are applied in the order they were consumed"""
+    data = event.get("data") or {}
+    keys = {str(data[key]) for key in ("id", "public_id", "account_public_id") if data.get(key) is not None}
+    # `tasks_assigned` changes many tasks
+    keys.update(str(task["id"]) for task in data.get("tasks") or [] if isinstance(task, dict) and "id" in task)
+    return keys
+
+
 class FailedEventManager:
-    """Handles events that were failed during publish/consume stages"""
+    """Handles events that were failed during publish/consume stages
+
+    Failed consume events are reprocessed with per event retry counter: each failed retry postpones
+    the next one with exponential backoff, once `max_retries` are used the event gets FAILED status.
+
+    Error documents keep origin event id in top level `event_id`. Indexes are ensured on first collection access:
+    partial (producer, _id)/(consumer, _id) ones cover NEW events only, so reprocess scans don't touch the
+    handled ones, PROCESSED documents are removed by TTL index `processed_ttl` seconds after processing.
+
+    Replay is at-most-once: each event is switched from NEW to PROCESSING before its callback runs, so an event
+    claimed by a replay which got killed before storing the outcome stays in PROCESSING and is never applied
+    twice, such events need manual review. Events of the same entity(see `get_event_entity_keys`) are applied
+    in the order they were stored: while the entity has pending(NEW) failed events, `EventManager` parks its
+    live events behind them and replay postpones events which have earlier pending events of their entity.
+    Pending entities are tracked in memory of the consumer process, see `load_pending_events`.
+    """
 
-    def __init__(self, error_collection: Collection) -> None:
-        self.error_collection = error_collection
+    def __init__(
+        self,
+        error_collection: Collection,
+        max_retries: int = 5,
+        retry_backoff: float = 30.0,
+        max_retry_backoff: float = 3600.0,
+        batch_size: int = 100,
+        processed_ttl: Optional[int] = 7 * 24 * 3600,
+    ) -> None:
+        self._error_collection = error_collection
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.batch_size = batch_size
+        self.processed_ttl = processed_ttl
+        self._reprocessing_stopped = threading.Event()
+        self._indexes_ensured = False
+        self._indexes_lock = threading.Lock()
+        # entity key -> mongo ids of its pending consume events in stored order, None until pending events are loaded
+        self._pending_events: Optional[Dict[str, List]] = None
+        self._pending_lock = threading.Lock()
 
     @classmethod
     def build(
@@ -48,9 +114,46 @@ class FailedEventManager:
         mongo_dsn: str,
         db_name: str,
         error_collection_name: str,
+        processed_ttl: Optional[int] = 7 * 24 * 3600,
     ) -> "FailedEventManager":
-        error_collection = MongoClient(mongo_dsn)[db_name][error_collection_name]
-        return cls(error_collection=error_collection)
+        error_collection = get_mongo_client(mongo_dsn)[db_name][error_collection_name]
+        return cls(error_collection=error_collection, processed_ttl=processed_ttl)
+
+    @property
+    def error_collection(self) -> Collection:
+        self.ensure_indexes()
+        return self._error_collection
+
+    def ensure_indexes(self):
+        """Creates collection indexes once per process and sets `event_id` of documents stored without it"""
+        if self._indexes_ensured:
+            return
+        with self._indexes_lock:
+            if self._indexes_ensured:
+                return
+            indexes = [
+                IndexModel(
+                    [("producer", ASCENDING), ("_id", ASCENDING)],
+                    name="new_by_producer",
+                    partialFilterExpression={"status": "NEW", "producer": {"$exists": True}},
+                ),
+                IndexModel(
+                    [("consumer", ASCENDING), ("_id", ASCENDING)],
+                    name="new_by_consumer",
+                    partialFilterExpression={"status": "NEW", "consumer": {"$exists": True}},
+                ),
+                IndexModel([("event_id", ASCENDING)], name="event_id"),
+            ]
+            if self.processed_ttl:
+                indexes.append(
+                    IndexModel([("processed_at", ASCENDING)], name="processed_ttl", expireAfterSeconds=self.processed_ttl)
+                )
+            self._error_collection.create_indexes(indexes)
+            self._error_collection.update_many(
+                {"event_id": None, "origin_event.event_id": {"$exists": True}},
+                [{"$set": {"event_id": {"$toString": "$origin_event.event_id"}}}],
+            )
+            self._indexes_ensured = True
 
     def store_failed_produce_event(self, exception: Exception, origin_event: Dict):
         # TODO: improve that
@@ -59,27 +162,65 @@ class FailedEventManager:
 
         error_event = {
             "producer": ServiceName(origin_event["producer"]).value,
+            "event_id": origin_event["event_id"],
             "origin_event": origin_event,
-            "exception": {
-                "type": exception.__class__.__name__,
-                "message": str(exception),
-                "stack_trace": "TODO",
-            },
+            "status": "NEW",
+            "exception": build_exception_info(exception),
         }
         self._store_event(error_event)
 
     def store_failed_consume_event(self, exception: Exception, origin_event: Dict, consumer: ServiceName):
         error_event = {
             "consumer": consumer.value,
+            "event_id": str(origin_event.get("event_id")),
             "origin_event": origin_event,
             "status": "NEW",
-            "exception": {
-                "type": exception.__class__.__name__,
-                "message": str(exception),
-                "stack_trace": "TODO",
-            },
+            "retry_count": 0,
+            "exception": build_exception_info(exception),
         }
-        self._store_event(error_event)
+        with self._pending_lock:
+            self._store_event(error_event)
+            if self._pending_events is not None:
+                self._add_pending_event(error_event["_id"], get_event_entity_keys(origin_event))
+
+    def load_pending_events(self, service_name: ServiceName):
+        """Starts tracking entities with pending failed events of the consumer, called before consumption starts"""
+        pending_events = self.error_collection.find(
+            {"consumer": service_name.value, "status": "NEW"}, projection={"origin_event.data": True}
+        ).sort("_id", ASCENDING)
+        with self._pending_lock:
+            self._pending_events = {}
+            for event in pending_events:
+                self._add_pending_event(event["_id"], get_event_entity_keys(event["origin_event"]))
+
+    def has_pending_events(self, event: Dict) -> bool:
+        """Whether some entity of the event has failed events waiting for replay"""
+        if self._pending_events is None:
+            return False
+        keys = get_event_entity_keys(event)
+        with self._pending_lock:
+            return any(key in self._pending_events for key in keys)
+
+    def _add_pending_event(self, mongo_id, keys: Set[str]):
+        for key in keys:
+            self._pending_events.setdefault(key, []).append(mongo_id)
+
+    def _release_pending_event(self, mongo_id, keys: Set[str]):
+        if self._pending_events is None:
+            return
+        with self._pending_lock:
+            for key in keys:
+                mongo_ids = self._pending_events.get(key, [])
+                if mongo_id in mongo_ids:
+                    mongo_ids.remove(mongo_id)
+                if not mongo_ids:
+                    self._pending_events.pop(key, None)
+
+    def _is_first_pending_event(self, mongo_id, keys: Set[str]) -> bool:
+        if self._pending_events is None:
+            return True
+        with self._pending_lock:
+            return all(self._pending_events.get(key, [mongo_id])[0] == mongo_id for key in keys)
 
     def _store_event(self, event: Dict):
         logger.debug(f"storing event in db: {event=}")
@@ -91,23 +232,119 @@ class FailedEventManager:
     def read_produce_events_by_service(self, service_name: ServiceName) -> List[Dict]:
         return list(self.error_collection.find({"producer": service_name.value, "status": "NEW"}))
 
-    def read_consume_events_by_service(self, service_name: ServiceName) -> List[Dict]:
-        return list(self.error_collection.find({"consumer": service_name.value, "status": "NEW"}))
+    def read_consume_events_by_service(self, service_name: ServiceName) -> Iterator[Dict]:
+        """Streams NEW events of the consumer which retry time has come, in the order they were stored"""
+        query = {
+            "consumer": service_name.value,
+            "status": "NEW",
+            # matches events without `next_retry_at` as well
+            "next_retry_at": {"$not": {"$gt": datetime.utcnow()}},
+        }
+        return self.error_collection.find(query, batch_size=self.batch_size).sort("_id", ASCENDING)
 
     def mark_error_event_as_processed(self, mongo_id):
-        self.error_collection.update_one({"_id": mongo_id}, {"$set": {"status": "PROCESSED"}})
+        self.error_collection.update_one({"_id": mongo_id}, {"$set": self._build_processed_changes()})
+
+    def process_failed_events_by_consumer(
+        self, service_name: ServiceName, event_router: Dict[str, Callable]
+    ) -> ReprocessStats:
+        """Replays failed consume events, see class docs for the guarantees
+
+        Each event is claimed with its own update before its callback runs, outcomes are stored with single
+        `bulk_write` per `batch_size` events.
+        """
+        stats = ReprocessStats()
+        updates = []
+        for event in self.read_consume_events_by_service(service_name=service_name):
+            keys = get_event_entity_keys(event["origin_event"])
+            if not self._is_first_pending_event(event["_id"], keys):
+                stats.postponed += 1
+                continue
+            if not self._claim_event(event["_id"]):
+                # claimed by concurrent replay
+                continue
 
-    def process_failed_events_by_consumer(self, service_name: ServiceName, event_router: Dict[str, Callable]):
-        consume_events = self.read_consume_events_by_service(service_name=service_name)
-        for event in consume_events:
             logger.info(f"processing faield event for {service_name=}, {event=}")
-            event_name = EventManager._normilize_event_name(event["origin_event"])
-            callback = event_router[event_name]
             try:
+                event_name = EventManager._normilize_event_name(event["origin_event"])
+                callback = event_router[event_name]
                 callback(event["origin_event"])
+                updates.append(self._build_processed_update(event["_id"]))
+                stats.processed += 1
+                self._release_pending_event(event["_id"], keys)
             except Exception as e:
-                raise Exception(f"Can not reprocess {event=} due to {e=}")
-            self.mark_error_event_as_processed(event["_id"])
+                logger.exception(f"can not reprocess {event=}")
+                retry_count = event.get("retry_count", 0) + 1
+                updates.append(self._build_retry_update(event["_id"], retry_count=retry_count, exception=e))
+                if retry_count >= self.max_retries:
+                    stats.failed += 1
+                    # out of retries: later events of the entity aren't held back anymore
+                    self._release_pending_event(event["_id"], keys)
+                else:
+                    stats.retried += 1
+
+            if len(updates) >= self.batch_size:
+                self.error_collection.bulk_write(updates, ordered=False)
+                updates = []
+
+        if updates:
+            self.error_collection.bulk_write(updates, ordered=False)
+        return stats
+
+    def start_background_reprocessing(
+        self, service_name: ServiceName, event_router: Dict[str, Callable], interval: float = 60.0
+    ) -> threading.Thread:
+        """Reprocesses failed consume events every `interval` seconds in daemon thread alongside live consumption
+
+        Pending events are loaded first, so live events of their entities get parked behind them.
+        """
+        self.load_pending_events(service_name)
+        self._reprocessing_stopped.clear()
+        thread = threading.Thread(
+            target=self._run_reprocessing,
+            args=(service_name, event_router, interval),
+            name=f"{service_name.value}-failed-events",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def stop_background_reprocessing(self):
+        self._reprocessing_stopped.set()
+
+    def _run_reprocessing(self, service_name: ServiceName, event_router: Dict[str, Callable], interval: float):
+        while not self._reprocessing_stopped.is_set():
+            try:
+                stats = self.process_failed_events_by_consumer(service_name=service_name, event_router=event_router)
+                if stats.processed or stats.retried or stats.failed:
+                    logger.info(f"reprocessed failed events of {service_name=}: {stats=}")
+            except Exception:
+                logger.exception(f"failed events reprocessing of {service_name=} failed, will retry on next run")
+            self._reprocessing_stopped.wait(interval)
+
+    def _claim_event(self, mongo_id) -> bool:
+        result = self.error_collection.update_one(
+            {"_id": mongo_id, "status": "NEW"},
+            {"$set": {"status": "PROCESSING", "processing_started_at": datetime.utcnow()}},
+        )
+        return result.modified_count == 1
+
+    def _build_processed_changes(self) -> Dict:
+        # `processed_at` is the TTL index field
+        return {"status": "PROCESSED", "processed_at": datetime.utcnow()}
+
+    def _build_processed_update(self, mongo_id) -> UpdateOne:
+        return UpdateOne({"_id": mongo_id, "status": "PROCESSING"}, {"$set": self._build_processed_changes()})
+
+    def _build_retry_update(self, mongo_id, retry_count: int, exception: Exception) -> UpdateOne:
+        backoff = min(self.retry_backoff * 2 ** (retry_count - 1), self.max_retry_backoff)
+        changes = {
+            "status": "FAILED" if retry_count >= self.max_retries else "NEW",
+            "retry_count": retry_count,
+            "next_retry_at": datetime.utcnow() + timedelta(seconds=backoff),
+            "last_retry_exception": build_exception_info(exception),
+        }
+        return UpdateOne({"_id": mongo_id, "status": "PROCESSING"}, {"$set": changes})
 
 
 class EventManager:
@@ -121,62 +358,192 @@ class EventManager:
         service_name: ServiceName,
         offset_manager: OffsetLogManager,
         event_router: Optional[Dict] = None,
+        batch_event_router: Optional[Dict] = None,
+        outbox=None,
+        before_consume: Optional[Callable] = None,
     ) -> None:
         self.mq_publisher = mq_publisher
+        # `common_lib.outbox.outbox.Outbox`, if set events are written to outbox table instead of message broker
+        self.outbox = outbox
         self.event_router = event_router or {}
+        self.batch_event_router = batch_event_router or {}
         self.schema_basedir = schema_basedir
         self.failed_event_manager = failed_event_manager
         self.service_name = service_name
         self.offset_manager = offset_manager
+        # called before each consumed message or batch, e.g. django's `close_old_connections` in long running consumers
+        self.before_consume = before_consume
+        # schemas are compiled eagerly, so the first consumed events don't pay for it,
+        # only network clients(broker, mongo) connect lazily
+        self.validator_registry = get_validator_registry(schema_basedir)
+
+    def handle_message(self, channel, method, properties, body: bytes):
+        """`ConsumerConfig.callback`: decodes message and consumes its event, errors are logged"""
+        if self.before_consume:
+            self.before_consume()
+        event = self._decode_message(body)
+        if event is None:
+            return
+        try:
+            self.consume_event(event)
+        except Exception:
+            logger.exception(f"unable to consume message: {body=}")
+
+    def handle_messages(self, channel, bodies: List[bytes]):
+        """`ConsumerConfig.batch_callback`: decodes messages and consumes their events in order, errors are logged"""
+        if self.before_consume:
+            self.before_consume()
+        events = [event for event in map(self._decode_message, bodies) if event is not None]
+        try:
+            self.consume_events(events)
+        except Exception:
+            logger.exception(f"unable to consume {len(events)} messages")
+
+    def _decode_message(self, body: bytes) -> Optional[Dict]:
+        """Returns event of the message, None for messages which aren't json objects"""
+        try:
+            event = codec.loads(body)
+        except codec.JSONDecodeError as e:
+            logger.error(f"bad json data received: {e=}, {body=}")
+            return None
+        if not isinstance(event, dict) or not event:
+            logger.warning(f"unexpected json type received: {body=}")
+            return None
+        return event
 
     def consume_event(self, event: Dict):
         logger.debug(f"{event=}")
         cb = self.event_router.get(self._normilize_event_name(event))
         if cb:
             self._validate_incomming_event(event)
-            new_offset = Offset(message_id=str(event["event_id"]), created_at=parser.parse(event["event_time"]))
+            # event time is parsed once: it's both the new offset and the value compared with the current one
+            event_time = parse_datetime(event["event_time"])
+            new_offset = Offset(message_id=str(event["event_id"]), created_at=event_time)
             offset = self.offset_manager.get_offet()
 
             try:
-                if self._is_event_matches_offset(offset=offset, event=event):
-                    cb(event)
-                else:
+                if not self._is_event_matches_offset(offset=offset, event_time=event_time):
                     logger.debug(f"skipping {event} due to {offset}")
+                elif self.failed_event_manager.has_pending_events(event):
+                    # applied by failed events replay after the earlier events of its entities
+                    logger.info(f"parking {event=} behind failed events of its entities")
+                    self.failed_event_manager.store_failed_consume_event(
+                        exception=EventParkedError("earlier failed event of the entity waits for replay"),
+                        origin_event=event,
+                        consumer=self.service_name,
+                    )
+                    self.offset_manager.set_offset(new_offset, checkpoint=True)
+                else:
+                    cb(event)
             except Exception as e:
                 logger.exception(f"consume callback({cb=}) failed during {event=}")
                 self.failed_event_manager.store_failed_consume_event(
                     exception=e, origin_event=event, consumer=self.service_name
                 )
-                self.offset_manager.set_offset(new_offset)
+                # stored event is replayed from failed events, it mustn't be read from the log again
+                self.offset_manager.set_offset(new_offset, checkpoint=True)
         else:
             logger.warning(f"no callback provided for {event=} specified")
 
+    def consume_events(self, events: List[Dict]):
+        """Consumes batch of events keeping their order
+
+        Consecutive events with the same name are handed to callback from `batch_event_router` at once.
+        Batch callback must apply events atomically: if it fails, events of the batch are consumed one by one,
+        so only failed events get stored in failed events collection.
+        """
+        batch_event_name, batch = None, []
+        for event in events:
+            event_name = self._normilize_event_name(event)
+            if batch and event_name != batch_event_name:
+                self._consume_batch(batch_event_name, batch)
+                batch = []
+            batch_event_name = event_name
+            batch.append(event)
+
+        if batch:
+            self._consume_batch(batch_event_name, batch)
+
+    def _consume_batch(self, event_name: str, events: List[Dict]):
+        batch_cb = self.batch_event_router.get(event_name)
+        # events of entities with pending failed events are parked one by one
+        if batch_cb and len(events) > 1 and not any(map(self.failed_event_manager.has_pending_events, events)):
+            try:
+                for event in events:
+                    self._validate_incomming_event(event)
+                offset = self.offset_manager.get_offet()
+                events_to_handle = [
+                    event for event in events if self._is_event_matches_offset(offset, parse_datetime(event["event_time"]))
+                ]
+                if events_to_handle:
+                    batch_cb(events_to_handle)
+                logger.debug(f"skipped {len(events) - len(events_to_handle)} events due to {offset}")
+                return
+            except Exception:
+                logger.exception(f"batch callback({batch_cb=}) failed, consuming {len(events)} events one by one")
+
+        for event in events:
+            try:
+                self.consume_event(event)
+            except Exception:
+                logger.exception(f"unable to consume {event=}")
+
     def send_event(self, event: CUDEvent):
+        """Publishes event, with outbox set it's written in caller's transaction and published by `OutboxRelay`"""
+        if self.outbox is not None:
+            self.send_events([event])
+            return
+
+        body = asdict(event)
         try:
             logger.debug(f"sending: {event=}")
-            self._validate_event(event)
-            self.mq_publisher.publish(body=asdict(event))
+            self._validate_event(event, body)
+            self.mq_publisher.publish(body=body)
         except Exception as e:
             logger.exception(f"unable to send {event=}")
-            self.failed_event_manager.store_failed_produce_event(exception=e, origin_event=asdict(event))
+            self.failed_event_manager.store_failed_produce_event(exception=e, origin_event=body)
+
+    def send_events(self, events: List[CUDEvent]):
+        """Sends events in their order, with outbox set they're written with single bulk insert
+
+        Outbox write errors are raised, so caller's transaction is rolled back together with the events.
+        """
+        if self.outbox is None:
+            for event in events:
+                self.send_event(event)
+            return
+
+        bodies = []
+        for event in events:
+            body = asdict(event)
+            try:
+                logger.debug(f"sending to outbox: {event=}")
+                self._validate_event(event, body)
+                bodies.append(body)
+            except Exception as e:
+                logger.exception(f"unable to send {event=}")
+                self.failed_event_manager.store_failed_produce_event(exception=e, origin_event=body)
+        if bodies:
+            self.outbox.add_many(bodies)
 
     # TODO: create 1 validation method instead of 2
-    def _validate_event(self, event: CUDEvent):
-        """Validates outcomming event againts schema based on event name and event version. Raises expetion on invalid event"""
+    def _validate_event(self, event: CUDEvent, body: Dict):
+        """
+        Validates outcomming event againts schema based on event name and event version. Raises expetion on invalid event
+
+        `body` is `asdict(event)` built once by caller and reused for publishing.
+        """
         # validate producer name value
         ServiceName(event.producer)
 
         # validate event data  against schema
         domain = self._get_domain_by_producer_name(event.producer)
-        schema_path = os.path.join(
-            self.schema_basedir,
-            f"schema/{domain}/{event.event_name}/{event.version}.json",
+        self.validator_registry.validate(
+            domain=domain, event_name=event.event_name, version=event.version, data=body
         )
-        validator = Validator(schema_path=schema_path)
-        validator.validate(data=asdict(event))
 
         # check schema cache metrics
-        logger.debug(f"cache usage stats: {get_schema.cache_info()=}")
+        logger.debug(f"validator registry stats: {self.validator_registry.stats=}")
 
     def _validate_incomming_event(self, event: Dict):
         """
@@ -186,10 +553,8 @@ class EventManager:
         domain = self._get_domain_by_producer_name(event["producer"])
         event_version = event.get("event_version") or event.get("version")
         event_name = self._normilize_event_name(event)
-        schema_path = os.path.join(self.schema_basedir, f"schema/{domain}/{event_name}/{event_version}.json")
-        validator = Validator(schema_path=schema_path)
-        validator.validate(data=event)
-        logger.debug(f"cache usage: {get_schema.cache_info()=}")
+        self.validator_registry.validate(domain=domain, event_name=event_name, version=event_version, data=event)
+        logger.debug(f"validator registry stats: {self.validator_registry.stats=}")
 
     @classmethod
     def _normilize_event_name(cls, event: Dict) -> str:
@@ -215,11 +580,10 @@ class EventManager:
             return domain
         raise ValueError(f"Unknown {producer=}")
 
-    def _is_event_matches_offset(self, offset: Optional[Offset], event: Dict) -> bool:
+    def _is_event_matches_offset(self, offset: Optional[Offset], event_time: datetime) -> bool:
         # ready all data from distr log since offset is empty
         if not offset:
             return True
 
         # TODO: add proper TZ handling
-        event_time = parser.parse(event["event_time"]).replace(tzinfo=None)
-        return event_time > offset.created_at.replace(tzinfo=None)
+        return event_time.replace(tzinfo=None) > offset.created_at.replace(tzinfo=None)
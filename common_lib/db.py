@@ -0,0 +1,57 @@
+"""
+Database settings shared by services
+
+Settings modules call these helpers instead of repeating the same environment parsing.
+"""
+import os
+from pathlib import Path
+from typing import Dict
+
+
+def get_databases() -> Dict:
+    """`DATABASES` setting: postgres is used once POSTGRES_DB is set, sqlite file from SQLITE_DB_PATH otherwise"""
+    if os.getenv("POSTGRES_DB"):
+        return {
+            "default": {
+                "ENGINE": "django.db.backends.postgresql",
+                "NAME": os.environ["POSTGRES_DB"],
+                "USER": os.getenv("POSTGRES_USER", "postgres"),
+                "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+                "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+                "PORT": os.getenv("POSTGRES_PORT", "5432"),
+                # persistent connection per thread: web and consumer worker threads reuse their connections,
+                # max connections of a process = its threads amount, put pgbouncer in front for more processes
+                "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 600)),
+                "OPTIONS": {"connect_timeout": int(os.getenv("POSTGRES_CONNECT_TIMEOUT", 5))},
+            }
+        }
+    db_path = Path(os.environ["SQLITE_DB_PATH"])
+    # with the performance profile every atomic block of services waits for write lock on BEGIN instead of failing
+    # with SQLITE_BUSY on deferred lock upgrade(busy_timeout doesn't apply to it), see common_lib/sqlite/base.py
+    default_transaction_mode = "IMMEDIATE" if is_sqlite_performance_profile() else "DEFERRED"
+    return {
+        "default": {
+            "ENGINE": "common_lib.sqlite",
+            "NAME": str(db_path),
+            "OPTIONS": {"transaction_mode": os.getenv("SQLITE_TRANSACTION_MODE", default_transaction_mode)},
+            # file instead of in-memory test database, so tests may write from several threads
+            "TEST": {"NAME": str(db_path.with_name(f"test_{db_path.name}"))},
+        }
+    }
+
+
+def get_sqlite_pragmas() -> Dict:
+    """`SQLITE_PRAGMAS` setting: opt-in profile enabled with SQLITE_PERFORMANCE_PROFILE=1"""
+    if not is_sqlite_performance_profile():
+        return {}
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),  # ms
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),  # bytes
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64000)),  # negative value is size in KiB
+    }
+
+
+def is_sqlite_performance_profile() -> bool:
+    return os.getenv("SQLITE_PERFORMANCE_PROFILE") == "1"
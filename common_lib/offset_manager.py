@@ -1,8 +1,14 @@
+import logging
+import threading
 from dataclasses import asdict, dataclass
 from datetime import datetime
 from typing import Optional
 from pymongo.collection import Collection
-from pymongo.mongo_client import MongoClient
+
+from common_lib.clients import get_mongo_client
+
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -16,11 +22,32 @@ class OffsetLogManager:
     Handles distributed log offset
 
     Responisble for storing current offset and recovering from last known one.
+
+    Current offset lives in memory: it's loaded from db once and checkpointed to db by background thread
+    every `checkpoint_every` offset updates, every `checkpoint_interval` seconds and on `close()`.
+
+    Crash recovery: db keeps the last checkpointed offset only. If process gets killed between checkpoints
+    offset updates made after the last checkpoint are lost, so the events behind them are read from the
+    distributed log again after restart(at-least-once delivery). Offset never gets ahead of processed events.
+
+    Offsets of failed and parked events are checkpointed synchronously(`set_offset(..., checkpoint=True)`):
+    such event is already stored for replay, and reading it from the log again after restart would apply it
+    twice. Only a crash between storing the event and its checkpoint leaves that window open.
     """
 
-    def __init__(self, collection: Collection) -> None:
+    def __init__(self, collection: Collection, checkpoint_every: int = 100, checkpoint_interval: float = 5.0) -> None:
         self._collection = collection
         self._record_id = 1  # single counter value
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+
+        self._offset: Optional[Offset] = None
+        self._is_loaded = False
+        self._pending_updates = 0
+        self._lock = threading.Lock()
+        self._checkpoint_requested = threading.Event()
+        self._closed = threading.Event()
+        self._checkpoint_thread: Optional[threading.Thread] = None
 
     @classmethod
     def build(
@@ -28,17 +55,74 @@ class OffsetLogManager:
         mongo_dsn: str,
         db_name: str,
         collection_name: str,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 5.0,
     ) -> "OffsetLogManager":
-        collection = MongoClient(mongo_dsn)[db_name][collection_name]
-        return cls(collection=collection)
+        collection = get_mongo_client(mongo_dsn)[db_name][collection_name]
+        return cls(collection=collection, checkpoint_every=checkpoint_every, checkpoint_interval=checkpoint_interval)
 
-    def set_offset(self, offset: Offset):
-        """Stores current offset in db"""
-        doc = {**asdict(offset), "_id": self._record_id}
-        self._collection.update_one({"_id": self._record_id}, {"$set": doc}, upsert=True)
+    def set_offset(self, offset: Offset, checkpoint: bool = False):
+        """Sets current offset, it gets stored in db on next checkpoint or right away with `checkpoint=True`"""
+        self._ensure_loaded()
+        with self._lock:
+            self._offset = offset
+            self._pending_updates += 1
+            is_checkpoint_needed = self._pending_updates >= self.checkpoint_every
+        if checkpoint:
+            self.checkpoint()
+        elif is_checkpoint_needed:
+            self._checkpoint_requested.set()
 
     def get_offet(self) -> Optional[Offset]:
-        """Gets current offset from db"""
-        doc = self._collection.find_one({"_id": self._record_id}, projection={"_id": 0})
-        if doc:
-            return Offset(**doc)
+        """Gets current offset"""
+        self._ensure_loaded()
+        return self._offset
+
+    def checkpoint(self):
+        """Stores current offset in db if it was changed since last checkpoint"""
+        with self._lock:
+            offset, pending_updates = self._offset, self._pending_updates
+            self._pending_updates = 0
+        if not pending_updates:
+            return
+
+        try:
+            doc = {**asdict(offset), "_id": self._record_id}
+            self._collection.update_one({"_id": self._record_id}, {"$set": doc}, upsert=True)
+            logger.debug(f"stored {offset=} after {pending_updates} updates")
+        except Exception:
+            with self._lock:
+                self._pending_updates += pending_updates
+            raise
+
+    def close(self):
+        """Stops background checkpoints and stores current offset"""
+        self._closed.set()
+        self._checkpoint_requested.set()
+        if self._checkpoint_thread:
+            self._checkpoint_thread.join()
+        self.checkpoint()
+
+    def _ensure_loaded(self):
+        if self._is_loaded:
+            return
+        with self._lock:
+            if self._is_loaded:
+                return
+            doc = self._collection.find_one({"_id": self._record_id}, projection={"_id": 0})
+            if doc:
+                self._offset = Offset(**doc)
+            self._is_loaded = True
+            logger.info(f"loaded offset: {self._offset=}")
+
+            self._checkpoint_thread = threading.Thread(target=self._run_checkpoints, name="offset-checkpoint", daemon=True)
+            self._checkpoint_thread.start()
+
+    def _run_checkpoints(self):
+        while not self._closed.is_set():
+            self._checkpoint_requested.wait(self.checkpoint_interval)
+            self._checkpoint_requested.clear()
+            try:
+                self.checkpoint()
+            except Exception:
+                logger.exception("offset checkpoint failed, will retry on next one")
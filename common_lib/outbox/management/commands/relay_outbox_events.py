@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common_lib.outbox.outbox import OutboxRelay
+
+
+class Command(BaseCommand):
+    help = "Publishes events stored in transactional outbox to message broker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "OUTBOX_RELAY_BATCH_SIZE", 500),
+            help="Max amount of events claimed, published and confirmed at once",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=getattr(settings, "OUTBOX_RELAY_POLL_INTERVAL", 0.5),
+            help="Seconds to wait for new events once outbox is drained",
+        )
+        parser.add_argument(
+            "--confirm-timeout",
+            type=float,
+            default=getattr(settings, "OUTBOX_RELAY_CONFIRM_TIMEOUT", 30.0),
+            help="Seconds to wait for broker confirms of a batch, not confirmed events are relayed again",
+        )
+
+    def handle(self, *args, **options):
+        relay = OutboxRelay(
+            dsn=settings.RABBITMQ_DSN,
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            confirm_timeout=options["confirm_timeout"],
+        )
+        try:
+            relay.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            relay.close()
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:05
+
+import common_lib.outbox.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('exchange_name', models.CharField(max_length=255)),
+                ('body', models.JSONField(encoder=common_lib.outbox.models.EventJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
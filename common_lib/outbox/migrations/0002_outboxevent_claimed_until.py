@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='claimed_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
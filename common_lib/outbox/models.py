@@ -0,0 +1,24 @@
+import json
+
+from django.db import models
+
+
+class EventJSONEncoder(json.JSONEncoder):
+    """Encodes event body the same way `RabbitMQPublisher` does, so relayed events match directly published ones"""
+
+    def default(self, o):
+        return str(o)
+
+
+class OutboxEvent(models.Model):
+    """Event waiting to be published by `OutboxRelay`, written in the same transaction as the business change"""
+
+    id = models.BigAutoField(primary_key=True)
+    exchange_name = models.CharField(max_length=255)
+    body = models.JSONField(encoder=EventJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # set while relay waits for broker confirms, expired claim(e.g. of killed relay) lets the event be relayed again
+    claimed_until = models.DateTimeField(null=True)
+
+    def __str__(self) -> str:
+        return f"<OutboxEvent(id={self.id}, exchange_name={self.exchange_name})>"
@@ -0,0 +1,134 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+from logging import getLogger
+from typing import Dict, Iterable, List, Set
+
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from common_lib.clients import get_publisher, reset_publisher
+from common_lib.outbox.models import OutboxEvent
+from common_lib.rabbit import BatchRabbitMQPublisher
+
+
+logger = getLogger(__name__)
+
+
+class Outbox:
+    """
+    Transactional outbox of one exchange
+
+    Events are stored in db in caller's transaction instead of being published to message broker,
+    so they are published only if business change got committed, and request doesn't wait for broker I/O.
+    """
+
+    def __init__(self, exchange_name: str, batch_size: int = 500) -> None:
+        self.exchange_name = exchange_name
+        self.batch_size = batch_size
+
+    def add_many(self, bodies: Iterable[Dict]) -> List[OutboxEvent]:
+        events = [OutboxEvent(exchange_name=self.exchange_name, body=body) for body in bodies]
+        return OutboxEvent.objects.bulk_create(events, batch_size=self.batch_size)
+
+
+class OutboxRelay:
+    """
+    Drains outbox table to message broker in batches
+
+    Each batch is claimed in short transaction, published with broker confirms and deleted once confirmed,
+    so no db transaction is held while waiting for the broker. Claim expires after `claim_timeout` seconds,
+    so events of killed relay are relayed again. The first not confirmed event of an exchange and all events
+    of the exchange after it are released, so the next batch relays them again in insertion order.
+
+    Delivery is at-least-once: event is published again if relay dies between the confirm and the delete,
+    and events confirmed after a not confirmed one are published again after it. Claimed rows are
+    skipped(where db supports it), so extra relay doesn't block the running one, but single relay per service
+    keeps events order.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        batch_size: int = 500,
+        poll_interval: float = 0.5,
+        confirm_timeout: float = 30.0,
+        claim_timeout: float = 60.0,
+    ) -> None:
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.confirm_timeout = confirm_timeout
+        self.claim_timeout = max(claim_timeout, confirm_timeout)
+        self._exchange_names: Set[str] = set()
+
+    def run(self):
+        """Relays events until interrupted, sleeps `poll_interval` seconds once outbox is drained"""
+        while True:
+            close_old_connections()
+            try:
+                relayed_count = self.relay_batch()
+            except Exception:
+                logger.exception("outbox relay failed, will retry")
+                self.close()
+                relayed_count = 0
+
+            if relayed_count < self.batch_size:
+                time.sleep(self.poll_interval)
+
+    def relay_batch(self) -> int:
+        """Publishes up to `batch_size` oldest events, deletes confirmed ones and returns their count"""
+        events = self._claim_batch()
+        if not events:
+            return 0
+
+        events_by_exchange: Dict[str, List[OutboxEvent]] = defaultdict(list)
+        for event in events:
+            events_by_exchange[event.exchange_name].append(event)
+        confirmations = [
+            (exchange_events, self._get_publisher(exchange_name).publish_confirmed([e.body for e in exchange_events]))
+            for exchange_name, exchange_events in events_by_exchange.items()
+        ]
+
+        deadline = time.monotonic() + self.confirm_timeout
+        acked_ids, unacked_ids = [], []
+        for exchange_events, confirmation in confirmations:
+            acked = confirmation.wait(timeout=max(deadline - time.monotonic(), 0))
+            self._get_publisher(exchange_events[0].exchange_name).discard(confirmation)
+            # events after the first not confirmed one are relayed again after it, so consumers keep the order
+            confirmed_count = next((index for index, is_acked in enumerate(acked) if not is_acked), len(acked))
+            acked_ids.extend(event.id for event in exchange_events[:confirmed_count])
+            unacked_ids.extend(event.id for event in exchange_events[confirmed_count:])
+
+        OutboxEvent.objects.filter(id__in=acked_ids).delete()
+        if unacked_ids:
+            logger.warning(f"{len(unacked_ids)} events were not confirmed by broker or follow not confirmed ones, will retry")
+            OutboxEvent.objects.filter(id__in=unacked_ids).update(claimed_until=None)
+        if acked_ids:
+            logger.debug(f"relayed {len(acked_ids)} events, last {events[-1].id=}")
+        return len(acked_ids)
+
+    def close(self):
+        """Closes broker connections, next batch connects again"""
+        exchange_names, self._exchange_names = self._exchange_names, set()
+        for exchange_name in exchange_names:
+            reset_publisher(exchange_name=exchange_name, dsn=self.dsn)
+
+    def _claim_batch(self) -> List[OutboxEvent]:
+        with transaction.atomic():
+            now = timezone.now()
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+                .order_by("id")[: self.batch_size]
+            )
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+                claimed_until=now + timedelta(seconds=self.claim_timeout)
+            )
+        return events
+
+    def _get_publisher(self, exchange_name: str) -> BatchRabbitMQPublisher:
+        """Process wide publisher of the exchange, see `common_lib.clients`"""
+        self._exchange_names.add(exchange_name)
+        return get_publisher(exchange_name=exchange_name, dsn=self.dsn, batch_size=self.batch_size)
@@ -0,0 +1,32 @@
+"""
+Keyset pagination query params shared by list views
+"""
+from typing import Mapping, Optional, Tuple
+
+
+class InvalidPageParams(ValueError):
+    """Page query params aren't valid, views respond with 400"""
+
+
+def _parse_int(params: Mapping[str, str], name: str) -> Optional[int]:
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidPageParams(f"`{name}` must be integer, got {value!r}")
+
+
+def parse_page_params(params: Mapping[str, str], default_limit: int, max_limit: int) -> Tuple[Optional[int], int]:
+    """Reads `cursor` and `limit` query params, returns (cursor, limit)
+
+    Limit is clamped to 1..`max_limit`, so page always moves the cursor forward. Cursor is id of the last record
+    from previous page. Non integer values and negative cursor raise `InvalidPageParams`.
+    """
+    cursor = _parse_int(params, "cursor")
+    if cursor is not None and cursor < 0:
+        raise InvalidPageParams(f"`cursor` must not be negative, got {cursor}")
+    limit = _parse_int(params, "limit")
+    limit = default_limit if limit is None else limit
+    return cursor, max(1, min(limit, max_limit))
@@ -1,21 +1,36 @@
-import json
+"""
+RabbitMQ publishers and consumer
+
+Services don't publish from request handlers: views and event handlers write events to the outbox table in
+their db transaction and `relay_outbox_events` command publishes them(see `common_lib.outbox`), so async views
+have nothing to publish and there are no asyncio variants of the publisher and consumer.
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass, field
 from functools import partial
 from logging import getLogger
-from typing import Callable, Dict, List
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
 
 import pika
 import pika.channel
 
+from common_lib import codec
+
 logger = getLogger(__name__)
 
 
 class RabbitMQPublisher:
+    """Blocking publisher, it connects on first publish"""
+
     def __init__(self, exchange_name: str, dsn: str) -> None:
         self.exchange_name = exchange_name
         self.dsn = dsn
         self.exchange_type = "fanout"
-        self.channel = self.connect()
+        self.channel: Optional[pika.adapters.blocking_connection.BlockingChannel] = None
 
     def connect(self):
         connection = pika.BlockingConnection(pika.URLParameters(self.dsn))
@@ -24,16 +39,277 @@ class RabbitMQPublisher:
         return channel
 
     def publish(self, body: Dict):
-        if self.channel.is_closed():
+        if self.channel is None:
+            self.channel = self.connect()
+        elif self.channel.is_closed:
             logger.warning("reconnecting")
             self.channel = self.connect()
 
         return self.channel.basic_publish(
             exchange=self.exchange_name,
-            body=json.dumps(body, default=str).encode("utf-8"),
+            body=codec.dumps(body),
             routing_key="",
         )
 
+    def close(self):
+        try:
+            if self.channel and self.channel.connection.is_open:
+                self.channel.connection.close()
+        except Exception:
+            logger.exception(f"unable to close connection of {self.exchange_name=}")
+
+
+class PublishConfirmation:
+    """Broker confirms of events published together by `BatchRabbitMQPublisher.publish_confirmed`"""
+
+    def __init__(self, size: int) -> None:
+        self.acked: List[Optional[bool]] = [None] * size  # None until broker answers
+        self._pending = size
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not size:
+            self._done.set()
+
+    def set_result(self, index: int, is_acked: bool):
+        with self._lock:
+            if self.acked[index] is not None:
+                return
+            self.acked[index] = is_acked
+            self._pending -= 1
+            if not self._pending:
+                self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> List[bool]:
+        """Waits for all confirms, returns per event whether it was acked. Not confirmed in time events are False"""
+        self._done.wait(timeout)
+        with self._lock:
+            return [bool(is_acked) for is_acked in self.acked]
+
+
+class BatchRabbitMQPublisher:
+    """
+    Buffers events and publishes them in batches with asynchronous publisher confirms
+
+    Batch gets flushed once `batch_size` events are buffered or every `flush_interval` seconds.
+    Broker confirms are tracked in background io thread, nacked(or lost due to closed connection) events
+    are reported via `on_nack(exception=..., origin_event=...)` callback,
+    e.g. `FailedEventManager.store_failed_produce_event`.
+    `publish_confirmed` publishes events right away and lets caller wait for their confirms,
+    e.g. to delete them from outbox once broker took them.
+
+    Note: events buffered but not flushed yet are lost if process gets killed.
+    """
+
+    def __init__(
+        self,
+        exchange_name: str,
+        dsn: str,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        on_nack: Optional[Callable] = None,
+        reconnect_delay: float = 1.0,
+    ) -> None:
+        self.exchange_name = exchange_name
+        self.dsn = dsn
+        self.exchange_type = "fanout"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_nack = on_nack
+        self.reconnect_delay = reconnect_delay
+
+        self.published_count = 0
+        self.confirmed_count = 0
+        self.nacked_count = 0
+
+        # (event body, confirmation, index of the event in confirmation)
+        self._buffer: List[Tuple[Dict, Optional[PublishConfirmation], int]] = []
+        self._buffer_lock = threading.Lock()
+        self._unconfirmed: Dict[int, Tuple[Dict, Optional[PublishConfirmation], int]] = {}  # delivery_tag -> item
+        self._delivery_tag = 0
+        self._connection: Optional[pika.SelectConnection] = None
+        self._channel: Optional[pika.channel.Channel] = None
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name=f"publisher-{exchange_name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def publish(self, body: Dict):
+        with self._buffer_lock:
+            self._buffer.append((body, None, 0))
+            is_full = len(self._buffer) >= self.batch_size
+        if is_full:
+            self.flush()
+
+    def publish_confirmed(self, bodies: List[Dict]) -> PublishConfirmation:
+        """Publishes events with the next flush, returned confirmation tells which of them were acked by broker
+
+        Events aren't reported to `on_nack`: caller decides what to do with not acked ones.
+        """
+        confirmation = PublishConfirmation(len(bodies))
+        with self._buffer_lock:
+            self._buffer.extend((body, confirmation, index) for index, body in enumerate(bodies))
+        self.flush()
+        return confirmation
+
+    def discard(self, confirmation: PublishConfirmation):
+        """Drops events of the confirmation which aren't published yet, e.g. once caller stopped waiting for them"""
+        with self._buffer_lock:
+            self._buffer = [item for item in self._buffer if item[1] is not confirmation]
+
+    def flush(self):
+        """Schedules publishing of buffered events, doesn't wait for broker confirms"""
+        connection = self._connection
+        if connection and connection.is_open:
+            connection.ioloop.add_callback_threadsafe(self._publish_buffered)
+
+    def close(self, timeout: float = 5.0):
+        """Flushes buffered events, waits for pending confirms and closes the connection"""
+        if self._closing:
+            return
+        self._closing = True
+        connection = self._connection
+        if connection and connection.is_open:
+            deadline = time.monotonic() + timeout
+            connection.ioloop.add_callback_threadsafe(partial(self._close_when_confirmed, deadline=deadline))
+        self._thread.join(timeout)
+
+    def _run(self):
+        """Io thread: keeps connection open until publisher gets closed"""
+        while not self._closing:
+            self._connection = pika.SelectConnection(
+                pika.URLParameters(self.dsn),
+                on_open_callback=self._on_connected,
+                on_open_error_callback=self._on_connection_closed,
+                on_close_callback=self._on_connection_closed,
+            )
+            self._connection.ioloop.start()
+            self._channel = None
+            self._fail_unconfirmed(ConnectionError("connection closed before publish confirmation"))
+            if not self._closing:
+                logger.warning(f"reconnecting publisher for {self.exchange_name=}")
+                time.sleep(self.reconnect_delay)
+
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+        for item in batch:
+            self._report_nack(ConnectionError("publisher closed before event was published"), item)
+
+    def _on_connected(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_closed(self, connection, reason):
+        logger.debug(f"publisher connection closed: {reason=}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel: pika.channel.Channel):
+        self._delivery_tag = 0
+        channel.exchange_declare(
+            exchange=self.exchange_name,
+            exchange_type=self.exchange_type,
+            callback=partial(self._on_exchange_declared, channel=channel),
+        )
+
+    def _on_exchange_declared(self, frame, channel: pika.channel.Channel):
+        channel.confirm_delivery(ack_nack_callback=self._on_delivery_confirmation)
+        self._channel = channel
+        self._on_flush_timer()
+
+    def _on_flush_timer(self):
+        self._publish_buffered()
+        if not self._closing:
+            self._connection.ioloop.call_later(self.flush_interval, self._on_flush_timer)
+
+    def _publish_buffered(self):
+        if not self._channel or not self._channel.is_open:
+            return
+
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+
+        for item in batch:
+            self._channel.basic_publish(
+                exchange=self.exchange_name,
+                body=codec.dumps(item[0]),
+                routing_key="",
+            )
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = item
+        self.published_count += len(batch)
+        if batch:
+            logger.debug(f"published {len(batch)} events, {len(self._unconfirmed)} waiting for confirmation")
+
+    def _on_delivery_confirmation(self, method_frame):
+        method = method_frame.method
+        if method.multiple:
+            delivery_tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        else:
+            delivery_tags = [method.delivery_tag]
+
+        is_nack = isinstance(method, pika.spec.Basic.Nack)
+        for delivery_tag in delivery_tags:
+            item = self._unconfirmed.pop(delivery_tag, None)
+            if item is None:
+                continue
+            if is_nack:
+                self._report_nack(ConnectionError("event was nacked by broker"), item)
+            else:
+                self.confirmed_count += 1
+                _, confirmation, index = item
+                if confirmation:
+                    confirmation.set_result(index, True)
+
+    def _fail_unconfirmed(self, exception: Exception):
+        unconfirmed, self._unconfirmed = self._unconfirmed, {}
+        for item in unconfirmed.values():
+            self._report_nack(exception, item)
+
+    def _report_nack(self, exception: Exception, item: Tuple[Dict, Optional[PublishConfirmation], int]):
+        body, confirmation, index = item
+        self.nacked_count += 1
+        if confirmation:
+            confirmation.set_result(index, False)
+            return
+
+        logger.error(f"event was not confirmed by broker: {exception=}, {body=}")
+        if self.on_nack:
+            try:
+                self.on_nack(exception=exception, origin_event=body)
+            except Exception:
+                logger.exception(f"on_nack callback failed for {body=}")
+
+    def _close_when_confirmed(self, deadline: float):
+        self._publish_buffered()
+        if self._unconfirmed and time.monotonic() < deadline:
+            self._connection.ioloop.call_later(0.05, partial(self._close_when_confirmed, deadline=deadline))
+            return
+        self._connection.close()
+
+
+def get_event_partition_key(body: bytes) -> str:
+    """Takes entity id from event data: events of the same entity are handled in order by the same worker
+
+    Events without entity id get empty key and are handled by the same worker. Streams with events referencing
+    several entities(e.g. `tasks_assigned` of task stream) need `single_partition_key` instead.
+    """
+    try:
+        data = codec.loads(body).get("data") or {}
+    except (ValueError, AttributeError):
+        return ""
+
+    for key in ("id", "public_id", "account_public_id"):
+        if data.get(key) is not None:
+            return str(data[key])
+    return ""
+
+
+def single_partition_key(body: bytes) -> str:
+    """Handles all messages of the queue by one worker in delivery order
+
+    Is used for task stream: `tasks_assigned` carries many tasks, keying it by one of them would let it run
+    before `task_created` or after `task_completed` of other tasks handled by other workers.
+    """
+    return ""
+
 
 @dataclass
 class ConsumerConfig:
@@ -43,38 +319,173 @@ class ConsumerConfig:
     exchange_type: str = "fanout"
     # see more https://www.rabbitmq.com/streams.html
     queue_arguments: dict = field(default_factory=lambda: {"x-queue-type": "stream"})
-    queue_consume_arguments: dict = field(default_factory=lambda: {"x-stream-offset": "first", "prefetch-count": 10})
+    queue_consume_arguments: dict = field(default_factory=lambda: {"x-stream-offset": "first"})
+    # max amount of unacked messages delivered to the consumer
+    prefetch_count: int = 100
+    # messages are acked cumulatively once `ack_batch_size` handlers succeeded or every `ack_interval` seconds
+    ack_batch_size: int = 20
+    ack_interval: float = 1.0
+    # if set, handled messages are passed to `batch_callback(channel, bodies)` at once right before the ack
+    batch_callback: Optional[Callable] = None
+    # in workers mode messages with the same key are handled by the same worker in delivery order
+    partition_key: Callable[[bytes], str] = get_event_partition_key
 
     def __hash__(self) -> int:
         return hash(self.exchange) + hash(self.queue)
 
 
+@dataclass
+class ConsumerStats:
+    """Per queue ack state and throughput counters"""
+
+    last_delivery_tag: int = 0  # last successfully handled, not acked yet message
+    unacked_count: int = 0
+    pending_bodies: List[bytes] = field(default_factory=list)  # messages waiting for batch callback
+    in_flight_tags: Deque[int] = field(default_factory=deque)  # messages dispatched to workers in delivery order
+    done_tags: Set[int] = field(default_factory=set)  # messages handled by workers out of delivery order
+    processed_count: int = 0
+    window_processed_count: int = 0
+    window_started_at: float = field(default_factory=time.monotonic)
+
+
+def log_consumer_stats(consumer_stats: Dict[ConsumerConfig, ConsumerStats]):
+    """Logs throughput of each queue since previous call"""
+    now = time.monotonic()
+    for consumer, stats in consumer_stats.items():
+        elapsed = now - stats.window_started_at
+        rate = stats.window_processed_count / elapsed if elapsed else 0
+        logger.info(
+            f"{consumer.queue=}: {stats.window_processed_count} messages in {elapsed:.1f}s ({rate:.1f} msg/s), "
+            f"{stats.processed_count} total, {stats.unacked_count} waiting for ack"
+        )
+        stats.window_processed_count = 0
+        stats.window_started_at = now
+
+
 class RabbitMQMultiConsumer:
-    """Allows to attach multiple consumers for multiple exchange/queue pairs"""
+    """Allows to attach multiple consumers for multiple exchange/queue pairs
+
+    By default messages are handled in the ioloop thread. With `workers > 0` the ioloop thread only receives
+    and acks messages, handlers run in worker threads: messages are spread across workers by
+    `ConsumerConfig.partition_key`, so messages of the same entity are handled in delivery order.
+    Messages are acked once all previous messages of the queue are handled. Handlers are expected to
+    handle their errors, failed handler is logged and its message is acked anyway.
+    """
 
     def __init__(
         self,
         dsn: str,
         consumers: List[ConsumerConfig] = None,
         auto_ack: bool = False,
+        stats_interval: float = 60.0,
+        workers: int = 0,
     ) -> None:
         self.dsn = dsn
         self.consumers = consumers or []
         self._connections: Dict[ConsumerConfig, pika.channel.Channel] = {}
+        self._stats: Dict[ConsumerConfig, ConsumerStats] = {}
         self.auto_ack = auto_ack
-        self._prefetch_default = 1
+        self.stats_interval = stats_interval
+        self.workers = workers
+        self._worker_queues: List[queue.Queue] = []
+        self._worker_threads: List[threading.Thread] = []
+        self._connection: Optional[pika.SelectConnection] = None
 
     def listen(self):
         """Run infinite event loop with scheduler consumers"""
+        self._start_workers()
         connection = self._connect()
         try:
             connection.ioloop.start()
         except (KeyboardInterrupt, Exception):
+            self._stop_workers()
+            self._ack_all()
             connection.close()
 
+    def _start_workers(self):
+        for worker_id in range(self.workers):
+            worker_queue = queue.Queue()
+            thread = threading.Thread(target=self._run_worker, args=(worker_queue,), name=f"consumer-worker-{worker_id}")
+            thread.daemon = True
+            thread.start()
+            self._worker_queues.append(worker_queue)
+            self._worker_threads.append(thread)
+
+    def _stop_workers(self, timeout: float = 10.0):
+        for worker_queue in self._worker_queues:
+            worker_queue.put(None)
+        for thread in self._worker_threads:
+            thread.join(timeout)
+
+    def _run_worker(self, worker_queue: queue.Queue):
+        """Worker thread: handles messages in the order they were dispatched to the worker"""
+        while True:
+            item = worker_queue.get()
+            if item is None:
+                return
+
+            # take messages dispatched while the worker was busy, so batch callbacks get whole batch
+            items = [item]
+            while len(items) < item[0].ack_batch_size:
+                try:
+                    next_item = worker_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    worker_queue.put(None)
+                    break
+                items.append(next_item)
+
+            self._handle_worker_items(items)
+
+    def _handle_worker_items(self, items: List):
+        """Handles messages of one worker, consecutive messages of the same consumer are handled as a batch"""
+        while items:
+            consumer = items[0][0]
+            batch = []
+            while items and items[0][0] is consumer:
+                batch.append(items.pop(0))
+
+            channel = self._connections[consumer]
+            try:
+                if consumer.batch_callback:
+                    consumer.batch_callback(channel, [body for _, _, _, body in batch])
+                else:
+                    for _, method, properties, body in batch:
+                        consumer.callback(channel, method, properties, body)
+            except Exception:
+                logger.exception(f"handler failed in worker for {consumer.queue=}")
+
+            delivery_tags = [method.delivery_tag for _, method, _, _ in batch]
+            self._connection.ioloop.add_callback_threadsafe(
+                partial(self._on_worker_done, consumer=consumer, delivery_tags=delivery_tags)
+            )
+
+    def _dispatch_to_worker(self, consumer: ConsumerConfig, method, properties, body):
+        stats = self._stats[consumer]
+        stats.in_flight_tags.append(method.delivery_tag)
+        worker_id = hash(consumer.partition_key(body)) % self.workers
+        self._worker_queues[worker_id].put((consumer, method, properties, body))
+
+    def _on_worker_done(self, consumer: ConsumerConfig, delivery_tags: List[int]):
+        """Called in ioloop thread, moves ack position up to the last message handled together with previous ones"""
+        stats = self._stats[consumer]
+        stats.done_tags.update(delivery_tags)
+        stats.processed_count += len(delivery_tags)
+        stats.window_processed_count += len(delivery_tags)
+        while stats.in_flight_tags and stats.in_flight_tags[0] in stats.done_tags:
+            delivery_tag = stats.in_flight_tags.popleft()
+            stats.done_tags.discard(delivery_tag)
+            stats.last_delivery_tag = delivery_tag
+            stats.unacked_count += 1
+
+        if stats.unacked_count >= consumer.ack_batch_size:
+            self._ack_pending(consumer)
+
     def _connect(self):
         parameters = pika.URLParameters(self.dsn)
         connection = pika.SelectConnection(parameters=parameters, on_open_callback=self._on_connected)
+        self._connection = connection
         return connection
 
     def _on_connected(self, connection):
@@ -82,6 +493,7 @@ class RabbitMQMultiConsumer:
         for consumer in self.consumers:
             logger.debug(f"creating channel for {consumer=}")
             connection.channel(on_open_callback=partial(self._on_channel_open, consumer=consumer))
+        connection.ioloop.call_later(self.stats_interval, partial(self._log_stats, connection=connection))
 
     def _on_qos_setup(self, method, consumer: ConsumerConfig):
         self._connections[consumer].exchange_declare(
@@ -102,20 +514,70 @@ class RabbitMQMultiConsumer:
         if consumer in self._connections:
             raise ValueError(f"Consumer should be added once: {consumer}")
         self._connections[consumer] = channel
+        self._stats[consumer] = ConsumerStats()
         channel.basic_qos(
-            prefetch_count=self._prefetch_default, callback=partial(self._on_qos_setup, consumer=consumer)
+            prefetch_count=consumer.prefetch_count, callback=partial(self._on_qos_setup, consumer=consumer)
         )
 
-    def _custom_ack(self, ch: pika.channel.Channel, method, properties, body, consumer_cb: Callable):
-        consumer_cb(ch, method, properties, body)
-        ch.basic_ack(method.delivery_tag)
+    def _custom_ack(self, ch: pika.channel.Channel, method, properties, body, consumer: ConsumerConfig):
+        stats = self._stats[consumer]
+        if self.workers:
+            self._dispatch_to_worker(consumer, method, properties, body)
+            return
+
+        if consumer.batch_callback:
+            stats.pending_bodies.append(body)
+        else:
+            try:
+                consumer.callback(ch, method, properties, body)
+            except Exception:
+                # ack messages handled before the failed one, failed message stays unacked
+                self._ack_pending(consumer)
+                raise
+            stats.processed_count += 1
+            stats.window_processed_count += 1
+
+        stats.last_delivery_tag = method.delivery_tag
+        stats.unacked_count += 1
+        if stats.unacked_count >= consumer.ack_batch_size:
+            self._ack_pending(consumer)
+
+    def _ack_pending(self, consumer: ConsumerConfig):
+        """Acks all handled messages of the consumer with single cumulative ack"""
+        stats = self._stats[consumer]
+        channel = self._connections[consumer]
+        if stats.pending_bodies:
+            bodies, stats.pending_bodies = stats.pending_bodies, []
+            consumer.batch_callback(channel, bodies)
+            stats.processed_count += len(bodies)
+            stats.window_processed_count += len(bodies)
+
+        if stats.unacked_count and channel.is_open and not self.auto_ack:
+            channel.basic_ack(stats.last_delivery_tag, multiple=True)
+        stats.unacked_count = 0
+
+    def _ack_all(self):
+        for consumer in self._stats:
+            self._ack_pending(consumer)
+
+    def _on_ack_timer(self, consumer: ConsumerConfig):
+        self._ack_pending(consumer)
+        channel = self._connections[consumer]
+        if channel.is_open:
+            channel.connection.ioloop.call_later(consumer.ack_interval, partial(self._on_ack_timer, consumer=consumer))
+
+    def _log_stats(self, connection):
+        log_consumer_stats(self._stats)
+        if connection.is_open:
+            connection.ioloop.call_later(self.stats_interval, partial(self._log_stats, connection=connection))
 
     def _on_queue_declared(self, frame, consumer: ConsumerConfig):
         """Called when RabbitMQ has told us our Queue has been declared, frame is the response from RabbitMQ"""
-        cb = partial(self._custom_ack, consumer_cb=consumer.callback)
+        cb = partial(self._custom_ack, consumer=consumer)
         self._connections[consumer].basic_consume(
             consumer.queue,
             cb,
             auto_ack=self.auto_ack,
             arguments=consumer.queue_consume_arguments,
         )
+        self._on_ack_timer(consumer)
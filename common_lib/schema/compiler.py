@@ -0,0 +1,180 @@
+"""
+Compiles simple json schemas to specialized python functions
+
+Generated function takes an instance and returns whether it's valid, errors are not reported: callers run
+the generic `jsonschema` validator for invalid instances to get the error. Only keywords used by event schemas
+are supported(type, properties, required, enum, items, local $ref), schemas with other keywords raise
+`UnsupportedSchemaError` and should be validated with `jsonschema` only. Type checks follow the custom
+validator of `validator.py`: UUID and datetime instances are strings.
+"""
+import numbers
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+from uuid import UUID
+
+
+DRAFT4 = "http://json-schema.org/draft-04/schema#"
+DRAFT202012 = "https://json-schema.org/draft/2020-12/schema"
+
+# keywords which don't affect validation(format is not asserted by the generic validator either)
+ANNOTATION_KEYWORDS = {"$schema", "$id", "title", "description", "definitions", "$defs", "format", "$comment"}
+SUPPORTED_KEYWORDS = ANNOTATION_KEYWORDS | {"type", "properties", "required", "enum", "items", "$ref"}
+
+
+class UnsupportedSchemaError(Exception):
+    pass
+
+
+_TRUE, _FALSE = object(), object()
+
+
+def _unbool(element):
+    """The same as `jsonschema._utils.unbool`: makes True/1 and False/0 different enum values"""
+    if element is True:
+        return _TRUE
+    elif element is False:
+        return _FALSE
+    return element
+
+
+def enum_contains(enums: List, instance: Any) -> bool:
+    if instance == 0 or instance == 1:
+        unbooled = _unbool(instance)
+        return any(unbooled == _unbool(each) for each in enums)
+    return instance in enums
+
+
+def is_number(instance: Any) -> bool:
+    return isinstance(instance, numbers.Number) and not isinstance(instance, bool)
+
+
+def is_integer_draft4(instance: Any) -> bool:
+    return isinstance(instance, int) and not isinstance(instance, bool)
+
+
+def is_integer(instance: Any) -> bool:
+    return is_integer_draft4(instance) or isinstance(instance, float) and instance.is_integer()
+
+
+TYPE_CHECKS = {
+    "object": "isinstance({0}, dict)",
+    "array": "isinstance({0}, list)",
+    "string": "isinstance({0}, (str, UUID, datetime))",
+    "number": "is_number({0})",
+    "boolean": "isinstance({0}, bool)",
+    "null": "{0} is None",
+}
+
+
+class SchemaCompiler:
+    def __init__(self, schema: Dict) -> None:
+        self.schema = schema
+        self.draft = schema.get("$schema", DRAFT202012)
+        if self.draft not in (DRAFT4, DRAFT202012):
+            raise UnsupportedSchemaError(f"unsupported {self.draft=}")
+
+        self._functions: Dict[str, str] = {}  # $ref -> function name
+        self._sources: List[str] = []
+        self._enums: List[List] = []
+
+    def compile(self) -> Callable[[Any], bool]:
+        root = self._add_function("#", self.schema)
+        namespace = {
+            "UUID": UUID,
+            "datetime": datetime,
+            "enum_contains": enum_contains,
+            "is_number": is_number,
+            "is_integer": is_integer_draft4 if self.draft == DRAFT4 else is_integer,
+            "ENUMS": self._enums,
+        }
+        source = "\n\n".join(self._sources)
+        try:
+            exec(source, namespace)
+        except SyntaxError as e:
+            raise UnsupportedSchemaError(f"schema compiled to invalid source: {e}") from e
+        validate = namespace[root]
+        validate.source = source
+        return validate
+
+    def _add_function(self, ref: str, schema: Dict) -> str:
+        if ref in self._functions:
+            return self._functions[ref]
+
+        name = f"validate_{len(self._functions)}"
+        self._functions[ref] = name
+        lines = [f"def {name}(v0):"]
+        self._add_checks(schema, "v0", 1, lines)
+        lines.append("    return True")
+        self._sources.append("\n".join(lines))
+        return name
+
+    def _add_checks(self, schema: Any, var: str, depth: int, lines: List[str]):
+        if not isinstance(schema, dict):
+            raise UnsupportedSchemaError(f"unsupported {schema=}")
+        unsupported = schema.keys() - SUPPORTED_KEYWORDS
+        if unsupported:
+            raise UnsupportedSchemaError(f"unsupported keywords {unsupported}")
+
+        indent = "    " * depth
+        if "$ref" in schema:
+            function = self._add_function(schema["$ref"], self._resolve(schema["$ref"]))
+            lines.append(f"{indent}if not {function}({var}):")
+            lines.append(f"{indent}    return False")
+            # draft 4 ignores keywords next to $ref
+            if self.draft == DRAFT4:
+                return
+
+        if "type" in schema:
+            types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+            checks = [self._type_check(type_, var) for type_ in types]
+            lines.append(f"{indent}if not ({' or '.join(checks)}):")
+            lines.append(f"{indent}    return False")
+
+        if "enum" in schema:
+            lines.append(f"{indent}if not enum_contains(ENUMS[{len(self._enums)}], {var}):")
+            lines.append(f"{indent}    return False")
+            self._enums.append(schema["enum"])
+
+        if "required" in schema or "properties" in schema:
+            lines.append(f"{indent}if isinstance({var}, dict):")
+            for key in schema.get("required", []):
+                lines.append(f"{indent}    if {key!r} not in {var}:")
+                lines.append(f"{indent}        return False")
+            for key, subschema in schema.get("properties", {}).items():
+                child_var = f"v{depth}"
+                lines.append(f"{indent}    if {key!r} in {var}:")
+                lines.append(f"{indent}        {child_var} = {var}[{key!r}]")
+                self._add_checks(subschema, child_var, depth + 2, lines)
+            lines.append(f"{indent}    pass")
+
+        if "items" in schema:
+            if not isinstance(schema["items"], dict):
+                raise UnsupportedSchemaError("only single schema `items` is supported")
+            child_var = f"v{depth}"
+            lines.append(f"{indent}if isinstance({var}, list):")
+            lines.append(f"{indent}    for {child_var} in {var}:")
+            self._add_checks(schema["items"], child_var, depth + 2, lines)
+            lines.append(f"{indent}        pass")
+
+    def _type_check(self, type_: str, var: str) -> str:
+        if type_ == "integer":
+            return f"is_integer({var})"
+        if type_ not in TYPE_CHECKS:
+            raise UnsupportedSchemaError(f"unsupported {type_=}")
+        return TYPE_CHECKS[type_].format(var)
+
+    def _resolve(self, ref: str) -> Dict:
+        if not ref.startswith("#"):
+            raise UnsupportedSchemaError(f"only local refs are supported, got {ref=}")
+        node = self.schema
+        for part in ref[1:].split("/")[1:]:
+            part = part.replace("~1", "/").replace("~0", "~")
+            if not isinstance(node, dict) or part not in node:
+                raise UnsupportedSchemaError(f"unresolvable {ref=}")
+            node = node[part]
+        return node
+
+
+def compile_schema(schema: Dict) -> Callable[[Any], bool]:
+    """Returns function telling whether instance is valid, raises `UnsupportedSchemaError` if schema can't be compiled"""
+    return SchemaCompiler(schema).compile()
@@ -1,12 +1,22 @@
+from dataclasses import dataclass
 from datetime import datetime
 import json
-from typing import Dict
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
 from pathlib import Path
 from uuid import UUID
 from jsonschema.validators import Draft202012Validator, Draft4Validator
 from jsonschema.validators import extend
 from functools import lru_cache
 
+from common_lib.schema.compiler import UnsupportedSchemaError, compile_schema
+
+
+logger = logging.getLogger(__name__)
+
 
 def check_string_formats(checker, instance):
     return (
@@ -20,20 +30,130 @@ def get_schema(schema_path: str) -> Dict:
         return json.loads(path.read_bytes())
 
 
+@lru_cache
+def get_validator_class(schema_draft: str):
+    """Builds custom validator class once per json schema draft"""
+    draft_2_class_map = {
+        "http://json-schema.org/draft-04/schema#": Draft4Validator,
+        "https://json-schema.org/draft/2020-12/schema": Draft202012Validator,
+    }
+    base_validator = draft_2_class_map[schema_draft]
+    type_checker = base_validator.TYPE_CHECKER.redefine("string", check_string_formats)
+    return extend(base_validator, type_checker=type_checker)
+
+
 class Validator:
-    def __init__(self, schema_path: str) -> None:
+    """
+    Validates instances against schema file
+
+    With `use_compiled` schema is also compiled to specialized python function(see `compiler.py`), which is
+    checked first: valid instances skip generic `jsonschema` validation, invalid ones are validated by it to get
+    the error. Schemas the compiler doesn't support are validated by `jsonschema` only.
+    """
+
+    def __init__(self, schema_path: str, use_compiled: bool = True) -> None:
         self._schema = get_schema(schema_path)
         self._schema_validator = self.get_validator()
+        self._compiled_validator = None
+        if use_compiled:
+            try:
+                self._compiled_validator = compile_schema(self._schema)
+            except UnsupportedSchemaError as e:
+                logger.info(f"{schema_path=} is validated by jsonschema only: {e}")
+
+    @property
+    def is_compiled(self) -> bool:
+        return self._compiled_validator is not None
 
     def validate(self, data: Dict):
+        if self._compiled_validator is not None and self._compiled_validator(data):
+            return
         self._schema_validator.validate(data)
 
     def get_validator(self):
-        draft_2_class_map = {
-            "http://json-schema.org/draft-04/schema#": Draft4Validator,
-            "https://json-schema.org/draft/2020-12/schema": Draft202012Validator,
-        }
-        base_validator = draft_2_class_map[self._schema['$schema']]
-        type_checker = base_validator.TYPE_CHECKER.redefine("string", check_string_formats)
-        custom_validator = extend(base_validator, type_checker=type_checker)
+        custom_validator = get_validator_class(self._schema['$schema'])
         return custom_validator(self._schema)
+
+
+SchemaKey = Tuple[str, str, int]  # (domain, event_name, version)
+
+
+@dataclass
+class ValidatorRegistryStats:
+    hits: int = 0
+    misses: int = 0
+    compile_time: float = 0.0  # seconds spent on validators compilation
+    fallbacks: int = 0  # schemas not supported by compiler, validated by jsonschema only
+
+
+class ValidatorRegistry:
+    """
+    Process wide registry of compiled schema validators
+
+    Each (domain, event_name, version) schema gets compiled once and the ready validator is reused by all events.
+    """
+
+    def __init__(self, schema_basedir: str, use_compiled: bool = True) -> None:
+        self.schema_basedir = schema_basedir
+        self.use_compiled = use_compiled
+        self.stats = ValidatorRegistryStats()
+        self._validators: Dict[SchemaKey, Validator] = {}
+        self._lock = threading.Lock()
+
+    def get_schema_path(self, domain: str, event_name: str, version: int) -> str:
+        return os.path.join(self.schema_basedir, f"schema/{domain}/{event_name}/{version}.json")
+
+    def get_validator(self, domain: str, event_name: str, version: int) -> Validator:
+        key = (domain, event_name, int(version))
+        validator = self._validators.get(key)
+        if validator:
+            self.stats.hits += 1
+            return validator
+
+        with self._lock:
+            validator = self._validators.get(key)
+            if not validator:
+                self.stats.misses += 1
+                validator = self._compile(key)
+        return validator
+
+    def validate(self, domain: str, event_name: str, version: int, data: Dict):
+        self.get_validator(domain=domain, event_name=event_name, version=version).validate(data)
+
+    def warm_up(self) -> int:
+        """Compiles all schemas from `schema/<domain>/<event_name>/<version>.json` tree. Returns compiled schemas count"""
+        schema_root = Path(self.schema_basedir) / "schema"
+        compiled = 0
+        with self._lock:
+            for schema_path in schema_root.glob("*/*/*.json"):
+                domain, event_name = schema_path.parent.parent.name, schema_path.parent.name
+                key = (domain, event_name, int(schema_path.stem))
+                if key not in self._validators:
+                    self._compile(key)
+                    compiled += 1
+        return compiled
+
+    def _compile(self, key: SchemaKey) -> Validator:
+        started_at = time.perf_counter()
+        validator = Validator(schema_path=self.get_schema_path(*key), use_compiled=self.use_compiled)
+        self.stats.compile_time += time.perf_counter() - started_at
+        if self.use_compiled and not validator.is_compiled:
+            self.stats.fallbacks += 1
+        self._validators[key] = validator
+        return validator
+
+
+_registries: Dict[str, ValidatorRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_validator_registry(schema_basedir: str, use_compiled: bool = True) -> ValidatorRegistry:
+    """Returns process wide registry for given schema dir, warmed up on first access"""
+    registry_key = str(schema_basedir)
+    with _registries_lock:
+        registry = _registries.get(registry_key)
+        if not registry:
+            registry = ValidatorRegistry(schema_basedir=registry_key, use_compiled=use_compiled)
+            registry.warm_up()
+            _registries[registry_key] = registry
+    return registry
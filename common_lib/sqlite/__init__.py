@@ -0,0 +1,23 @@
+"""
+Opt-in sqlite performance profile and database backend
+
+Pragmas from `SQLITE_PRAGMAS` setting are applied to each new sqlite connection, e.g. WAL journal lets
+web and consumer processes read while the other one writes. `common_lib.sqlite` is also used as database
+`ENGINE`, see `base.py`.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", None)
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def install_sqlite_profile():
+    """Subscribes to new db connections, called from `AppConfig.ready`"""
+    connection_created.connect(apply_sqlite_pragmas, dispatch_uid="common_lib.sqlite.apply_sqlite_pragmas")
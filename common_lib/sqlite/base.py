@@ -0,0 +1,28 @@
+"""
+sqlite backend with configurable transaction mode
+
+Django starts `atomic` blocks with deferred `BEGIN`: write lock is taken on the first write, and when another
+connection has written meanwhile, the lock upgrade fails with SQLITE_BUSY right away, busy_timeout doesn't
+apply to it. `BEGIN IMMEDIATE` takes write lock at start, where busy_timeout waits for it. Mode is set with
+`transaction_mode` option, the same one Django 5.1 sqlite backend accepts.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(SQLiteDatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transaction_mode = self.settings_dict["OPTIONS"].get("transaction_mode", "DEFERRED").upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"sqlite transaction_mode must be one of {', '.join(TRANSACTION_MODES)}")
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
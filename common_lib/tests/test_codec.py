@@ -0,0 +1,13 @@
+from datetime import date
+from unittest import TestCase
+
+from common_lib.codec import parse_event_day
+
+
+class ParseEventDayTest(TestCase):
+    def test_naive_time_is_utc(self):
+        self.assertEqual(parse_event_day("2022-05-15 23:59:59.999999"), date(2022, 5, 15))
+
+    def test_aware_time_is_converted_to_utc(self):
+        self.assertEqual(parse_event_day("2022-05-16T01:30:00+03:00"), date(2022, 5, 15))
+        self.assertEqual(parse_event_day("2022-05-15T23:30:00-03:00"), date(2022, 5, 16))
@@ -0,0 +1,119 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+from unittest import TestCase
+from uuid import uuid4
+
+from common_lib.cud_event_manager import EventManager, ServiceName
+from common_lib.offset_manager import Offset
+
+
+SCHEMA_BASEDIR = Path(__file__).resolve().parent.parent
+
+
+class MemoryOffsetManager:
+    def __init__(self, offset: Optional[Offset] = None) -> None:
+        self.offset = offset
+        self.checkpointed_offset: Optional[Offset] = None
+
+    def get_offet(self) -> Optional[Offset]:
+        return self.offset
+
+    def set_offset(self, offset: Offset, checkpoint: bool = False):
+        self.offset = offset
+        if checkpoint:
+            self.checkpointed_offset = offset
+
+
+class MemoryFailedEventManager:
+    def __init__(self) -> None:
+        self.failed_consume_events: List[Dict] = []
+
+    def store_failed_consume_event(self, exception: Exception, origin_event: Dict, consumer: ServiceName):
+        self.failed_consume_events.append(origin_event)
+
+    def has_pending_events(self, event: Dict) -> bool:
+        return False
+
+
+def build_task_created_event(task_id: int, event_time: Optional[datetime] = None) -> Dict:
+    return {
+        "event_id": str(uuid4()),
+        "version": 1,
+        "event_name": "task_created",
+        "event_time": str(event_time or datetime.utcnow()),
+        "producer": "task_service",
+        "data": {
+            "id": task_id,
+            "created_at": "2022-05-15 09:58:00",
+            "updated_at": "2022-05-15 09:58:00",
+            "title": "task",
+            "description": "description",
+            "status": "new",
+            "assignee": str(uuid4()),
+            "fee_on_assign": -10.5,
+            "fee_on_complete": 25.0,
+        },
+    }
+
+
+def build_event_manager(event_router: Dict, batch_event_router: Optional[Dict] = None, **kwargs) -> EventManager:
+    return EventManager(
+        mq_publisher=None,
+        schema_basedir=SCHEMA_BASEDIR,
+        failed_event_manager=kwargs.pop("failed_event_manager", MemoryFailedEventManager()),
+        service_name=ServiceName.ACCOUNT_SERVICE,
+        offset_manager=kwargs.pop("offset_manager", MemoryOffsetManager()),
+        event_router=event_router,
+        batch_event_router=batch_event_router,
+        **kwargs,
+    )
+
+
+class HandleMessagesTest(TestCase):
+    def test_skips_undecodable_messages_and_keeps_order(self):
+        handled, before_consume_calls = [], []
+        event_manager = build_event_manager(
+            event_router={"task_created": handled.append},
+            batch_event_router={"task_created": lambda events: handled.extend(events)},
+            before_consume=lambda: before_consume_calls.append(True),
+        )
+        events = [build_task_created_event(task_id) for task_id in range(3)]
+        bodies = [json.dumps(event).encode() for event in events]
+        bodies[1:1] = [b"{not json", b"[]"]
+
+        event_manager.handle_messages(channel=None, bodies=bodies)
+
+        self.assertEqual([event["data"]["id"] for event in handled], [0, 1, 2])
+        self.assertEqual(len(before_consume_calls), 1)
+
+    def test_failed_handler_stores_event(self):
+        failed_event_manager = MemoryFailedEventManager()
+
+        def fail(event):
+            raise ValueError("boom")
+
+        offset_manager = MemoryOffsetManager()
+        event_manager = build_event_manager(
+            event_router={"task_created": fail}, failed_event_manager=failed_event_manager, offset_manager=offset_manager
+        )
+        event = build_task_created_event(1)
+
+        event_manager.handle_message(channel=None, method=None, properties=None, body=json.dumps(event).encode())
+
+        self.assertEqual(failed_event_manager.failed_consume_events, [event])
+        # checkpointed right away, so the stored event isn't read from the log again after restart
+        self.assertEqual(offset_manager.checkpointed_offset.message_id, event["event_id"])
+
+    def test_events_before_offset_are_skipped(self):
+        handled = []
+        now = datetime.utcnow()
+        offset_manager = MemoryOffsetManager(Offset(message_id="1", created_at=now))
+        event_manager = build_event_manager(event_router={"task_created": handled.append}, offset_manager=offset_manager)
+
+        for task_id, event_time in ((1, now - timedelta(seconds=1)), (2, now + timedelta(seconds=1))):
+            body = json.dumps(build_task_created_event(task_id, event_time=event_time)).encode()
+            event_manager.handle_message(channel=None, method=None, properties=None, body=body)
+
+        self.assertEqual([event["data"]["id"] for event in handled], [2])
@@ -0,0 +1,24 @@
+import os
+from unittest import TestCase, mock
+
+from common_lib.db import get_databases, get_sqlite_pragmas
+
+
+class SqliteSettingsTest(TestCase):
+    def get_settings(self, **env):
+        with mock.patch.dict(os.environ, {"SQLITE_DB_PATH": "/tmp/db.sqlite3", **env}, clear=True):
+            return get_databases()["default"], get_sqlite_pragmas()
+
+    def test_defaults_without_performance_profile(self):
+        database, pragmas = self.get_settings()
+        self.assertEqual(database["OPTIONS"], {"transaction_mode": "DEFERRED"})
+        self.assertEqual(pragmas, {})
+
+    def test_performance_profile(self):
+        database, pragmas = self.get_settings(SQLITE_PERFORMANCE_PROFILE="1")
+        self.assertEqual(database["OPTIONS"], {"transaction_mode": "IMMEDIATE"})
+        self.assertEqual(pragmas["journal_mode"], "WAL")
+
+    def test_transaction_mode_override(self):
+        database, _ = self.get_settings(SQLITE_PERFORMANCE_PROFILE="1", SQLITE_TRANSACTION_MODE="DEFERRED")
+        self.assertEqual(database["OPTIONS"], {"transaction_mode": "DEFERRED"})
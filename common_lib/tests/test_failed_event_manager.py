@@ -0,0 +1,146 @@
+import copy
+from itertools import count
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest import TestCase
+
+from common_lib.cud_event_manager import FailedEventManager, ServiceName
+from common_lib.tests.test_cud_event_manager import build_event_manager, build_task_created_event
+
+
+class MemoryCursor(list):
+    def sort(self, key: str, direction: int) -> "MemoryCursor":
+        return MemoryCursor(sorted(self, key=lambda doc: doc[key], reverse=direction < 0))
+
+
+class MemoryCollection:
+    """The part of pymongo collection `FailedEventManager` uses"""
+
+    def __init__(self) -> None:
+        self.docs: Dict[int, Dict] = {}
+        self._ids = count(1)
+
+    def create_indexes(self, indexes):
+        pass
+
+    def update_many(self, query, update):
+        pass
+
+    def insert_one(self, doc: Dict):
+        doc["_id"] = next(self._ids)
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def find(self, query: Dict, projection: Optional[Dict] = None, batch_size: Optional[int] = None) -> MemoryCursor:
+        return MemoryCursor(copy.deepcopy(doc) for doc in self.docs.values() if self._matches(doc, query))
+
+    def update_one(self, query: Dict, update: Dict):
+        matched = [doc for doc in self.docs.values() if self._matches(doc, query)][:1]
+        for doc in matched:
+            doc.update(update["$set"])
+        return SimpleNamespace(modified_count=len(matched))
+
+    def bulk_write(self, requests: List, ordered: bool = True):
+        for request in requests:
+            self.update_one(request._filter, request._doc)
+
+    def _matches(self, doc: Dict, query: Dict) -> bool:
+        for key, value in query.items():
+            if key == "next_retry_at":
+                # {"$not": {"$gt": now}}
+                if doc.get(key) and doc[key] > value["$not"]["$gt"]:
+                    return False
+            elif doc.get(key) != value:
+                return False
+        return True
+
+
+class Crash(BaseException):
+    """Kills replay the way process termination does: it isn't handled as callback failure"""
+
+
+class FailedEventsReplayTest(TestCase):
+    def setUp(self):
+        self.collection = MemoryCollection()
+        self.failed_event_manager = FailedEventManager(error_collection=self.collection)
+        self.applied = []
+        self.failing_task_ids = set()
+
+    def handle(self, event: Dict):
+        if event["data"]["id"] in self.failing_task_ids:
+            raise ValueError("boom")
+        self.applied.append(event["data"]["id"])
+
+    def consume_live(self, *task_ids: int):
+        event_manager = build_event_manager(
+            event_router={"task_created": self.handle}, failed_event_manager=self.failed_event_manager
+        )
+        for task_id in task_ids:
+            event_manager.consume_event(build_task_created_event(task_id))
+
+    def replay(self):
+        return self.failed_event_manager.process_failed_events_by_consumer(
+            service_name=ServiceName.ACCOUNT_SERVICE, event_router={"task_created": self.handle}
+        )
+
+    def statuses(self) -> List[str]:
+        return [doc["status"] for doc in self.collection.docs.values()]
+
+    def test_live_events_are_parked_behind_failed_events_of_their_entity(self):
+        self.failed_event_manager.load_pending_events(ServiceName.ACCOUNT_SERVICE)
+        self.failing_task_ids = {1}
+        self.consume_live(1, 2)
+        self.failing_task_ids.clear()
+
+        # event of task 1 waits for the failed one, task 2 isn't held back
+        self.consume_live(1, 2)
+        self.assertEqual(self.applied, [2, 2])
+
+        stats = self.replay()
+
+        self.assertEqual(stats.processed, 2)
+        self.assertEqual(self.applied, [2, 2, 1, 1])
+        self.assertEqual(self.statuses(), ["PROCESSED", "PROCESSED"])
+        # nothing is pending anymore: live events are applied right away
+        self.consume_live(1)
+        self.assertEqual(self.applied, [2, 2, 1, 1, 1])
+
+    def test_replay_postpones_events_behind_failed_retry(self):
+        self.failed_event_manager.load_pending_events(ServiceName.ACCOUNT_SERVICE)
+        self.failing_task_ids = {1}
+        self.consume_live(1, 1)
+
+        stats = self.replay()
+
+        self.assertEqual((stats.retried, stats.postponed), (1, 1))
+        self.assertEqual(self.applied, [])
+        self.assertEqual(self.statuses(), ["NEW", "NEW"])
+
+    def test_events_interrupted_by_crash_are_not_applied_again(self):
+        for task_id in (1, 2, 3):
+            self.failed_event_manager.store_failed_consume_event(
+                ValueError("boom"), build_task_created_event(task_id), ServiceName.ACCOUNT_SERVICE
+            )
+
+        def crash_on_second_event(event: Dict):
+            self.applied.append(event["data"]["id"])
+            if event["data"]["id"] == 2:
+                raise Crash()
+
+        with self.assertRaises(Crash):
+            self.failed_event_manager.process_failed_events_by_consumer(
+                service_name=ServiceName.ACCOUNT_SERVICE, event_router={"task_created": crash_on_second_event}
+            )
+        self.replay()
+
+        # events claimed by the killed replay stay in PROCESSING for manual review
+        self.assertEqual(self.applied, [1, 2, 3])
+        self.assertEqual(self.statuses(), ["PROCESSING", "PROCESSING", "PROCESSED"])
+
+    def test_failed_event_keeps_stack_trace_and_retry_count(self):
+        self.failing_task_ids = {1}
+        self.consume_live(1)
+
+        doc = self.collection.docs[1]
+        self.assertEqual(doc["retry_count"], 0)
+        self.assertIn("in handle", doc["exception"]["stack_trace"])
+        self.assertIn("ValueError: boom", doc["exception"]["stack_trace"])
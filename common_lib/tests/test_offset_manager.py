@@ -0,0 +1,122 @@
+import json
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+from unittest import TestCase
+
+from common_lib.offset_manager import Offset, OffsetLogManager
+
+
+class FileCollection:
+    """Single document collection kept in json file, so it outlives the process which wrote it"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def find_one(self, query: Dict, projection: Optional[Dict] = None) -> Optional[Dict]:
+        if not self.path.exists():
+            return None
+        doc = json.loads(self.path.read_text())
+        doc["created_at"] = datetime.fromisoformat(doc["created_at"])
+        for key, is_included in (projection or {}).items():
+            if not is_included:
+                doc.pop(key, None)
+        return doc
+
+    def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        doc = {**update["$set"], "created_at": update["$set"]["created_at"].isoformat()}
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(doc))
+        os.replace(tmp_path, self.path)
+
+
+def build_offset(number: int) -> Offset:
+    return Offset(message_id=str(number), created_at=datetime(2022, 5, 15) + timedelta(seconds=number))
+
+
+def consume_and_hang(
+    path: Path,
+    explicit_checkpoint_at: Optional[int],
+    last_offset: int,
+    checkpoint_every: int,
+    failed_at: Optional[int] = None,
+):
+    """Child process: sets offsets 1..last_offset, optionally checkpoints explicitly, then waits to be killed
+
+    Offset `failed_at` is set the way consumer sets offset of event stored in failed events.
+    """
+    manager = OffsetLogManager(FileCollection(path), checkpoint_every=checkpoint_every, checkpoint_interval=3600)
+    for number in range(1, last_offset + 1):
+        manager.set_offset(build_offset(number), checkpoint=number == failed_at)
+        if number == explicit_checkpoint_at:
+            manager.checkpoint()
+    path.with_suffix(".ready").touch()
+    time.sleep(3600)
+
+
+class OffsetLogManagerRestartTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "offset.json"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def kill_after(self, wait_for, **kwargs):
+        process = multiprocessing.get_context("fork").Process(
+            target=consume_and_hang, kwargs={"path": self.path, **kwargs}
+        )
+        process.start()
+        try:
+            deadline = time.monotonic() + 10
+            while not wait_for() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(wait_for(), "child process didn't reach the expected state")
+        finally:
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        self.assertEqual(process.exitcode, -signal.SIGKILL)
+
+    def restarted_offset(self) -> Optional[Offset]:
+        return OffsetLogManager(FileCollection(self.path), checkpoint_interval=3600).get_offet()
+
+    def test_resumes_from_last_checkpoint_after_kill(self):
+        self.kill_after(
+            wait_for=self.path.with_suffix(".ready").exists, explicit_checkpoint_at=20, last_offset=25, checkpoint_every=100
+        )
+
+        # updates 21..25 weren't checkpointed: they're read from the log again, offset never gets ahead
+        self.assertEqual(self.restarted_offset(), build_offset(20))
+
+    def test_resumes_from_background_checkpoint_after_kill(self):
+        def is_checkpointed():
+            doc = FileCollection(self.path).find_one({"_id": 1})
+            return bool(doc) and doc["message_id"] == "10"
+
+        self.kill_after(wait_for=is_checkpointed, explicit_checkpoint_at=None, last_offset=10, checkpoint_every=10)
+
+        self.assertEqual(self.restarted_offset(), build_offset(10))
+
+    def test_starts_from_scratch_without_checkpoint(self):
+        self.kill_after(
+            wait_for=self.path.with_suffix(".ready").exists, explicit_checkpoint_at=None, last_offset=5, checkpoint_every=100
+        )
+
+        self.assertIsNone(self.restarted_offset())
+
+    def test_failed_event_offset_is_checkpointed_before_kill(self):
+        self.kill_after(
+            wait_for=self.path.with_suffix(".ready").exists,
+            explicit_checkpoint_at=None,
+            last_offset=7,
+            checkpoint_every=100,
+            failed_at=5,
+        )
+
+        # event 5 is replayed from failed events, so it mustn't be read from the log again
+        self.assertEqual(self.restarted_offset(), build_offset(5))
@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from common_lib.pagination import InvalidPageParams, parse_page_params
+
+
+class ParsePageParamsTest(TestCase):
+    def parse(self, **params):
+        return parse_page_params(params, default_limit=10, max_limit=100)
+
+    def test_defaults(self):
+        self.assertEqual(self.parse(), (None, 10))
+        self.assertEqual(self.parse(cursor="", limit=""), (None, 10))
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(self.parse(limit="1000"), (None, 100))
+        # zero or negative limit would drop the last row of a page or slice from the end
+        self.assertEqual(self.parse(limit="0"), (None, 1))
+        self.assertEqual(self.parse(limit="-5"), (None, 1))
+
+    def test_cursor(self):
+        self.assertEqual(self.parse(cursor="7185894346052628480", limit="5"), (7185894346052628480, 5))
+
+    def test_invalid_params(self):
+        for params in ({"limit": "ten"}, {"limit": "1.5"}, {"cursor": "abc"}, {"cursor": "-1"}):
+            with self.subTest(params=params), self.assertRaises(InvalidPageParams):
+                self.parse(**params)
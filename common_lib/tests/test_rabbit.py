@@ -0,0 +1,84 @@
+import json
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+from unittest import TestCase
+
+from common_lib.rabbit import ConsumerConfig, ConsumerStats, RabbitMQMultiConsumer, single_partition_key
+
+
+class FakeIOLoop:
+    """Runs callbacks scheduled by worker threads in the test thread, as pika ioloop does in its own thread"""
+
+    def __init__(self) -> None:
+        self.callbacks = queue.Queue()
+
+    def add_callback_threadsafe(self, callback: Callable):
+        self.callbacks.put(callback)
+
+    def run_until(self, predicate: Callable[[], bool], timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            self.callbacks.get(timeout=max(deadline - time.monotonic(), 0))()
+
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self) -> None:
+        self.acked_tags: List[int] = []
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        self.acked_tags.append(delivery_tag)
+
+
+def build_body(event_name: str, data: Dict) -> bytes:
+    return json.dumps({"event_name": event_name, "data": data}).encode()
+
+
+class WorkersOrderingTest(TestCase):
+    def setUp(self):
+        self.handled = []
+        self.handled_lock = threading.Lock()
+
+    def handle(self, channel, method, properties, body):
+        event = json.loads(body)
+        if event["event_name"] == "task_created":
+            # slow handler: later events of the task must wait for it
+            time.sleep(0.2)
+        with self.handled_lock:
+            self.handled.append(event["event_name"])
+
+    def consume(self, consumer: ConsumerConfig, bodies: List[bytes], workers: int = 4) -> FakeChannel:
+        rmq_client = RabbitMQMultiConsumer(dsn="amqp://localhost", consumers=[consumer], workers=workers)
+        ioloop, channel = FakeIOLoop(), FakeChannel()
+        rmq_client._connection = SimpleNamespace(ioloop=ioloop)
+        rmq_client._connections[consumer] = channel
+        rmq_client._stats[consumer] = ConsumerStats()
+        rmq_client._start_workers()
+        try:
+            for delivery_tag, body in enumerate(bodies, start=1):
+                method = SimpleNamespace(delivery_tag=delivery_tag)
+                rmq_client._custom_ack(channel, method, None, body, consumer=consumer)
+            ioloop.run_until(lambda: rmq_client._stats[consumer].processed_count == len(bodies))
+            rmq_client._ack_pending(consumer)
+        finally:
+            rmq_client._stop_workers()
+        return channel
+
+    def test_task_events_are_handled_in_delivery_order(self):
+        consumer = ConsumerConfig(
+            exchange="tasks", queue="tasks", callback=self.handle, partition_key=single_partition_key
+        )
+        bodies = [
+            build_body("task_created", {"id": 1}),
+            build_body("tasks_assigned", {"tasks": [{"id": 1, "new_assignee": "2"}]}),
+            build_body("task_completed", {"id": 1}),
+        ]
+
+        channel = self.consume(consumer, bodies)
+
+        self.assertEqual(self.handled, ["task_created", "tasks_assigned", "task_completed"])
+        self.assertEqual(channel.acked_tags, [3])
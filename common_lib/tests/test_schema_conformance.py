@@ -0,0 +1,141 @@
+"""
+Conformance of compiled validators with jsonschema
+
+Every schema of `common_lib/schema` gets a valid sample built from the schema, then each value of the sample is
+replaced with values of other types and each required key is dropped. Compiled validator must accept exactly
+the samples jsonschema accepts.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator
+from unittest import TestCase
+from uuid import UUID
+
+from common_lib.schema.compiler import DRAFT4, DRAFT202012, compile_schema
+from common_lib.schema.validator import get_schema, get_validator_class
+
+
+SCHEMA_ROOT = Path(__file__).resolve().parent.parent / "schema"
+
+# values substituted in place of each sample value
+REPLACEMENTS = [
+    None,
+    True,
+    0,
+    1.0,
+    1.5,
+    -1,
+    "",
+    "1",
+    "2022-05-15 09:58:00",
+    UUID("3f1c5d0e-1c7b-4a55-9b3c-7f6a9d1e2b4c"),
+    datetime(2022, 5, 15, 9, 58),
+    [],
+    [1],
+    {},
+]
+
+SAMPLE_VALUES = {
+    "integer": 7185894346052628480,
+    "number": 25.5,
+    "boolean": False,
+    "null": None,
+}
+
+# schemas with nodes which emit no checks, besides the schemas of the tree
+INLINE_SCHEMAS = {
+    "items without keywords": {"$schema": DRAFT202012, "type": "array", "items": {}},
+    "items with annotations only": {
+        "$schema": DRAFT202012,
+        "type": "array",
+        "items": {"title": "any", "description": "accepts anything", "format": "uuid"},
+    },
+    "untyped items": {"$schema": DRAFT4, "items": {}},
+    "property with annotations only": {
+        "$schema": DRAFT4,
+        "type": "object",
+        "properties": {"data": {"description": "accepts anything"}, "tags": {"type": "array", "items": {}}},
+    },
+}
+
+
+def resolve(root: Dict, node: Dict) -> Dict:
+    """Follows local `$ref`s of the node"""
+    while "$ref" in node:
+        target = root
+        for part in node["$ref"].lstrip("#").strip("/").split("/"):
+            target = target[part]
+        node = target
+    return node
+
+
+def build_sample(root: Dict, node: Dict) -> Any:
+    """Builds valid instance with all properties of the schema node set"""
+    node = resolve(root, node)
+    if "enum" in node:
+        return node["enum"][0]
+
+    types = node["type"] if isinstance(node.get("type"), list) else [node.get("type", "object")]
+    type_ = next(type_ for type_ in types if type_ != "null")
+    if type_ == "object":
+        sample = {key: build_sample(root, subschema) for key, subschema in node.get("properties", {}).items()}
+        # required keys without property schema accept any value
+        sample.update((key, "text") for key in node.get("required", []) if key not in sample)
+        return sample
+    if type_ == "array":
+        return [build_sample(root, node.get("items", {"type": "string"})) for _ in range(2)]
+    if type_ == "string":
+        return {"uuid": "3f1c5d0e-1c7b-4a55-9b3c-7f6a9d1e2b4c", "date-time": "2022-05-15 09:58:00"}.get(
+            node.get("format"), "text"
+        )
+    return SAMPLE_VALUES[type_]
+
+
+def iter_mutations(root: Dict, node: Dict, value: Any) -> Iterator[Any]:
+    """Yields copies of the value with one nested value replaced or one required key dropped"""
+    node = resolve(root, node)
+    yield from REPLACEMENTS
+
+    if isinstance(value, dict):
+        for key in node.get("required", []):
+            yield {name: item for name, item in value.items() if name != key}
+        for key, subschema in node.get("properties", {}).items():
+            if key in value:
+                for mutation in iter_mutations(root, subschema, value[key]):
+                    yield {**value, key: mutation}
+    if isinstance(value, list) and value and isinstance(node.get("items"), dict):
+        for mutation in iter_mutations(root, node["items"], value[-1]):
+            yield [*value[:-1], mutation]
+
+
+class CompiledValidatorConformanceTest(TestCase):
+    def test_schema_tree_is_not_empty(self):
+        self.assertTrue(list(SCHEMA_ROOT.glob("*/*/*.json")))
+
+    def test_compiled_validators_agree_with_jsonschema(self):
+        for schema_path in sorted(SCHEMA_ROOT.glob("*/*/*.json")):
+            self.assert_conformance(str(schema_path.relative_to(SCHEMA_ROOT)), get_schema(str(schema_path)))
+
+    def test_nodes_without_checks_are_compiled(self):
+        for name, schema in INLINE_SCHEMAS.items():
+            self.assert_conformance(name, schema, expect_invalid=schema.get("type") is not None)
+
+    def assert_conformance(self, name: str, schema: Dict, expect_invalid: bool = True):
+        compiled_validator = compile_schema(schema)
+        reference_validator = get_validator_class(schema["$schema"])(schema)
+        sample = build_sample(schema, schema)
+
+        with self.subTest(schema=name, sample="valid"):
+            self.assertTrue(reference_validator.is_valid(sample))
+            self.assertTrue(compiled_validator(sample))
+
+        invalid_count = 0
+        for mutation in iter_mutations(schema, schema, sample):
+            is_valid = reference_validator.is_valid(mutation)
+            invalid_count += not is_valid
+            with self.subTest(schema=name, sample=mutation):
+                self.assertEqual(compiled_validator(mutation), is_valid)
+
+        if expect_invalid:
+            with self.subTest(schema=name, sample="invalid"):
+                self.assertGreater(invalid_count, 0)
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
 
+from common_lib.sqlite import install_sqlite_profile
+
 
 class TaskConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'task'
+
+    def ready(self):
+        install_sqlite_profile()
@@ -24,7 +24,7 @@ def handle_auth_account_created(event: Dict):
 def handle_auth_account_updated(event: Dict):
     event["data"].pop("id", None)
     role = event["data"].get('position') or 'worker'
-    public_id = event["data"].get('public_id') or 'test_id'  # TODO: make sure we receive public_id in the event
+    public_id = event["data"]["public_id"]
     django_user = {
         "email": event["data"]["email"],
         "username": event["data"]["email"],
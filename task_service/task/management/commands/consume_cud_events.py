@@ -1,9 +1,6 @@
-import json
-import logging
-from typing import Dict
-
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import close_old_connections
 
 from task import controllers
 from common_lib.offset_manager import OffsetLogManager
@@ -14,16 +11,19 @@ from common_lib.cud_event_manager import EventManager, FailedEventManager, Servi
 class Command(BaseCommand):
     help = "Consumes cud events from common message broker"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Amount of worker threads handling events, events of the same entity are handled in order. "
+            "0 handles events in the message broker connection thread",
+        )
+
     def handle(self, *args, **options):
         auth_service_exchange = settings.AUTH_ACCOUNT_EXCHANGE_NAME
         task_queue = settings.AUTH_ACCOUNT_TASK_QUEUE
 
-        # define rabbit queues to consume from
-        consumers = [
-            ConsumerConfig(queue=task_queue, exchange=auth_service_exchange, callback=self.handle_rabbitmq_message),
-        ]
-        self.rmq_client = RabbitMQMultiConsumer(consumers=consumers, dsn=settings.RABBITMQ_DSN)
-
         event_router = {
             "account_created": controllers.handle_auth_account_created,
             "account_updated": controllers.handle_auth_account_updated,
@@ -34,10 +34,6 @@ class Command(BaseCommand):
             error_collection_name=settings.MONGO_ERROR_COLLECTION,
         )
         self.service_name = ServiceName.TASK_SERVICE
-        self.failed_events_manager.process_failed_events_by_consumer(
-            service_name=self.service_name,
-            event_router=event_router,
-        )
         offset_manager = OffsetLogManager.build(
             mongo_dsn=settings.MONGO_DSN,
             db_name=settings.MONGO_DB_NAME,
@@ -51,20 +47,24 @@ class Command(BaseCommand):
             service_name=self.service_name,
             failed_event_manager=self.failed_events_manager,
             offset_manager=offset_manager,
+            # long running process doesn't get request signals which recycle db connections
+            before_consume=close_old_connections,
         )
-        self.rmq_client.listen()
 
-    def handle_rabbitmq_message(self, ch, method, properties, body: bytes):
-        try:
-            event = json.loads(body)
-            if not isinstance(event, Dict) or not event:
-                logging.warning("Unexpected json type received")
-                return
-
-            self.event_manager.consume_event(event)
+        # define rabbit queues to consume from
+        consumers = [
+            ConsumerConfig(queue=task_queue, exchange=auth_service_exchange, callback=self.event_manager.handle_message),
+        ]
+        self.rmq_client = RabbitMQMultiConsumer(consumers=consumers, dsn=settings.RABBITMQ_DSN, workers=options["workers"])
 
-        except json.decoder.JSONDecodeError as e:
-            logging.error(f"Bad json data receieved: {e=}, {e.doc=}")
-        except Exception:
-            logging.exception("trace")
-            self.stderr.write(self.style.ERROR(f"Un ack message: {body}"))
+        # failed events backlog is replayed alongside live consumption instead of delaying the start
+        self.failed_events_manager.start_background_reprocessing(
+            service_name=self.service_name,
+            event_router=event_router,
+        )
+        try:
+            self.rmq_client.listen()
+        finally:
+            self.failed_events_manager.stop_background_reprocessing()
+            # store offset which wasn't checkpointed yet
+            offset_manager.close()
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tasktrackeruser',
+            name='public_id',
+            field=models.CharField(db_index=True, max_length=250),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['created_at'], name='task_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'id'], name='task_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0002_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assignee', 'id'], name='task_assignee_id_idx'),
+        ),
+    ]
@@ -18,7 +18,7 @@ class BaseEntity:
 
 
 class TaskTrackerUser(User):
-    public_id = models.CharField(max_length=250)
+    public_id = models.CharField(max_length=250, db_index=True)
     role = models.CharField(max_length=250)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -67,3 +67,12 @@ class Task(BaseModel):
     fee_on_assign = models.DecimalField(max_digits=15, decimal_places=10)
     fee_on_complete = models.DecimalField(max_digits=15, decimal_places=10)
     jira_id = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="task_created_at_idx"),
+            # shuffle reads new tasks in id order
+            models.Index(fields=["status", "id"], name="task_status_id_idx"),
+            # assignee's tasks list is paginated in id order
+            models.Index(fields=["assignee", "id"], name="task_assignee_id_idx"),
+        ]
@@ -1,3 +1,179 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from typing import Dict, List
 
-# Create your tests here.
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from common_lib import clients
+from common_lib.outbox.models import OutboxEvent
+from common_lib.outbox.outbox import Outbox, OutboxRelay
+from task.models import Task, TaskStatus, TaskTrackerUser
+from task.views import get_task, list_tasks, shuffle_tasks
+
+
+class FakeConfirmation:
+    def __init__(self, acked: List[bool]) -> None:
+        self.acked = acked
+
+    def wait(self, timeout=None) -> List[bool]:
+        return self.acked
+
+
+class FakePublisher:
+    """Acks events except the ones listed in `nacked_numbers`, checks relay doesn't publish inside its transaction"""
+
+    def __init__(self, nacked_numbers=()) -> None:
+        self.nacked_numbers = set(nacked_numbers)
+        self.published: List[Dict] = []
+        # test case runs in transaction of its own
+        self.test_savepoints_count = len(connection.savepoint_ids)
+
+    def publish_confirmed(self, bodies: List[Dict]) -> FakeConfirmation:
+        assert len(connection.savepoint_ids) == self.test_savepoints_count, "published inside transaction"
+        self.published.extend(bodies)
+        return FakeConfirmation([body["number"] not in self.nacked_numbers for body in bodies])
+
+    def discard(self, confirmation):
+        pass
+
+    def close(self):
+        pass
+
+
+class OutboxRelayTest(TestCase):
+    def tearDown(self):
+        clients._publishers.pop(("amqp://localhost", "tasks"), None)
+
+    def build_relay(self, publisher: FakePublisher) -> OutboxRelay:
+        # relay publishes through process wide publisher of the exchange
+        clients._publishers["amqp://localhost", "tasks"] = publisher
+        return OutboxRelay(dsn="amqp://localhost", batch_size=10)
+
+    def test_events_from_first_not_confirmed_one_are_relayed_again_in_order(self):
+        Outbox(exchange_name="tasks").add_many({"number": number} for number in range(4))
+        publisher = FakePublisher(nacked_numbers={1})
+
+        self.assertEqual(self.build_relay(publisher).relay_batch(), 1)
+
+        self.assertEqual([body["number"] for body in publisher.published], [0, 1, 2, 3])
+        events = OutboxEvent.objects.order_by("id")
+        self.assertEqual([(event.body["number"], event.claimed_until) for event in events], [(1, None), (2, None), (3, None)])
+
+        # confirmed event 2 isn't deleted: it's relayed again after event 1
+        publisher.nacked_numbers.clear()
+        publisher.published.clear()
+        self.assertEqual(self.build_relay(publisher).relay_batch(), 3)
+        self.assertEqual([body["number"] for body in publisher.published], [1, 2, 3])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relays_share_process_publisher_until_closed(self):
+        Outbox(exchange_name="tasks").add_many({"number": number} for number in range(2))
+        publisher = FakePublisher()
+        relay = self.build_relay(publisher)
+        other_relay = OutboxRelay(dsn="amqp://localhost", batch_size=1)
+
+        self.assertEqual(other_relay.relay_batch() + relay.relay_batch(), 2)
+        self.assertEqual(publisher.published, [{"number": 0}, {"number": 1}])
+
+        # failed relay drops the publisher, so the next batch connects again
+        relay.close()
+        self.assertNotIn(("amqp://localhost", "tasks"), clients._publishers)
+
+    def test_claimed_events_are_skipped_until_claim_expires(self):
+        Outbox(exchange_name="tasks").add_many({"number": number} for number in range(2))
+        OutboxEvent.objects.filter(body__number=0).update(claimed_until=timezone.now() + timedelta(minutes=1))
+        OutboxEvent.objects.filter(body__number=1).update(claimed_until=timezone.now() - timedelta(minutes=1))
+        publisher = FakePublisher()
+
+        self.assertEqual(self.build_relay(publisher).relay_batch(), 1)
+
+        self.assertEqual(publisher.published, [{"number": 1}])
+
+
+class ShuffleTasksTest(TestCase):
+    def setUp(self):
+        self.worker = TaskTrackerUser.objects.create(username="worker", public_id="worker", role="worker")
+        for number, status in enumerate(["new", "completed", "new", "new", "new", "completed", "new"]):
+            Task.objects.create(
+                title=f"task {number}",
+                status=status,
+                assignee=self.worker,
+                fee_on_assign=-10,
+                fee_on_complete=20,
+            )
+
+    @override_settings(SHUFFLE_CHUNK_SIZE=2)
+    def test_every_new_task_is_shuffled_once(self):
+        response = shuffle_tasks(RequestFactory().post("/"))
+
+        self.assertEqual(response.status_code, 200)
+        new_tasks_count = Task.objects.filter(status=TaskStatus.NEW.value).count()
+        self.assertEqual(json.loads(response.content), {"status": "shuffled", "tasks_count": 5, "events_count": 3})
+        shuffled_ids = [task["id"] for event in OutboxEvent.objects.order_by("id") for task in event.body["data"]["tasks"]]
+        self.assertEqual(len(set(shuffled_ids)), new_tasks_count)
+
+
+class ListTasksTest(TestCase):
+    def setUp(self):
+        workers = [
+            TaskTrackerUser.objects.create(username=f"worker {number}", public_id=f"worker-{number}", role="worker")
+            for number in range(3)
+        ]
+        self.task_ids = [
+            Task.objects.create(
+                title=f"task {number}", status="new", assignee=worker, fee_on_assign=-10, fee_on_complete=20
+            ).id
+            for number, worker in enumerate(workers)
+        ]
+
+    def get(self, **params):
+        return list_tasks(RequestFactory().get("/", params))
+
+    def read_all_pages(self, limit: str):
+        task_ids, cursor = [], None
+        while True:
+            response = self.get(limit=limit, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.content)
+            task_ids.extend(task["id"] for task in page["tasks"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return task_ids
+
+    def test_pages_dont_skip_tasks(self):
+        for limit in ("0", "-1", "1", "2", "1000"):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.read_all_pages(limit), self.task_ids)
+
+    def test_invalid_params(self):
+        for params in ({"limit": "x"}, {"cursor": "x"}, {"cursor": "-1"}, {"limit": "1.5"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+    @override_settings(TASKS_EXPORT_CHUNK_SIZE=2)
+    def test_stream_returns_the_same_tasks_as_pages(self):
+        Task.objects.filter(id=self.task_ids[0]).update(status=TaskStatus.COMPLETED.value)
+        tasks = json.loads(self.get(limit="1000").content)["tasks"]
+
+        for params, expected_tasks in (
+            ({}, tasks),
+            ({"status": TaskStatus.NEW.value}, tasks[1:]),
+            ({"assignee": "nobody"}, []),
+        ):
+            with self.subTest(params=params):
+                response = self.get(stream="1", **params)
+                self.assertIsInstance(response, StreamingHttpResponse)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertEqual(json.loads(b"".join(response.streaming_content)), expected_tasks)
+
+    def test_assignees_are_fetched_with_tasks(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(len(json.loads(self.get(limit="1000").content)["tasks"]), len(self.task_ids))
+        with override_settings(TASKS_EXPORT_CHUNK_SIZE=2), self.assertNumQueries(2):  # chunk per query
+            self.assertEqual(len(json.loads(b"".join(self.get(stream="1").streaming_content))), len(self.task_ids))
+        with self.assertNumQueries(1):
+            task = json.loads(get_task(RequestFactory().get("/"), task_id=self.task_ids[0]).content)
+        self.assertEqual(task["assignee"], "worker-0")
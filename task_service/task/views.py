@@ -1,18 +1,22 @@
 import json
 import random
 import logging
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 from dataclasses import asdict
-from django.http import HttpRequest, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 
 from django.views.decorators.http import require_http_methods
 from django.db import transaction
 from django.conf import settings
 
 from common_lib.access_control import requires_scope
+from common_lib.pagination import InvalidPageParams, parse_page_params
 from task.models import Task, TaskDTO, TaskStatus
 from common_lib.cud_event_manager import EventManager, FailedEventManager, ServiceName
-from common_lib.rabbit import RabbitMQPublisher
+from common_lib.outbox.outbox import Outbox
 from task.models import TaskTrackerUser
 from task.event_models import TaskCreatedEvent, TasksAssignedEvent, TaskCompletedEvent
 
@@ -28,7 +32,9 @@ failed_event_manager = FailedEventManager.build(
     error_collection_name=settings.MONGO_ERROR_COLLECTION,
 )
 event_manager = EventManager(
-    mq_publisher=RabbitMQPublisher(exchange_name=settings.TASKS_EXCHANGE_NAME, dsn=settings.RABBITMQ_DSN),
+    mq_publisher=None,
+    # events are published by `relay_outbox_events` command after the transaction commits
+    outbox=Outbox(exchange_name=settings.TASKS_EXCHANGE_NAME),
     schema_basedir=settings.EVENT_SCHEMA_DIR,
     service_name=ServiceName.TASK_SERVICE,
     failed_event_manager=failed_event_manager,
@@ -52,13 +58,87 @@ def serialize_task(task: Task) -> Dict:
     return asdict(dto)
 
 
+def get_tasks_queryset() -> QuerySet:
+    """Reads tasks with assignee's public id in the same query, as `serialize_task` needs"""
+    return Task.objects.select_related("assignee").only(
+        "id",
+        "created_at",
+        "updated_at",
+        "title",
+        "description",
+        "status",
+        "fee_on_assign",
+        "fee_on_complete",
+        "jira_id",
+        "assignee__public_id",
+    )
+
+
+def get_tasks_page(queryset: QuerySet, cursor: Optional[int], limit: int) -> Tuple[List[Task], Optional[int]]:
+    """Provides page of tasks ordered by snowflake id, cursor is id of the last task from previous page"""
+    if cursor:
+        queryset = queryset.filter(id__gt=cursor)
+    page = list(queryset.order_by("id")[: limit + 1])
+    next_cursor = page[limit - 1].id if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def stream_tasks(queryset: QuerySet, chunk_size: int) -> Iterator[str]:
+    """Yields all tasks as JSON array, reading them by keyset pages of `chunk_size`"""
+    yield "["
+    cursor, separator = None, ""
+    while True:
+        page, cursor = get_tasks_page(queryset, cursor=cursor, limit=chunk_size)
+        if page:
+            yield separator + ",".join(json.dumps(serialize_task(task), cls=DjangoJSONEncoder) for task in page)
+            separator = ","
+        if cursor is None:
+            break
+    yield "]"
+
+
 @requires_scope("admin manager worker")
 @require_http_methods(["GET"])
 def get_task(request: HttpRequest, task_id: int):
-    task = Task.objects.get(id=task_id)
+    task = get_tasks_queryset().get(id=task_id)
     return JsonResponse(data=serialize_task(task))
 
 
+@requires_scope("admin manager worker")
+@require_http_methods(["GET"])
+def list_tasks(request: HttpRequest):
+    """Provides tasks page using `cursor` and `limit` query params, `assignee` and `status` params filter tasks.
+
+    With `stream=1` all matching tasks are returned as streamed JSON array instead, e.g. for exports.
+    """
+    queryset = get_tasks_queryset()
+    if assignee := request.GET.get("assignee"):
+        queryset = queryset.filter(assignee__public_id=assignee)
+    if status := request.GET.get("status"):
+        if status not in {item.value for item in TaskStatus}:
+            return JsonResponse({"message": f"Unknown task status: {status}"}, status=400)
+        queryset = queryset.filter(status=status)
+
+    if request.GET.get("stream") == "1":
+        return StreamingHttpResponse(
+            stream_tasks(queryset, chunk_size=settings.TASKS_EXPORT_CHUNK_SIZE), content_type="application/json"
+        )
+
+    try:
+        cursor, limit = parse_page_params(
+            request.GET, default_limit=settings.TASKS_PAGE_SIZE, max_limit=settings.TASKS_MAX_PAGE_SIZE
+        )
+    except InvalidPageParams as e:
+        return JsonResponse({"message": str(e)}, status=400)
+    page, next_cursor = get_tasks_page(queryset, cursor=cursor, limit=limit)
+    return JsonResponse(
+        data={
+            "tasks": [serialize_task(task) for task in page],
+            "next_cursor": next_cursor and str(next_cursor),
+        }
+    )
+
+
 @requires_scope("admin manager worker")
 @require_http_methods(["POST"])
 def add_task(request: HttpRequest):
@@ -69,9 +149,10 @@ def add_task(request: HttpRequest):
     body["assignee"] = TaskTrackerUser.objects.get(public_id=body["assignee"])
 
     # TODO: check that user not manager/admin
-    task = Task.objects.create(**body)
-    response_data = serialize_task(task)
-    event_manager.send_event(event=TaskCreatedEvent(data=response_data))
+    with transaction.atomic():
+        task = Task.objects.create(**body)
+        response_data = serialize_task(task)
+        event_manager.send_event(event=TaskCreatedEvent(data=response_data))
     return JsonResponse(data=response_data)
 
 
@@ -81,10 +162,11 @@ def update_task(request: HttpRequest):
     """Is used by seeting complete status"""
     body = json.loads(request.body)
     id_ = body["id"]
-    Task.objects.filter(id=id_).update(**body)
-    if body["status"] == "completed":
-        data = {"id": id_, "status": "completed"}
-        event_manager.send_event(event=TaskCompletedEvent(data=data))
+    with transaction.atomic():
+        Task.objects.filter(id=id_).update(**body)
+        if body["status"] == "completed":
+            data = {"id": id_, "status": "completed"}
+            event_manager.send_event(event=TaskCompletedEvent(data=data))
     return JsonResponse(data={"status": "updated"})
 
 
@@ -93,32 +175,55 @@ def update_task(request: HttpRequest):
 def shuffle_tasks(request: HttpRequest):
     """Randomly shuffles not completed tasks across all users.
 
-    Note: probably has distribution transaction issue, need to redesign and fix that
+    Tasks are walked in primary key pages of `SHUFFLE_CHUNK_SIZE`: each page is locked, reassigned and
+    published as separate `TasksAssignedEvent` in its own transaction, so lock time and memory depend on
+    the page size rather than on the whole backlog. Events are written to outbox in the page transaction.
+    Tasks locked by concurrent transactions(e.g. being completed) are waited for rather than skipped: the cursor
+    moves past the whole page, so a skipped task would never be shuffled. Once the lock is released, the task is
+    shuffled only if it's still not completed.
     """
-
-    tasks = []
-    # TODO: think how to do random choise not in all-in-memory
-    with transaction.atomic():
-        task_queryset = Task.objects.select_for_update().filter(status=TaskStatus.NEW.value)
-        users = list(TaskTrackerUser.objects.filter(role="worker"))
-        for task in task_queryset:
-
-            task_user = random.choice(users)
-            previous_user_id = task.assignee.public_id
-            task.assignee = task_user
-            task.save()
-
-            task_item = {
-                "id": task.id,
-                "new_assignee": task_user.public_id,
-                "previous_assignee": previous_user_id,
-                "fee_on_assign": float(task.fee_on_assign),
-                "fee_on_complete": float(task.fee_on_complete),
-            }
-            tasks.append(task_item)
-            logger.debug(f"new {task.assignee=} in {task=} due to shuffle operation. previous {previous_user_id}")
-
-    event = TasksAssignedEvent(data={"tasks": tasks})
-    event_manager.send_event(event=event)
-
-    return JsonResponse(data={"status": "shuffled", "tasks": tasks})
+    chunk_size = settings.SHUFFLE_CHUNK_SIZE
+    workers = list(TaskTrackerUser.objects.filter(role="worker").values_list("id", "public_id"))
+    if not workers:
+        return JsonResponse(data={"status": "shuffled", "tasks_count": 0, "events_count": 0})
+
+    last_task_id = 0
+    tasks_count = events_count = 0
+    while True:
+        tasks = []
+        with transaction.atomic():
+            page = list(
+                Task.objects.select_for_update(of=("self",))
+                .filter(status=TaskStatus.NEW.value, id__gt=last_task_id)
+                .select_related("assignee")
+                .only("id", "updated_at", "fee_on_assign", "fee_on_complete", "assignee__public_id")
+                .order_by("id")[:chunk_size]
+            )
+            if not page:
+                break
+
+            now = timezone.now()
+            for task in page:
+                task_user_id, task_user_public_id = random.choice(workers)
+                previous_user_id = task.assignee.public_id
+                task.assignee_id = task_user_id
+                task.updated_at = now
+
+                task_item = {
+                    "id": task.id,
+                    "new_assignee": task_user_public_id,
+                    "previous_assignee": previous_user_id,
+                    "fee_on_assign": float(task.fee_on_assign),
+                    "fee_on_complete": float(task.fee_on_complete),
+                }
+                tasks.append(task_item)
+                logger.debug(f"new {task_user_public_id=} in {task.id=} due to shuffle operation. previous {previous_user_id}")
+
+            Task.objects.bulk_update(page, ["assignee", "updated_at"])
+            last_task_id = page[-1].id
+            event_manager.send_event(event=TasksAssignedEvent(data={"tasks": tasks}))
+
+        tasks_count += len(tasks)
+        events_count += 1
+
+    return JsonResponse(data={"status": "shuffled", "tasks_count": tasks_count, "events_count": events_count})
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 from pathlib import Path
 import os
 
+from common_lib.db import get_databases, get_sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "task",
+    "common_lib.outbox",
 ]
 
 MIDDLEWARE = [
@@ -74,14 +77,11 @@ WSGI_APPLICATION = "task_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-# TODO: add psql
-SQLITE_DB_PATH = os.environ["SQLITE_DB_PATH"]
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": SQLITE_DB_PATH,
-    }
-}
+# postgres is used once POSTGRES_DB is set, sqlite otherwise, see common_lib/db.py
+DATABASES = get_databases()
+
+# opt-in sqlite profile applied to each new connection, see common_lib/sqlite
+SQLITE_PRAGMAS = get_sqlite_pragmas()
 
 
 # Password validation
@@ -167,6 +167,12 @@ LOGGING = {
 }
 EVENT_SCHEMA_DIR = os.environ.get("EVENT_SCHEMA_DIR", BASE_DIR.parent / "common_lib")
 COMPANY_SLUG = "UberPopug Inc."
+SHUFFLE_CHUNK_SIZE = int(os.getenv("SHUFFLE_CHUNK_SIZE", 500))
+TASKS_PAGE_SIZE = 100
+TASKS_MAX_PAGE_SIZE = 1000
+TASKS_EXPORT_CHUNK_SIZE = int(os.getenv("TASKS_EXPORT_CHUNK_SIZE", 1000))
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", 500))
+OUTBOX_RELAY_POLL_INTERVAL = float(os.getenv("OUTBOX_RELAY_POLL_INTERVAL", 0.5))
 TASKS_EXCHANGE_NAME = "tasks-stream"
 AUTH_ACCOUNT_EXCHANGE_NAME = "accounts-stream"
 AUTH_ACCOUNT_TASK_QUEUE = "accounts-stream-to-task-service"
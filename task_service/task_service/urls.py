@@ -24,6 +24,7 @@ urlpatterns = [
     path('login/', views.redirect_to_login),
     
     path('task/<int:task_id>', task_views.get_task),
+    path('tasks/', task_views.list_tasks),
     # TODO: rest naming
     path('add_task/', task_views.add_task),
     path('update_task/', task_views.update_task),